@@ -6,7 +6,7 @@
 
 """Subclasses portage.dep.Atom to provide methods on a Gentoo atom string."""
 
-__all__ = ("Atom",)
+__all__ = ("Atom", "intern_atom")
 
 # =======
 # Imports
@@ -16,7 +16,7 @@ import weakref
 
 import portage
 
-from gentoolkit.cpv import CPV
+from gentoolkit.cpv import BaseCPV, version_sort_key
 from gentoolkit.versionmatch import VersionMatch
 from gentoolkit import errors
 
@@ -25,7 +25,7 @@ from gentoolkit import errors
 # =======
 
 
-class Atom(portage.dep.Atom, CPV):
+class Atom(portage.dep.Atom, BaseCPV):
     """Portage's Atom class with improvements from pkgcore.
 
     portage.dep.Atom provides the following instance variables:
@@ -43,6 +43,9 @@ class Atom(portage.dep.Atom, CPV):
     # Necessary for Portage versions < 2.1.7
     _atoms = weakref.WeakValueDictionary()
 
+    # Fields intersects() looks at, see _intersect_key()
+    _intersect_key = None
+
     def __init__(self, atom):
         self.atom = atom
         self.operator = self.blocker = self.use = self.slot = None
@@ -56,7 +59,7 @@ class Atom(portage.dep.Atom, CPV):
         if self.operator is None:
             self.operator = ""
 
-        CPV.__init__(self, self.cpv)
+        BaseCPV.__init__(self, self.cpv)
 
         # use_conditional is USE flag condition for this Atom to be required:
         # For: !build? ( >=sys-apps/sed-4.0.5 ), use_conditional = '!build'
@@ -70,7 +73,7 @@ class Atom(portage.dep.Atom, CPV):
         if self.operator != other.operator:
             return False
 
-        if not CPV.__eq__(self, other):
+        if not BaseCPV.__eq__(self, other):
             return False
 
         if bool(self.blocker) != bool(other.blocker):
@@ -118,8 +121,8 @@ class Atom(portage.dep.Atom, CPV):
         if self.operator != other.operator:
             return self.operator < other.operator
 
-        if not CPV.__eq__(self, other):
-            return CPV.__lt__(self, other)
+        if not BaseCPV.__eq__(self, other):
+            return BaseCPV.__lt__(self, other)
 
         if bool(self.blocker) != bool(other.blocker):
             # We want non blockers, then blockers, so only return True
@@ -204,21 +207,29 @@ class Atom(portage.dep.Atom, CPV):
         @param other: other package to compare
         @see: L{pkgcore.ebuild.atom}
         """
+        this = self._intersect_key
+        if this is None:
+            this = self._intersect_key = _intersect_key(self)
+        that = getattr(other, "_intersect_key", None)
+        if that is None:
+            that = _intersect_key(other)
+            if hasattr(type(other), "_intersect_key"):
+                # Atoms and queries keep theirs for the next comparison
+                other._intersect_key = that
+
         # Our "cp" (cat/pkg) must match exactly:
-        if self.cp != other.cp:
+        if this[1] != that[1]:
             # Check to see if one is name only:
             # We don't bother checking if self.category is None: it can't be
             # because we're an Atom subclass and that would be invalid.
-            return not other.category and self.name == other.name
+            return not that[0] and this[2] == that[2]
 
         # Slot dep only matters if we both have one. If we do they
         # must be identical:
-        this_slot = getattr(self, "slot", None)
-        that_slot = getattr(other, "slot", None)
-        if this_slot is not None and that_slot is not None and this_slot != that_slot:
+        if this[3] is not None and that[3] is not None and this[3] != that[3]:
             return False
 
-        if self.repo is not None and other.repo is not None and self.repo != other.repo:
+        if this[4] is not None and that[4] is not None and this[4] != that[4]:
             return False
 
         # Use deps are similar: if one of us forces a flag on and the
@@ -226,11 +237,9 @@ class Atom(portage.dep.Atom, CPV):
         # cares about a flag it is irrelevant.
 
         # Skip the (very common) case of one of us not having use deps:
-        this_use = getattr(self, "use", None)
-        that_use = getattr(other, "use", None)
-        if this_use and that_use:
+        if this[5] and that[5]:
             # Set of flags we do not have in common:
-            flags = set(this_use.tokens) ^ set(that_use.tokens)
+            flags = this[5] ^ that[5]
             for flag in flags:
                 # If this is unset and we also have the set version we fail:
                 if flag[0] == "-" and flag[1:] in flags:
@@ -239,93 +248,90 @@ class Atom(portage.dep.Atom, CPV):
         # Remaining thing to check is version restrictions. Get the
         # ones we can check without actual version comparisons out of
         # the way first.
+        this_op, this_ver, this_rev, this_fullver = this[6:]
+        that_op, that_ver, that_rev, that_fullver = that[6:]
 
         # If one of us is unversioned we intersect:
-        if not self.operator or not other.operator:
+        if not this_op or not that_op:
             return True
 
         # If we are both "unbounded" in the same direction we intersect:
-        if ("<" in self.operator and "<" in other.operator) or (
-            ">" in self.operator and ">" in other.operator
-        ):
+        if ("<" in this_op and "<" in that_op) or (">" in this_op and ">" in that_op):
             return True
 
         # If one of us is an exact match we intersect if the other matches it:
-        if self.operator == "=":
-            if other.operator == "=*":
-                return self.fullversion.startswith(other.fullversion)
-            return VersionMatch(other, op=other.operator).match(self)
-        if other.operator == "=":
-            if self.operator == "=*":
-                return other.fullversion.startswith(self.fullversion)
-            return VersionMatch(self, op=self.operator).match(other)
+        if this_op == "=":
+            if that_op == "=*":
+                return this_fullver.startswith(that_fullver)
+            return _version_match(that, this)
+        if that_op == "=":
+            if this_op == "=*":
+                return that_fullver.startswith(this_fullver)
+            return _version_match(this, that)
 
         # If we are both ~ matches we match if we are identical:
-        if self.operator == other.operator == "~":
-            return self.version == other.version and self.revision == other.revision
+        if this_op == that_op == "~":
+            return this_ver == that_ver and this_rev == that_rev
 
         # If we are both glob matches we match if one of us matches the other.
-        if self.operator == other.operator == "=*":
-            return self.fullversion.startswith(
-                other.fullversion
-            ) or other.fullversion.startswith(self.fullversion)
+        if this_op == that_op == "=*":
+            return this_fullver.startswith(that_fullver) or that_fullver.startswith(
+                this_fullver
+            )
 
         # If one of us is a glob match and the other a ~ we match if the glob
         # matches the ~ (ignoring a revision on the glob):
-        if self.operator == "=*" and other.operator == "~":
-            return other.fullversion.startswith(self.version)
-        if other.operator == "=*" and self.operator == "~":
-            return self.fullversion.startswith(other.version)
+        if this_op == "=*" and that_op == "~":
+            return that_fullver.startswith(this_ver)
+        if that_op == "=*" and this_op == "~":
+            return this_fullver.startswith(that_ver)
 
         # If we get here at least one of us is a <, <=, > or >=:
-        if self.operator in ("<", "<=", ">", ">="):
-            ranged, ranged.operator = self, self.operator
+        if this_op in ("<", "<=", ">", ">="):
+            ranged, other = this, that
         else:
-            ranged, ranged.operator = other, other.operator
-            other, other.operator = self, self.operator
+            ranged, other = that, this
+        ranged_op = ranged[6]
+        other_op, other_ver, other_rev, other_fullver = other[6:]
 
-        if "<" in other.operator or ">" in other.operator:
+        if "<" in other_op or ">" in other_op:
             # We are both ranged, and in the opposite "direction" (or
             # we would have matched above). We intersect if we both
             # match the other's endpoint (just checking one endpoint
             # is not enough, it would give a false positive on <=2 vs >2)
-            return VersionMatch(other, op=other.operator).match(
-                ranged
-            ) and VersionMatch(ranged, op=ranged.operator).match(other)
+            return _version_match(other, ranged) and _version_match(ranged, other)
 
-        if other.operator == "~":
+        if other_op == "~":
             # Other definitely matches its own version. If ranged also
             # does we're done:
-            if VersionMatch(ranged, op=ranged.operator).match(other):
+            if _version_match(ranged, other):
                 return True
             # The only other case where we intersect is if ranged is a
             # > or >= on other's version and a nonzero revision. In
             # that case other will match ranged. Be careful not to
             # give a false positive for ~2 vs <2 here:
-            return ranged.operator in (">", ">=") and VersionMatch(
-                other, op=other.operator
-            ).match(ranged)
+            return ranged_op in (">", ">=") and _version_match(other, ranged)
 
-        if other.operator == "=*":
+        if other_op == "=*":
             # a glob match definitely matches its own version, so if
             # ranged does too we're done:
-            if VersionMatch(ranged, op=ranged.operator).match(other):
+            if _version_match(ranged, other):
                 return True
-            if "<" in ranged.operator:
+            if "<" in ranged_op:
                 # If other.revision is not defined then other does not
                 # match anything smaller than its own fullversion:
-                if other.revision:
+                if other_rev:
                     return False
 
                 # If other.revision is defined then we can always
                 # construct a package smaller than other.fullversion by
                 # tagging e.g. an _alpha1 on.
-                return ranged.fullversion.startswith(other.version)
+                return ranged[9].startswith(other_ver)
             else:
                 # Remaining cases where this intersects: there is a
                 # package greater than ranged.fullversion and
                 # other.fullversion that they both match.
-                return ranged.fullversion.startswith(other.version)
+                return ranged[9].startswith(other_ver)
 
         # Handled all possible ops.
         raise NotImplementedError(
@@ -339,4 +345,82 @@ class Atom(portage.dep.Atom, CPV):
         return f"{uc}{self.atom}"
 
 
+# =========
+# Functions
+# =========
+
+_interned = weakref.WeakValueDictionary()
+
+
+def intern_atom(atom, use_conditional=None):
+    """Return a shared L{Atom} for an atom string.
+
+    Atoms handed out here are shared by all callers asking for the same atom
+    and use_conditional and must not be modified.
+
+    Example usage:
+            >>> from gentoolkit.atom import intern_atom
+            >>> intern_atom('>=dev-libs/openssl-3:=') is intern_atom(
+            ...     '>=dev-libs/openssl-3:=')
+            True
+
+    @type atom: str
+    @param atom: e.g. '>=dev-libs/openssl-3:='
+    @type use_conditional: str or None
+    @param use_conditional: e.g. '!build'
+    @rtype: L{Atom}
+    @raise GentoolkitInvalidAtom: if atom is invalid
+    """
+
+    key = (atom, use_conditional)
+    try:
+        return _interned[key]
+    except KeyError:
+        pass
+    result = Atom(atom)
+    if use_conditional is not None:
+        result.use_conditional = use_conditional
+    _interned[key] = result
+    return result
+
+
+def _intersect_key(atom):
+    """Collect the fields L{Atom.intersects} compares.
+
+    @rtype: tuple
+    @return: (category, cp, name, slot, repo, frozenset of use tokens or
+            None, operator, version, revision, fullversion)
+    """
+
+    use = getattr(atom, "use", None)
+    return (
+        atom.category,
+        atom.cp,
+        atom.name,
+        getattr(atom, "slot", None),
+        getattr(atom, "repo", None),
+        frozenset(getattr(use, "tokens", use)) if use else None,
+        getattr(atom, "operator", None),
+        atom.version,
+        atom.revision,
+        atom.fullversion,
+    )
+
+
+def _version_match(restriction, pkg):
+    """Intersect key based VersionMatch(restriction).match(pkg)."""
+
+    operator = restriction[6]
+    if operator == "~":
+        # Revisions do not matter for ~
+        this, that = version_sort_key(restriction[7]), version_sort_key(pkg[7])
+        values = (0,)
+    else:
+        this, that = version_sort_key(restriction[9]), version_sort_key(pkg[9])
+        values = VersionMatch._convert_int2op[operator]
+    if this is None or that is None:
+        return False
+    return ((that > this) - (that < this)) in values
+
+
 # vim: set ts=4 sw=4 tw=79:
@@ -0,0 +1,176 @@
+# Copyright(c) 2026, Gentoo Authors
+#
+# Licensed under the GNU General Public License, v2
+
+"""Helpers for gentoolkit's persistent on-disk caches.
+
+Every cache is a single pickled file under L{get_cache_dir}. Consumers store
+whatever validation stamps they need (vdb state, file mtimes, ...) alongside
+their data and decide themselves whether a cache is still fresh.
+
+Example usage:
+    >>> from gentoolkit.cache import read_cache, write_cache
+    >>> write_cache('example', {'answer': 42})
+    True
+    >>> read_cache('example')
+    {'answer': 42}
+"""
+
+__all__ = (
+    "category_stamp",
+    "get_cache_dir",
+    "read_cache",
+    "write_cache",
+    "vdb_state",
+)
+__docformat__ = "epytext"
+
+# =======
+# Imports
+# =======
+
+import os
+import pickle
+import tempfile
+
+import portage
+from portage import _encodings, _unicode_encode
+from portage.const import VDB_PATH
+
+from gentoolkit.eprefix import EPREFIX
+
+# =======
+# Globals
+# =======
+
+# Bump this whenever the layout of any cache changes incompatibly.
+# 2: use-desc no longer holds local descriptions, see metadata-cache
+# 3: revdep-index stores its state along with the packages
+CACHE_VERSION = 3
+
+# =========
+# Functions
+# =========
+
+
+def get_cache_dir():
+    """Return the directory gentoolkit caches live in.
+
+    GENTOOLKIT_CACHE_DIR overrides the default, which is the system cache
+    directory for root and the XDG cache directory for everybody else.
+
+    @rtype: str
+    """
+
+    cache_dir = os.environ.get("GENTOOLKIT_CACHE_DIR")
+    if cache_dir:
+        return cache_dir
+    if os.getuid():
+        xdg_cache = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+        return os.path.join(xdg_cache, "gentoolkit")
+    return EPREFIX + "/var/cache/gentoolkit"
+
+
+def read_cache(name):
+    """Load the cache called name.
+
+    @type name: str
+    @param name: file name of the cache inside L{get_cache_dir}
+    @rtype: object or None
+    @return: the stored object, or None if the cache does not exist, is
+            unreadable or was written by an incompatible gentoolkit
+    """
+
+    path = os.path.join(get_cache_dir(), name)
+    try:
+        with open(_unicode_encode(path, encoding=_encodings["fs"]), "rb") as f:
+            version, data = pickle.load(f)
+    except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+        return None
+    if version != CACHE_VERSION:
+        return None
+    return data
+
+
+def write_cache(name, data):
+    """Atomically store data as the cache called name.
+
+    Failing to write a cache is never fatal, the caller simply runs uncached.
+
+    @type name: str
+    @param name: file name of the cache inside L{get_cache_dir}
+    @type data: object
+    @param data: any picklable object
+    @rtype: bool
+    @return: True if the cache was written
+    """
+
+    cache_dir = get_cache_dir()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".%s." % name, dir=cache_dir)
+    except OSError:
+        return False
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump((CACHE_VERSION, data), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, os.path.join(cache_dir, name))
+    except (OSError, pickle.PicklingError):
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def vdb_state():
+    """Return a stamp that changes whenever a package is merged or unmerged.
+
+    Portage bumps the mtime of the vdb directory before and after every
+    modification (bug #290428) and increments COUNTER for every merge.
+
+    @rtype: tuple
+    @return: (vdb mtime in ns, COUNTER)
+    """
+
+    vardb = portage.db[portage.root]["vartree"].dbapi
+    vdb_path = os.path.join(portage.settings["EROOT"], VDB_PATH)
+    try:
+        mtime = os.stat(
+            _unicode_encode(vdb_path, encoding=_encodings["fs"])
+        ).st_mtime_ns
+    except OSError:
+        mtime = 0
+    return (mtime, vardb.get_counter_tick_core())
+
+
+def category_stamp(portdb, category):
+    """Return the mtimes of the directories whose change affects category.
+
+    Metadata cache entries are replaced by renaming them into place, which
+    updates the mtime of their directory, and the category directory itself
+    changes when packages are added or removed.
+
+    @type portdb: L{portage.dbapi.porttree.portdbapi}
+    @type category: str
+    @rtype: tuple
+    """
+
+    stamp = []
+    for repo in portdb.porttrees:
+        for path in (
+            os.path.join(repo, "metadata", "md5-cache", category),
+            os.path.join(portdb.depcachedir, repo.lstrip(os.sep), category),
+            os.path.join(repo, category),
+        ):
+            try:
+                st = os.stat(_unicode_encode(path, encoding=_encodings["fs"]))
+            except OSError:
+                stamp.append(None)
+            else:
+                stamp.append(st.st_mtime_ns)
+    return tuple(stamp)
+
+
+# vim: set ts=4 sw=4 tw=79:
@@ -0,0 +1,267 @@
+# Copyright(c) 2026, Gentoo Authors
+#
+# Licensed under the GNU General Public License, v2
+
+"""Provides a persistent index of which installed package owns which path.
+
+Looking up the owner of a file normally means parsing every CONTENTS file in
+the vdb. L{ContentsIndex} does that once, stores the result in gentoolkit's
+cache directory and afterwards only re-reads the CONTENTS of packages that
+were merged or unmerged since.
+
+Example usage:
+    >>> from gentoolkit.contents import ContentsIndex
+    >>> index = ContentsIndex.load()
+    >>> index.owners('/bin/grep')
+    ['sys-apps/grep-3.11']
+    >>> index.entry('sys-apps/grep-3.11', '/bin/grep')
+    ['obj', '1700000000', '3c6bcf2d8d6c3e8fbeac7fa7e4a9a0d1']
+"""
+
+__all__ = ("ContentsIndex",)
+__docformat__ = "epytext"
+
+# =======
+# Imports
+# =======
+
+import zlib
+
+import portage
+
+from gentoolkit.cache import read_cache, write_cache, vdb_state
+
+# =======
+# Globals
+# =======
+
+# Number of files the path map is split into
+PATH_SHARDS = 64
+
+# =======
+# Classes
+# =======
+
+
+class ContentsIndex:
+    """Maps every path in the vdb to the installed packages owning it.
+
+    The path map is stored in L{PATH_SHARDS} files by a hash of the path, so
+    looking up a few paths only reads the shards they are in. The parsed
+    CONTENTS of all packages are stored separately and only read when the
+    index has to be updated or a package's contents are asked for.
+
+    @type state: tuple
+    @ivar state: L{gentoolkit.cache.vdb_state} the index is valid for
+    @type packages: dict
+    @ivar packages: {cpv: (COUNTER, {path: [type, mtime, md5/target]})}
+            with paths in CONTENTS order and ROOT stripped, read on first use
+    """
+
+    cache_name = "contents-index"
+
+    def __init__(self, packages=None, state=None):
+        self.state = state
+        self._packages = packages
+        # The complete path map, once all packages had to be read
+        self._paths = None
+        # Path map shards read so far, {shard number: {path: owners}}
+        self._shards = {}
+        if packages is not None:
+            self._build_paths()
+
+    def __repr__(self):
+        return "<{} {}>".format(self.__class__.__name__, self.state)
+
+    @property
+    def packages(self):
+        if self._packages is None:
+            cached = read_cache(self.cache_name)
+            if cached is None or cached["state"] != self.state:
+                self._packages = {}
+                self._paths = {}
+                self.update(state=self.state)
+            else:
+                self._packages = cached["packages"]
+                self._build_paths()
+        return self._packages
+
+    @classmethod
+    def load(cls, save=True):
+        """Return an index matching the current state of the vdb.
+
+        A stored index is used as is if nothing was merged or unmerged since
+        it was written, without reading any of it yet. Otherwise it is
+        brought up to date incrementally.
+
+        @type save: bool
+        @param save: write the index back if it had to be updated
+        @rtype: L{ContentsIndex}
+        """
+
+        state = vdb_state()
+        if read_cache(cls._state_name()) == (state, PATH_SHARDS):
+            return cls(state=state)
+
+        cached = read_cache(cls.cache_name)
+        index = cls(cached["packages"] if cached is not None else {})
+        index.update(state=state)
+        if save:
+            index.save()
+        return index
+
+    def save(self):
+        """Store the index in the cache directory.
+
+        @rtype: bool
+        @return: True if the index was written
+        """
+
+        if self._paths is None:
+            # Nothing was read, so nothing can have changed
+            return False
+        if not write_cache(
+            self.cache_name, {"state": self.state, "packages": self.packages}
+        ):
+            return False
+        shards = [{} for _n in range(PATH_SHARDS)]
+        for path, owners in self._paths.items():
+            shards[_shard(path)][path] = owners
+        for n, shard in enumerate(shards):
+            if not write_cache(self._shard_name(n), shard):
+                return False
+        # Written last, an interrupted save leaves the shards unused
+        return write_cache(self._state_name(), (self.state, PATH_SHARDS))
+
+    def update(self, state=None):
+        """Synchronise the index with the vdb.
+
+        Packages whose COUNTER did not change are kept, new or reinstalled
+        packages have their CONTENTS parsed and unmerged ones are dropped.
+
+        @rtype: bool
+        @return: True if anything changed
+        """
+
+        # FIXME: Remove when lazyimport supports objects:
+        from gentoolkit.package import Package
+
+        packages = self.packages
+        vardb = portage.db[portage.root]["vartree"].dbapi
+        changed = False
+
+        installed = set(vardb.cpv_all())
+        for cpv in set(packages).difference(installed):
+            self._remove_package(cpv)
+            changed = True
+
+        for cpv in installed:
+            counter = vardb.cpv_counter(cpv)
+            known = packages.get(cpv)
+            if known is not None and known[0] == counter:
+                continue
+            if known is not None:
+                self._remove_package(cpv)
+            contents = Package(cpv).parsed_contents()
+            packages[cpv] = (counter, contents)
+            self._add_paths(cpv, contents)
+            changed = True
+
+        self.state = state if state is not None else vdb_state()
+        return changed
+
+    def owners(self, path):
+        """Return the cpvs of all installed packages owning path.
+
+        @type path: str
+        @param path: absolute path without ROOT
+        @rtype: list
+        """
+
+        return [cpv for cpv, _position in self.owner_positions(path)]
+
+    def owner_positions(self, path):
+        """Return the owners of path and where it is in their CONTENTS.
+
+        @type path: str
+        @param path: absolute path without ROOT
+        @rtype: list
+        @return: [(cpv, index of path in the package's CONTENTS), ...]
+        """
+
+        if self._paths is not None:
+            return self._paths.get(path, [])
+        n = _shard(path)
+        shard = self._shards.get(n)
+        if shard is None:
+            shard = read_cache(self._shard_name(n))
+            if shard is None:
+                # Removed behind our back, fall back to the full index
+                self.packages
+                return self._paths.get(path, [])
+            self._shards[n] = shard
+        return shard.get(path, [])
+
+    def entry(self, cpv, path):
+        """Return the CONTENTS entry of path as recorded for cpv.
+
+        @rtype: list
+        @return: [type, mtime, md5/target] as in
+                L{gentoolkit.package.Package.parsed_contents}
+        """
+
+        return self.packages[cpv][1][path]
+
+    def contents(self, cpv):
+        """Return the parsed CONTENTS recorded for cpv.
+
+        @rtype: dict
+        """
+
+        return self.packages[cpv][1]
+
+    @classmethod
+    def _shard_name(cls, n):
+        return "%s.paths.%02x" % (cls.cache_name, n)
+
+    @classmethod
+    def _state_name(cls):
+        return cls.cache_name + ".state"
+
+    def _build_paths(self):
+        self._paths = {}
+        for cpv, (_counter, contents) in self._packages.items():
+            self._add_paths(cpv, contents)
+
+    def _add_paths(self, cpv, contents):
+        paths = self._paths
+        for position, path in enumerate(contents):
+            owners = paths.get(path)
+            if owners is None:
+                paths[path] = [(cpv, position)]
+            else:
+                owners.append((cpv, position))
+
+    def _remove_package(self, cpv):
+        _counter, contents = self._packages.pop(cpv)
+        paths = self._paths
+        for path in contents:
+            owners = paths.get(path)
+            if owners is None:
+                continue
+            owners[:] = [x for x in owners if x[0] != cpv]
+            if not owners:
+                del paths[path]
+
+
+# =========
+# Functions
+# =========
+
+
+def _shard(path):
+    # Stable across runs, unlike hash()
+    return zlib.crc32(path.encode("utf-8", "surrogateescape")) % PATH_SHARDS
+
+
+# vim: set ts=4 sw=4 tw=79:
@@ -6,15 +6,23 @@
 
 """Provides attributes and methods for a category/package-version string."""
 
-__all__ = ("CPV", "compare_strs", "split_cpv")
+__all__ = ("BaseCPV", "CPV", "compare_strs", "split_cpv", "version_sort_key")
 
 # =======
 # Imports
 # =======
 
 import re
-
-from portage.versions import catpkgsplit, vercmp, pkgcmp
+import sys
+from functools import lru_cache
+
+from portage.versions import (
+    catpkgsplit,
+    pkgcmp,
+    suffix_regexp,
+    suffix_value,
+    ver_regexp,
+)
 
 from gentoolkit import errors
 
@@ -30,36 +38,32 @@ _pkg_re = re.compile(r"^[a-zA-Z0-9+._]+$")
 # Prefix specific revision is of the form -r0<digit>+.<digit>+
 isvalid_rev_re = re.compile(r"(\d+|0\d+\.\d+)")
 
+# Upper bound on the number of distinct cpvs/versions whose split results
+# and sort keys are remembered, comfortably above the size of the tree.
+SPLIT_CACHE_SIZE = 65536
+
 # =======
 # Classes
 # =======
 
 
-class CPV:
+class BaseCPV:
     """Provides methods on a category/package-version string.
 
     Will also correctly split just a package or package-version string.
 
-    Example usage:
-            >>> from gentoolkit.cpv import CPV
-            >>> cpv = CPV('sys-apps/portage-2.2-r1')
-            >>> cpv.category, cpv.name, cpv.fullversion
-            ('sys-apps', 'portage', '2.2-r1')
-            >>> str(cpv)
-            'sys-apps/portage-2.2-r1'
-            >>> # An 'rc' (release candidate) version is less than non 'rc' version:
-            ... CPV('sys-apps/portage-2') > CPV('sys-apps/portage-2_rc10')
-            True
+    Keeps no state of its own, so that it can be mixed into classes with
+    their own instance layout, like portage's str based Atom. L{CPV} adds
+    the storage for everything else.
     """
 
+    __slots__ = ()
+
     def __init__(self, cpv, validate=False):
         self.cpv = cpv
-        self._category = None
-        self._name = None
-        self._version = None
-        self._revision = None
-        self._cp = None
-        self._fullversion = None
+        # (category, name, version, revision, cp, fullversion), filled in
+        # on first access.
+        self._chunks = None
 
         self.validate = validate
         if validate and not self.name:
@@ -67,48 +71,42 @@ class CPV:
 
     @property
     def category(self):
-        if self._category is None:
-            self._set_cpv_chunks()
-        return self._category
+        return (self._chunks or self._set_cpv_chunks())[0]
 
     @property
     def name(self):
-        if self._name is None:
-            self._set_cpv_chunks()
-        return self._name
+        return (self._chunks or self._set_cpv_chunks())[1]
 
     @property
     def version(self):
-        if self._version is None:
-            self._set_cpv_chunks()
-        return self._version
+        return (self._chunks or self._set_cpv_chunks())[2]
 
     @property
     def revision(self):
-        if self._revision is None:
-            self._set_cpv_chunks()
-        return self._revision
+        return (self._chunks or self._set_cpv_chunks())[3]
 
     @property
     def cp(self):
-        if self._cp is None:
-            sep = "/" if self.category else ""
-            self._cp = sep.join((self.category, self.name))
-        return self._cp
+        return (self._chunks or self._set_cpv_chunks())[4]
 
     @property
     def fullversion(self):
-        if self._fullversion is None:
-            sep = "-" if self.revision else ""
-            self._fullversion = sep.join((self.version, self.revision))
-        return self._fullversion
+        return (self._chunks or self._set_cpv_chunks())[5]
+
+    @property
+    def sort_key(self):
+        """A key ordering CPVs like the comparison operators do.
+
+        Useful to sort CPVs together with other data:
+            >>> rows.sort(key=lambda row: (row[0].sort_key, row[1]))
+        """
+
+        chunks = self._chunks or self._set_cpv_chunks()
+        return (chunks[0], chunks[1], version_sort_key(chunks[5]))
 
     def _set_cpv_chunks(self):
-        chunks = split_cpv(self.cpv, validate=self.validate)
-        self._category = chunks[0]
-        self._name = chunks[1]
-        self._version = chunks[2]
-        self._revision = chunks[3]
+        self._chunks = _split_cpv_chunks(self.cpv, self.validate)
+        return self._chunks
 
     def __eq__(self, other):
         if not isinstance(other, self.__class__):
@@ -127,15 +125,15 @@ class CPV:
                 f"other isn't of {self.__class__} type, is {other.__class__}"
             )
 
-        if self.category != other.category:
-            return self.category < other.category
-        elif self.name != other.name:
-            return self.name < other.name
-        else:
-            # FIXME: this cmp() hack is for vercmp not using -1,0,1
-            # See bug 266493; this was fixed in portage-2.2_rc31
-            # return vercmp(self.fullversion, other.fullversion)
-            return vercmp(self.fullversion, other.fullversion) < 0
+        this = self._chunks or self._set_cpv_chunks()
+        that = other._chunks or other._set_cpv_chunks()
+        if this[0] != that[0]:
+            return this[0] < that[0]
+        if this[1] != that[1]:
+            return this[1] < that[1]
+        if this[5] == that[5]:
+            return False
+        return version_sort_key(this[5]) < version_sort_key(that[5])
 
     def __gt__(self, other):
         if not isinstance(other, self.__class__):
@@ -165,6 +163,27 @@ class CPV:
         return self.cpv
 
 
+class CPV(BaseCPV):
+    """A category/package-version string, see L{BaseCPV}.
+
+    Tens of thousands of these and of the L{gentoolkit.package.Package}s
+    derived from them can be alive at once, so they have no instance dict.
+
+    Example usage:
+            >>> from gentoolkit.cpv import CPV
+            >>> cpv = CPV('sys-apps/portage-2.2-r1')
+            >>> cpv.category, cpv.name, cpv.fullversion
+            ('sys-apps', 'portage', '2.2-r1')
+            >>> str(cpv)
+            'sys-apps/portage-2.2-r1'
+            >>> # An 'rc' (release candidate) version is less than non 'rc' version:
+            ... CPV('sys-apps/portage-2') > CPV('sys-apps/portage-2_rc10')
+            True
+    """
+
+    __slots__ = ("cpv", "_chunks", "validate", "__weakref__")
+
+
 # =========
 # Functions
 # =========
@@ -203,6 +222,29 @@ def split_cpv(cpv, validate=True):
             Each tuple element is a string or empty string ("").
     """
 
+    return _split_cpv_chunks(cpv, validate)[:4]
+
+
+@lru_cache(maxsize=SPLIT_CACHE_SIZE)
+def _split_cpv_chunks(cpv, validate):
+    """Memoized L{split_cpv} extended with cp and fullversion.
+
+    Category and name are interned so the many CPVs of one package share
+    them, and so does every CPV object created for the same string.
+
+    @rtype: tuple
+    @return: (category, pkg_name, version, revision, cp, fullversion)
+    """
+
+    category, name, version, revision = _split_cpv(cpv, validate)
+    category = sys.intern(category)
+    name = sys.intern(name)
+    cp = f"{category}/{name}" if category else name
+    fullversion = f"{version}-{revision}" if revision else version
+    return (category, name, version, revision, cp, fullversion)
+
+
+def _split_cpv(cpv, validate):
     category = name = version = revision = ""
 
     try:
@@ -233,6 +275,47 @@ def split_cpv(cpv, validate=True):
     return (category, name, version, revision)
 
 
+@lru_cache(maxsize=SPLIT_CACHE_SIZE)
+def version_sort_key(version):
+    """Return a key that orders versions the way portage's vercmp does.
+
+    Example usage:
+        >>> from gentoolkit.cpv import version_sort_key
+        >>> sorted(['1.0-r1', '1.0_rc1', '1.0'], key=version_sort_key)
+        ['1.0_rc1', '1.0', '1.0-r1']
+
+    @type version: str
+    @param version: version with optional revision, e.g. "2.2_rc10-r1"
+    @rtype: tuple or None
+    @return: None if version is empty or invalid, like vercmp
+    """
+
+    match = ver_regexp.match(version)
+    if match is None:
+        return None
+
+    components = [int(match.group(1))]
+    for component in match.group(2)[1:].split(".") if match.group(2) else ():
+        # vercmp compares components with a leading zero as decimal
+        # fractions ("1.02" < "1.1") and all others as integers. A fraction
+        # starting with 0 is always smaller than one that does not.
+        if component[0] == "0":
+            components.append((0, component.rstrip("0")))
+        else:
+            components.append((1, int(component)))
+    letter = ord(match.group(4)) if match.group(4) else 0
+
+    suffixes = []
+    for suffix in match.group(5).split("_")[1:]:
+        kind, number = suffix_regexp.match(suffix).groups()
+        suffixes.append((suffix_value[kind], int(number) if number else 0))
+    # A missing suffix compares like an implicit _p-1
+    suffixes.append((suffix_value["p"], -1))
+
+    revision = int(match.group(9)) if match.group(9) else 0
+    return (tuple(components), letter, tuple(suffixes), revision)
+
+
 def isvalid_pkg_name(chunks):
     if not chunks[0]:
         # this means a leading -
@@ -5,22 +5,25 @@
 """Provides a class for easy calculating dependencies for a given CPV."""
 
 __docformat__ = "epytext"
-__all__ = ("Dependencies",)
+__all__ = ("Dependencies", "DependencyGraph", "ReverseDependencyIndex")
 
 # =======
 # Imports
 # =======
 
 import itertools
+import os
+from collections import deque
 from functools import cache
 from enum import Enum
-from typing import List, Dict, Iterable, Iterator, Set, Optional, Any, Union
+from typing import List, Dict, Iterable, Iterator, Optional, Any, Tuple, Union
 
 import portage
-from portage.dep import paren_reduce
 
 from gentoolkit import errors
-from gentoolkit.atom import Atom
+from gentoolkit.atom import Atom, intern_atom
+from gentoolkit.cache import category_stamp, read_cache, write_cache, vdb_state
+from gentoolkit.depstring import parse_depstring
 from gentoolkit.query import Query
 from gentoolkit.cpv import CPV
 
@@ -120,16 +123,7 @@ class Dependencies(Query):
         # flatten Dict[DependencyKind, List[Atom]] into a List[Atom]
         return list(itertools.chain.from_iterable(self.get_depends().values()))
 
-    def graph_depends(
-        self,
-        max_depth=1,
-        printer_fn=None,
-        # The rest of these are only used internally:
-        depth=1,
-        seen=None,
-        depcache=None,
-        result=None,
-    ):
+    def graph_depends(self, max_depth=1, printer_fn=None, result=None, graph=None):
         """Graph direct dependencies for self.
 
         Optionally gather indirect dependencies.
@@ -141,48 +135,26 @@ class Dependencies(Query):
         @type printer_fn: callable
         @keyword printer_fn: If None, no effect. If set, it will be applied to
                 each result.
+        @type result: list
+        @keyword result: list to append the results to
+        @type graph: L{DependencyGraph}
+        @keyword graph: graph to take resolved packages and dependencies from,
+                to share them between several calls
         @rtype: list
-        @return: [(depth, pkg), ...]
+        @return: [(depth, pkg), ...] with every package once, see
+                L{DependencyGraph.walk}
         """
-        if seen is None:
-            seen = set()
-        if depcache is None:
-            depcache = dict()
         if result is None:
             result = list()
+        if graph is None:
+            graph = DependencyGraph()
 
-        pkgdep = None
-        deps = self.get_all_depends()
-        for dep in deps:
-            if dep.atom in depcache:
+        for depth, pkgdep, dep, kind in graph.walk(self, max_depth=max_depth):
+            if kind != DependencyGraph.EXPANDED:
                 continue
-            try:
-                pkgdep = depcache[dep.atom]
-            except KeyError:
-                pkgdep = Query(dep.atom).find_best()
-                depcache[dep.atom] = pkgdep
-            if not pkgdep:
-                continue
-            elif pkgdep.cpv in seen:
-                continue
-            if depth <= max_depth or max_depth == 0:
-                if printer_fn is not None:
-                    printer_fn(depth, pkgdep, dep)
-                result.append((depth, pkgdep))
-
-                seen.add(pkgdep.cpv)
-                if depth < max_depth or max_depth == 0:
-                    # result is passed in and added to directly
-                    # so rdeps is disposable
-                    rdeps = pkgdep.deps.graph_depends(  # noqa
-                        max_depth=max_depth,
-                        printer_fn=printer_fn,
-                        # The rest of these are only used internally:
-                        depth=depth + 1,
-                        seen=seen,
-                        depcache=depcache,
-                        result=result,
-                    )
+            if printer_fn is not None:
+                printer_fn(depth, pkgdep, dep)
+            result.append((depth, pkgdep))
         return result
 
     def graph_reverse_depends(
@@ -190,9 +162,7 @@ class Dependencies(Query):
         pkgset: Iterable[Union[str, CPV]],
         max_depth: Optional[int] = None,
         only_direct: bool = True,
-        # The rest of these are only used internally:
-        depth: int = 0,
-        seen: Optional[Set[str]] = None,
+        index: Optional["ReverseDependencyIndex"] = None,
     ) -> Iterator["Dependencies"]:
         """Graph direct reverse dependencies for self.
 
@@ -221,87 +191,487 @@ class Dependencies(Query):
                 >0 means recurse only this many times;
         @type only_direct: bool
         @keyword only_direct: to recurse or not to recurse
+        @type index: L{ReverseDependencyIndex} or None
+        @keyword index: index of the dependencies of pkgset. If given, only
+                packages the index lists as depending on us are looked at.
+                Indirect lookups build one in memory if it is not given.
         @rtype: iterable
         @return: L{gentoolkit.dependencies.Dependencies} objects
         """
 
-        if seen is None:
-            seen = set()
-
-        for pkgdep in (Dependencies(pkg) for pkg in pkgset):
-            if self.cp not in pkgdep.get_raw_depends():
-                # fast path for obviously non-matching packages. This saves
-                # us the work of instantiating a whole Atom() for *every*
-                # dependency of *every* package in pkgset.
+        if only_direct:
+            for pkgdep, deps in self._reverse_depends(pkgset, index):
+                for dep in deps:
+                    pkgdep.depatom = dep
+                    pkgdep.depth = 0
+                    yield pkgdep
+            return
+
+        # Every package's reverse dependencies are looked up once, in a
+        # breadth-first walk, so each package is expanded at the lowest depth
+        # it is found at. The result is then yielded as a tree, with every
+        # expanded package's reverse dependencies following it.
+        pkgset = list(pkgset)
+        if index is None:
+            index = ReverseDependencyIndex(pkgset)
+        positions = {str(pkg): i for i, pkg in enumerate(pkgset)}
+
+        children = {None: list(self._reverse_depends(pkgset, index, positions))}
+        expanded_from = {}
+        queue = deque([(None, 0)])
+        while queue:
+            parent, depth = queue.popleft()
+            if max_depth is not None and depth >= max_depth:
                 continue
-
-            found_match = False
-            for dep in pkgdep.get_all_depends():
-                if dep.intersects(self):
+            for pkgdep, _deps in children[parent]:
+                if pkgdep.cpv in expanded_from:
+                    continue
+                expanded_from[pkgdep.cpv] = parent
+                children[pkgdep.cpv] = list(
+                    pkgdep._reverse_depends(pkgset, index, positions)
+                )
+                queue.append((pkgdep.cpv, depth + 1))
+
+        walked = set()
+        stack = [(iter(children[None]), None, 0)]
+        while stack:
+            pkgdeps, parent, depth = stack[-1]
+            for pkgdep, deps in pkgdeps:
+                for dep in deps:
                     pkgdep.depatom = dep
                     pkgdep.depth = depth
                     yield pkgdep
-                    found_match = True
-
-            if (
-                found_match
-                and pkgdep.cpv not in seen
-                and only_direct is False
-                and (max_depth is None or depth < max_depth)
-            ):
-                seen.add(pkgdep.cpv)
-                yield from pkgdep.graph_reverse_depends(
-                    pkgset=pkgset,
-                    only_direct=False,
-                    max_depth=max_depth,
-                    depth=depth + 1,
-                    seen=seen,
-                )
+                cpv = pkgdep.cpv
+                if (
+                    cpv not in walked
+                    and cpv in expanded_from
+                    and expanded_from[cpv] == parent
+                ):
+                    walked.add(cpv)
+                    stack.append((iter(children[cpv]), cpv, depth + 1))
+                    break
+            else:
+                stack.pop()
 
-    def _parser(self, deps, use_conditional=None, depth=0):
-        """?DEPEND file parser.
+    def _reverse_depends(
+        self,
+        pkgset: Iterable[Union[str, CPV]],
+        index: Optional["ReverseDependencyIndex"] = None,
+        positions: Optional[Dict[str, int]] = None,
+    ) -> Iterator[Tuple["Dependencies", List[Atom]]]:
+        """Find the packages of pkgset which depend on self.
+
+        @type positions: dict
+        @param positions: {cpv: index in pkgset}, lets indexed lookups skip
+                walking all of pkgset
+        @rtype: iterable
+        @return: (L{Dependencies}, [matching L{gentoolkit.atom.Atom}, ...])
+                for each package depending on self, in pkgset order
+        """
+
+        candidates = None
+        if index is not None:
+            candidates = index.dependents(self)
+            if positions is not None:
+                pkgset = [
+                    pkgset[i]
+                    for i in sorted(positions[x] for x in candidates if x in positions)
+                ]
+
+        for pkg in pkgset:
+            if candidates is not None:
+                deps = candidates.get(str(pkg))
+                if deps is None:
+                    continue
+                pkgdep = Dependencies(pkg)
+            else:
+                pkgdep = Dependencies(pkg)
+                if self.cp not in pkgdep.get_raw_depends():
+                    # fast path for obviously non-matching packages. This
+                    # saves us the work of instantiating a whole Atom() for
+                    # *every* dependency of *every* package in pkgset.
+                    continue
+                deps = pkgdep.get_all_depends()
+
+            matches = [dep for dep in deps if dep.intersects(self)]
+            if matches:
+                yield pkgdep, matches
+
+    def _parser(self, deps):
+        """?DEPEND file parser, see L{gentoolkit.depstring.parse_depstring}.
 
         @rtype: list
         @return: L{gentoolkit.atom.Atom} objects
         """
-        result = []
 
-        if depth == 0:
-            deps = paren_reduce(deps)
-        for tok in deps:
-            if tok == "||":
-                continue
-            if tok[-1] == "?":
-                use_conditional = tok[:-1]
-                continue
-            if isinstance(tok, list):
-                sub_r = self._parser(tok, use_conditional, depth=depth + 1)
-                result.extend(sub_r)
-                use_conditional = None
+        return parse_depstring(deps)
+
+
+class DependencyGraph:
+    """The dependency graph below any number of packages.
+
+    Every dependency atom is resolved to its best package once, and every
+    package's dependencies are parsed once, no matter how often or below how
+    many root packages they show up.
+
+    Example usage:
+            >>> from gentoolkit.dependencies import DependencyGraph
+            >>> from gentoolkit.query import Query
+            >>> graph = DependencyGraph()
+            >>> portage = Query('sys-apps/portage').find_best()
+            >>> for depth, pkg, dep, kind in graph.walk(portage, max_depth=0):
+            ...     print(depth, pkg.cpv, kind)
+            ... # doctest: +ELLIPSIS
+            1 app-arch/zstd-1.5.6 expanded
+            2 app-arch/lz4-1.10.0-r1 expanded
+            ...
+
+    @type nodes: dict
+    @ivar nodes: {cpv: L{gentoolkit.package.Package}} of every package a
+            dependency was resolved to
+    @type edges: dict
+    @ivar edges: {cpv: [(L{gentoolkit.atom.Atom}, cpv), ...]} of every
+            package whose dependencies were looked at, with one entry for
+            each package it depends on, in dependency order
+    """
+
+    EXPANDED = "expanded"
+    REPEATED = "repeated"
+    CYCLE = "cycle"
+
+    def __init__(self):
+        self.nodes = {}
+        self.edges = {}
+        self._best = {}
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {len(self.nodes)} packages>"
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def resolve(self, dep):
+        """Return the best package matching a dependency.
+
+        @type dep: L{gentoolkit.atom.Atom}
+        @rtype: L{gentoolkit.package.Package} or None
+        """
+
+        try:
+            return self._best[dep.atom]
+        except KeyError:
+            pass
+        pkg = Query(dep.atom).find_best()
+        if pkg is not None:
+            pkg = self.nodes.setdefault(pkg.cpv, pkg)
+        self._best[dep.atom] = pkg
+        return pkg
+
+    def dependencies(self, pkg):
+        """Return the packages pkg depends on.
+
+        @type pkg: L{gentoolkit.package.Package} or L{Dependencies}
+        @rtype: list
+        @return: [(L{gentoolkit.atom.Atom}, cpv), ...] with the first
+                dependency resolving to each package. Dependencies nothing
+                resolves to are left out.
+        """
+
+        try:
+            return self.edges[pkg.cpv]
+        except KeyError:
+            pass
+
+        if isinstance(pkg, Dependencies):
+            deps = pkg.get_all_depends()
+        else:
+            deps = pkg.deps.get_all_depends()
+        children = []
+        seen = set()
+        for dep in deps:
+            child = self.resolve(dep)
+            if child is None or child.cpv in seen:
                 continue
-            # FIXME: This is a quick fix for bug #299260.
-            #        A better fix is to not discard blockers in the parser,
-            #        but to check for atom.blocker in whatever equery/depends
-            #        (in this case) and ignore them there.
-            # TODO: Test to see how much a performance impact ignoring
-            #       blockers here rather than checking for atom.blocker has.
-            if tok[0] == "!":
-                # We're not interested in blockers
+            seen.add(child.cpv)
+            children.append((dep, child.cpv))
+        self.edges[pkg.cpv] = children
+        return children
+
+    def expand(self, root, max_depth=0):
+        """Resolve the dependencies below root breadth-first.
+
+        @type root: L{gentoolkit.package.Package} or L{Dependencies}
+        @type max_depth: int
+        @param max_depth: depth to stop at, <1 means no maximum depth
+        @rtype: dict
+        @return: {cpv: (depth, parent cpv)} with the lowest depth each
+                package was found at and the first package found depending
+                on it at that depth. root maps to (0, None).
+        """
+
+        if max_depth < 1:
+            max_depth = 0
+        tree = {root.cpv: (0, None)}
+        queue = deque([(root, 0)])
+        while queue:
+            pkg, depth = queue.popleft()
+            if max_depth and depth >= max_depth:
                 continue
-            # skip it if it's empty
-            if tok and tok != "":
-                atom = Atom(tok)
-                if use_conditional is not None:
-                    atom.use_conditional = use_conditional
-                result.append(atom)
+            for _dep, cpv in self.dependencies(pkg):
+                if cpv not in tree:
+                    tree[cpv] = (depth + 1, pkg.cpv)
+                    queue.append((self.nodes[cpv], depth + 1))
+        return tree
+
+    def walk(self, root, max_depth=0, full=False):
+        """Walk the dependencies below root depth-first.
+
+        By default the graph is collapsed: every package is expanded once,
+        below the package found depending on it closest to root (see
+        L{expand}), and listed as L{REPEATED} wherever else it shows up. With
+        full every occurrence of a package is expanded, which grows
+        exponentially with the size of the graph. Either way, dependencies
+        on a package that is being expanded are listed as L{CYCLE} and not
+        followed.
+
+        @type root: L{gentoolkit.package.Package} or L{Dependencies}
+        @type max_depth: int
+        @param max_depth: depth to stop at, <1 means no maximum depth
+        @type full: bool
+        @param full: expand repeated packages again
+        @rtype: iterable
+        @return: (depth, L{gentoolkit.package.Package},
+                L{gentoolkit.atom.Atom}, kind) with depth starting at 1 for
+                the dependencies of root and kind one of L{EXPANDED},
+                L{REPEATED} or L{CYCLE}
+        """
+
+        if max_depth < 1:
+            max_depth = 0
+        tree = self.expand(root, max_depth)
+
+        walking = {root.cpv}
+        stack = [(iter(self.dependencies(root)), root.cpv)]
+        while stack:
+            children, parent = stack[-1]
+            depth = len(stack)
+            for dep, cpv in children:
+                pkg = self.nodes[cpv]
+                if cpv in walking:
+                    yield depth, pkg, dep, self.CYCLE
+                    continue
+                if not full and tree[cpv][1] != parent:
+                    yield depth, pkg, dep, self.REPEATED
+                    continue
+                yield depth, pkg, dep, self.EXPANDED
+                if not max_depth or depth < max_depth:
+                    walking.add(cpv)
+                    stack.append((iter(self.dependencies(pkg)), cpv))
+                    break
             else:
-                message = (
-                    "dependencies.py: _parser() found an empty "
-                    + "dep string token for: %s, deps= %s"
-                )
-                raise errors.GentoolkitInvalidAtom(message % (self.cpv, deps))
+                stack.pop()
+                walking.discard(parent)
+
+
+class ReverseDependencyIndex:
+    """Maps dependency cat/pkgs to the packages of a pkgset depending on them.
+
+    Building the index parses the dependencies of every package in pkgset
+    once, after which any number of reverse dependency lookups (see
+    L{Dependencies.graph_reverse_depends}) only look at actual dependents.
+    The index of the installed packages is kept in gentoolkit's cache
+    directory and is updated incrementally, see L{load_installed}.
+
+    Example usage:
+            >>> from gentoolkit.dependencies import Dependencies
+            >>> from gentoolkit.dependencies import ReverseDependencyIndex
+            >>> from gentoolkit.helpers import get_installed_cpvs
+            >>> index = ReverseDependencyIndex.load_installed()
+            >>> installed = sorted(get_installed_cpvs())
+            >>> openssl = Dependencies('dev-libs/openssl')
+            >>> revdeps = openssl.graph_reverse_depends(installed, index=index)
+            >>> len(list(revdeps))
+            68
+
+    @type state: tuple
+    @ivar state: state of the vdb and the Portage tree the index of the
+            installed packages was last brought up to date with
+    @type packages: dict
+    @ivar packages: {cpv: (stamp, [(cp, atom, use_conditional), ...])}, with
+            the dependencies in L{Dependencies.get_all_depends} order or None
+            if they could not be parsed
+    """
+
+    cache_name = "revdep-index"
+
+    def __init__(self, pkgset=None, packages=None, state=None):
+        """
+        @type pkgset: iterable
+        @param pkgset: pkg cpv strings or anything subclassing
+                L{gentoolkit.cpv.CPV} to index
+        @type packages: dict
+        @param packages: previously indexed packages
+        @type state: tuple
+        @param state: see L{state}
+        """
+        self.state = state
+        self.packages = packages if packages is not None else {}
+        self._by_cp = {}
+        for cpv in self.packages:
+            self._add_cps(cpv)
+        if pkgset is not None:
+            for pkg in pkgset:
+                self.add(str(pkg))
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {len(self.packages)} packages>"
+
+    def __len__(self):
+        return len(self.packages)
 
+    @classmethod
+    def load_installed(cls, save=True):
+        """Return an index of the installed packages.
+
+        The stored index is used as is if nothing was merged or unmerged
+        and the metadata cache of the Portage tree and overlays did not
+        change since it was written. Otherwise packages are re-read if their
+        COUNTER or the metadata their dependencies are taken from changed.
+
+        @type save: bool
+        @param save: write the index back if it had to be updated
+        @rtype: L{ReverseDependencyIndex}
+        """
+
+        portdb = portage.db[portage.root]["porttree"].dbapi
+        state = (vdb_state(), _tree_state(portdb))
+        cached = read_cache(cls.cache_name)
+        if cached is not None and cached["state"] == state:
+            return cls(packages=cached["packages"], state=state)
+
+        vardb = portage.db[portage.root]["vartree"].dbapi
+        index = cls(packages=cached["packages"] if cached is not None else None)
+
+        installed = set(vardb.cpv_all())
+        for cpv in set(index.packages).difference(installed):
+            index.remove(cpv)
+        for cpv in installed:
+            stamp = (vardb.cpv_counter(cpv), _metadata_stamp(portdb, cpv))
+            known = index.packages.get(cpv)
+            if known is not None and known[0] == stamp:
+                continue
+            if known is not None:
+                index.remove(cpv)
+            index.add(cpv, stamp=stamp)
+
+        index.state = state
+        if save:
+            write_cache(cls.cache_name, {"state": state, "packages": index.packages})
+        return index
+
+    def add(self, cpv, stamp=None):
+        """Parse and index the dependencies of cpv.
+
+        @type cpv: str
+        @type stamp: any
+        @param stamp: validation data to store along with the dependencies
+        """
+
+        try:
+            deps = [
+                (dep.cp, dep.atom, dep.use_conditional)
+                for dep in Dependencies(cpv).get_all_depends()
+            ]
+        except errors.GentoolkitException:
+            # Leave the package to graph_reverse_depends, which will raise
+            # the error if it actually matters.
+            deps = None
+        self.packages[cpv] = (stamp, deps)
+        self._add_cps(cpv)
+
+    def remove(self, cpv):
+        """Drop cpv from the index."""
+
+        _stamp, deps = self.packages.pop(cpv)
+        if deps is None:
+            self._by_cp[None].discard(cpv)
+            return
+        for cp, _atom, _use_conditional in deps:
+            self._by_cp.get(cp, set()).discard(cpv)
+
+    def dependents(self, query):
+        """Find the packages which have a dependency intersecting query.
+
+        @type query: L{gentoolkit.atom.Atom} or L{Dependencies}
+        @param query: what the dependencies should intersect
+        @rtype: dict
+        @return: {cpv: [L{gentoolkit.atom.Atom}, ...]} with each package's
+                candidate dependencies in their original order. Packages whose
+                dependencies failed to parse map to None.
+        """
+
+        if query.category:
+            cps = {query.cp}
+        else:
+            # Name-only queries intersect any category
+            cps = {
+                cp
+                for cp in self._by_cp
+                if cp is not None and cp.split("/", 1)[-1] == query.name
+            }
+
+        result = {}
+        for cp in cps:
+            for cpv in self._by_cp.get(cp, ()):
+                if cpv in result:
+                    continue
+                deps = []
+                for dep_cp, atom, use_conditional in self.packages[cpv][1]:
+                    if dep_cp in cps:
+                        deps.append(intern_atom(atom, use_conditional))
+                result[cpv] = deps
+        for cpv in self._by_cp.get(None, ()):
+            result[cpv] = Dependencies(cpv).get_all_depends()
         return result
 
+    def _add_cps(self, cpv):
+        deps = self.packages[cpv][1]
+        if deps is None:
+            self._by_cp.setdefault(None, set()).add(cpv)
+            return
+        for cp, _atom, _use_conditional in deps:
+            self._by_cp.setdefault(cp, set()).add(cpv)
+
+
+def _metadata_stamp(portdb, cpv):
+    """Identify the metadata Dependencies reads the dependencies of cpv from.
+
+    Dependencies.environment prefers the Portage tree, whose metadata cache
+    entries are validated by these keys. They change with the ebuild as well
+    as with the eclasses it inherits.
+    """
+
+    try:
+        return tuple(portdb.aux_get(cpv, ["_mtime_", "_md5_", "_eclasses_"]))
+    except KeyError:
+        # Not in the tree, the dependencies are taken from the vdb
+        return None
+
+
+def _tree_state(portdb):
+    """Return a stamp that changes with the metadata of the Portage tree."""
+
+    stamp = [
+        category_stamp(portdb, category)
+        for category in sorted(portdb.settings.categories)
+    ]
+    for repo in portdb.porttrees:
+        # Eclass changes invalidate the metadata of the ebuilds using them
+        try:
+            stamp.append(os.stat(os.path.join(repo, "eclass")).st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
 
 # vim: set ts=4 sw=4 tw=0:
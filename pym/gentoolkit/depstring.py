@@ -0,0 +1,142 @@
+# Copyright(c) 2026, Gentoo Authors
+#
+# Licensed under the GNU General Public License, v2
+
+"""Provides process wide memoized parsing of dependency strings.
+
+Many versions of a package, and many packages inheriting the same eclass,
+carry byte-identical *DEPEND strings. The functions here parse each distinct
+string once and hand out copies of the result afterwards.
+
+Example usage:
+    >>> from gentoolkit.depstring import parse_depstring, depstring_cache_info
+    >>> parse_depstring('ssl? ( dev-libs/openssl ) !app-misc/foo')
+    [<Atom 'dev-libs/openssl'>]
+    >>> depstring_cache_info()['parse']
+    CacheInfo(hits=0, misses=1, maxsize=16384, currsize=1)
+"""
+
+__all__ = ("depstring_cache_info", "parse_depstring", "reduce_depstring")
+__docformat__ = "epytext"
+
+# =======
+# Imports
+# =======
+
+from functools import lru_cache
+
+import portage
+from portage.dep import paren_reduce, use_reduce
+
+from gentoolkit import errors
+from gentoolkit.atom import intern_atom
+
+# =======
+# Globals
+# =======
+
+DEPSTRING_CACHE_SIZE = 16384
+
+# =========
+# Functions
+# =========
+
+
+def parse_depstring(depstring):
+    """Parse a dependency string into atoms, dropping blockers.
+
+    @type depstring: str
+    @param depstring: e.g. 'ssl? ( dev-libs/openssl ) sys-libs/zlib'
+    @rtype: list
+    @return: L{gentoolkit.atom.Atom} objects with use_conditional set to the
+            innermost USE conditional they appear in. The atoms are shared
+            between callers and must not be modified.
+    @raise GentoolkitInvalidAtom: if an atom is invalid
+    @raise InvalidDependString: if the string can not be tokenised
+    """
+
+    return list(_parse_depstring(depstring))
+
+
+def reduce_depstring(depstring, eapi=None, uselist=None):
+    """Memoized L{portage.dep.use_reduce} with L{portage.dep.Atom} tokens.
+
+    @type depstring: str
+    @type eapi: str
+    @type uselist: frozenset
+    @param uselist: enabled USE flags
+    @rtype: list
+    @return: the reduced, possibly nested, list of atoms. Lists are copied for
+            every call so the caller may modify them.
+    @raise InvalidDependString: if the string is invalid for eapi
+    """
+
+    return _copy_nested(_reduce_depstring(depstring, eapi, uselist))
+
+
+def depstring_cache_info():
+    """Return hit and miss counters of the dependency string caches.
+
+    @rtype: dict
+    @return: {'parse': CacheInfo, 'reduce': CacheInfo}, see
+            L{functools.lru_cache}
+    """
+
+    return {
+        "parse": _parse_depstring.cache_info(),
+        "reduce": _reduce_depstring.cache_info(),
+    }
+
+
+@lru_cache(maxsize=DEPSTRING_CACHE_SIZE)
+def _parse_depstring(depstring):
+    return tuple(_parse_tokens(paren_reduce(depstring), depstring))
+
+
+def _parse_tokens(tokens, depstring, use_conditional=None):
+    result = []
+    for tok in tokens:
+        if tok == "||":
+            continue
+        if tok[-1] == "?":
+            use_conditional = tok[:-1]
+            continue
+        if isinstance(tok, list):
+            result.extend(_parse_tokens(tok, depstring, use_conditional))
+            use_conditional = None
+            continue
+        # FIXME: This is a quick fix for bug #299260.
+        #        A better fix is to not discard blockers in the parser,
+        #        but to check for atom.blocker in whatever equery/depends
+        #        (in this case) and ignore them there.
+        # TODO: Test to see how much a performance impact ignoring
+        #       blockers here rather than checking for atom.blocker has.
+        if tok[0] == "!":
+            # We're not interested in blockers
+            continue
+        # skip it if it's empty
+        if tok and tok != "":
+            result.append(intern_atom(tok, use_conditional))
+        else:
+            message = "depstring.py: found an empty dep string token in: %s"
+            raise errors.GentoolkitInvalidAtom(message % depstring)
+
+    return result
+
+
+@lru_cache(maxsize=DEPSTRING_CACHE_SIZE)
+def _reduce_depstring(depstring, eapi, uselist):
+    return _freeze_nested(
+        use_reduce(depstring, uselist=uselist, eapi=eapi, token_class=portage.dep.Atom)
+    )
+
+
+def _freeze_nested(deps):
+    return tuple(_freeze_nested(x) if isinstance(x, list) else x for x in deps)
+
+
+def _copy_nested(deps):
+    return [_copy_nested(x) if isinstance(x, tuple) else x for x in deps]
+
+
+# vim: set ts=4 sw=4 tw=79:
@@ -0,0 +1,197 @@
+# Copyright(c) 2026, Gentoo Authors
+#
+# Licensed under the GNU General Public License, v2
+
+"""Provides the disk usage of many installed packages at once.
+
+L{gentoolkit.package.Package.size} lstat's every path of a single package
+and only recognizes hardlinks within that package. L{DiskUsage} instead
+stats the paths of all given packages once, in a pool of threads, and counts
+every inode only once across all of them. The totals are added up per
+package, per category and per repository in the same pass.
+
+Example usage:
+    >>> from gentoolkit.diskusage import DiskUsage
+    >>> from gentoolkit.query import Query
+    >>> usage = DiskUsage(jobs=8)
+    >>> usage.add_packages(Query('*').smart_find(in_installed=True))
+    >>> usage.totals('category')[0]  # doctest: +SKIP
+    ('dev-lang', (1519324782, 48226, 0))
+"""
+
+__all__ = ("AGGREGATE_KEYS", "DiskUsage")
+__docformat__ = "epytext"
+
+# =======
+# Imports
+# =======
+
+import errno
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import portage
+from portage import _encodings, _unicode_encode
+
+from gentoolkit import errors
+
+# =======
+# Globals
+# =======
+
+AGGREGATE_KEYS = ("package", "category", "repository")
+
+# Number of paths a worker lstat's per task
+STAT_CHUNK_SIZE = 256
+
+# =======
+# Classes
+# =======
+
+
+class DiskUsage:
+    """Sizes of installed packages, with every inode counted only once.
+
+    An inode owned by several packages, through the same path or through
+    hardlinks, is attributed to the first of them in cpv order. The totals
+    thus add up to the space used on disk and do not depend on the order
+    packages are added in or on the order the stats finish.
+
+    @type packages: dict
+    @ivar packages: {cpv: [size, number of files, number of uncounted files]}
+    @type categories: dict
+    @ivar categories: {category: [size, files, uncounted]}
+    @type repositories: dict
+    @ivar repositories: {repository: [size, files, uncounted]} by the
+            repository recorded in the vdb, packages without one are added
+            up under ''
+    """
+
+    def __init__(self, jobs=1):
+        """
+        @type jobs: int
+        @param jobs: number of threads to lstat paths with
+        """
+        self.jobs = jobs
+        self.packages = {}
+        self.categories = {}
+        self.repositories = {}
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {len(self.packages)} packages>"
+
+    def add_packages(self, pkgs):
+        """Stat the contents of all pkgs and add them to the totals.
+
+        Packages added before are not counted again, but inodes of packages
+        from earlier calls are not known to later ones.
+
+        @type pkgs: iterable
+        @param pkgs: installed L{gentoolkit.package.Package}s
+        """
+
+        pkgs = sorted(
+            {pkg.cpv: pkg for pkg in pkgs if pkg.cpv not in self.packages}.values()
+        )
+        contents = [(pkg, pkg.parsed_contents(prefix_root=True)) for pkg in pkgs]
+        paths = list(dict.fromkeys(path for _pkg, files in contents for path in files))
+        stats = dict(zip(paths, self._lstat_all(paths)))
+
+        vardb = portage.db[portage.root]["vartree"].dbapi
+        seen = set()
+        for pkg, files in contents:
+            totals = [0, 0, 0]
+            for path in files:
+                st = stats[path]
+                if st is None:
+                    continue
+                if isinstance(st, OSError):
+                    totals[2] += 1
+                    continue
+                # Remove hardlinks by checking for duplicate inodes. Bug #301026.
+                inode = (st.st_dev, st.st_ino)
+                if inode in seen:
+                    continue
+                seen.add(inode)
+                totals[0] += st.st_size
+                totals[1] += 1
+
+            cpv = str(pkg.cpv)
+            self.packages[cpv] = totals
+            for group, key in (
+                (self.categories, pkg.category),
+                (self.repositories, _repository(vardb, cpv)),
+            ):
+                group_totals = group.setdefault(key, [0, 0, 0])
+                for i, value in enumerate(totals):
+                    group_totals[i] += value
+
+    def _lstat_all(self, paths):
+        if self.jobs <= 1:
+            return [_lstat(path) for path in paths]
+        chunks = [
+            paths[i : i + STAT_CHUNK_SIZE]
+            for i in range(0, len(paths), STAT_CHUNK_SIZE)
+        ]
+        # lstat releases the GIL, so threads keep several lookups in flight
+        with ThreadPoolExecutor(self.jobs) as pool:
+            return [st for chunk in pool.map(_lstat_chunk, chunks) for st in chunk]
+
+    def totals(self, key="package"):
+        """Return the totals of one of L{AGGREGATE_KEYS}, largest first.
+
+        @type key: str
+        @rtype: list
+        @return: [(name, (size, files, uncounted)), ...] sorted by descending
+                size and then by name
+        @raise GentoolkitFatalError: on an unknown key
+        """
+
+        if key == "package":
+            group = self.packages
+        elif key == "category":
+            group = self.categories
+        elif key == "repository":
+            group = self.repositories
+        else:
+            raise errors.GentoolkitFatalError(
+                "unknown aggregate %r, expected one of: %s"
+                % (key, ", ".join(AGGREGATE_KEYS))
+            )
+        return sorted(
+            ((name, tuple(totals)) for name, totals in group.items()),
+            key=lambda x: (-x[1][0], x[0]),
+        )
+
+
+# =========
+# Functions
+# =========
+
+
+def _lstat(path):
+    """Return the lstat of path, None if it does not exist or the error."""
+
+    try:
+        return os.lstat(_unicode_encode(path, encoding=_encodings["fs"]))
+    except OSError as err:
+        if err.errno in (errno.ENOENT, errno.ENOTDIR):
+            return None
+        return err
+
+
+def _repository(vardb, cpv):
+    """Return the repository an installed package was merged from."""
+
+    # The vdb aux cache answers this without reading the package dir
+    try:
+        return vardb.aux_get(cpv, ["repository"])[0]
+    except KeyError:
+        return ""
+
+
+def _lstat_chunk(paths):
+    return [_lstat(path) for path in paths]
+
+
+# vim: set ts=4 sw=4 tw=79:
@@ -14,7 +14,6 @@ from pathlib import Path
 from typing import Optional, Set
 
 import portage
-from portage.dep import Atom, use_reduce
 from portage.dep._slot_operator import strip_slots
 from portage.dep.libc import find_libc_deps, strip_libc_deps
 from portage.exception import InvalidDependString
@@ -26,6 +25,7 @@ from gentoolkit.eclean.exclude import (
     exclDictMatchCP,
     exclMatchFilename,
 )
+from gentoolkit.depstring import reduce_depstring
 
 # Misc. shortcuts to some portage stuff:
 port_settings = portage.settings
@@ -549,7 +549,7 @@ def _deps_equal(deps_a, eapi_a, deps_b, eapi_b, libc_deps, uselist=None, cpv=Non
     if deps_a == deps_b:
         return True
     try:
-        deps_a = use_reduce(deps_a, uselist=uselist, eapi=eapi_a, token_class=Atom)
+        deps_a = reduce_depstring(deps_a, eapi_a, uselist)
     except InvalidDependString:  # the binpkg depend string is bad
         print(
             pp.warn(
@@ -560,7 +560,7 @@ def _deps_equal(deps_a, eapi_a, deps_b, eapi_b, libc_deps, uselist=None, cpv=Non
         )
         return False
     try:
-        deps_b = use_reduce(deps_b, uselist=uselist, eapi=eapi_b, token_class=Atom)
+        deps_b = reduce_depstring(deps_b, eapi_b, uselist)
     except InvalidDependString as er:  # the ebuild depend string is bad
         print(
             pp.warn("Warning: Invalid ebuild DEPEND String found for: %s" % cpv),
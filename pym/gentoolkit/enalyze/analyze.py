@@ -14,7 +14,7 @@ from gentoolkit import pprinter as pp
 from gentoolkit.flag import get_installed_use, get_flags
 from gentoolkit.enalyze.lib import FlagAnalyzer, KeywordAnalyser
 from gentoolkit.enalyze.output import nl, AnalysisPrinter
-from gentoolkit.package import Package
+from gentoolkit.package import get_package, prefetch_environment
 from gentoolkit.helpers import get_installed_cpvs
 
 import portage
@@ -61,14 +61,15 @@ def gather_flags_info(
         _get_used=get_installed_use,
     )
     flag_users = {}
+    cpvs = [cpv for cpv in cpvs if not cpv.startswith("virtual")]
+    if not use_portage:
+        pkgs = {cpv: get_package(cpv) for cpv in cpvs}
+        prefetch_environment(pkgs.values(), ("IUSE",), prefer_vdb=False)
     for cpv in cpvs:
-        if cpv.startswith("virtual"):
-            continue
         if use_portage:
             plus, minus, unset = flags.analyse_cpv(cpv)
         else:
-            pkg = Package(cpv)
-            plus, minus, unset = flags.analyse_pkg(pkg)
+            plus, minus, unset = flags.analyse_pkg(pkgs[cpv])
         for flag in plus:
             if flag in flag_users:
                 flag_users[flag]["+"].append(cpv)
@@ -113,14 +114,15 @@ def gather_keywords_info(
     if cpvs is None:
         cpvs = portage.db[portage.root]["vartree"].dbapi.cpv_all()
     keyword_users = {}
+    cpvs = [cpv for cpv in cpvs if not cpv.startswith("virtual")]
+    if not use_portage:
+        pkgs = {cpv: get_package(cpv) for cpv in cpvs}
+        prefetch_environment(pkgs.values(), ("KEYWORDS", "USE"), fallback=False)
     for cpv in cpvs:
-        if cpv.startswith("virtual"):
-            continue
         if use_portage:
             keyword = analyser.get_inst_keyword_cpv(cpv)
         else:
-            pkg = Package(cpv)
-            keyword = analyser.get_inst_keyword_pkg(pkg)
+            keyword = analyser.get_inst_keyword_pkg(pkgs[cpv])
         # print "returned keyword =", cpv, keyword, keyword[0]
         key = keyword[0]
         if key in ["~", "-"]:
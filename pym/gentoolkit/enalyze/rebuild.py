@@ -23,7 +23,7 @@ from gentoolkit.enalyze.lib import (
 )
 from gentoolkit.enalyze.output import RebuildPrinter
 from gentoolkit.atom import Atom
-from gentoolkit.package import Package
+from gentoolkit.package import get_package
 
 
 import portage
@@ -116,7 +116,7 @@ def cpv_all_diff_keywords(
         if use_portage:
             keyword = analyser.get_inst_keyword_cpv(cpv)
         else:
-            pkg = Package(cpv)
+            pkg = get_package(cpv)
             keyword = analyser.get_inst_keyword_pkg(pkg)
         # print "returned keyword =", cpv, keyword, keyword[0]
         key = keyword[0]
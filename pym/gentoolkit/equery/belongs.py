@@ -25,7 +25,13 @@ from gentoolkit.helpers import FileOwner
 # Globals
 # =======
 
-QUERY_OPTS = {"full_regex": False, "early_out": False, "name_only": False}
+QUERY_OPTS = {
+    "full_regex": False,
+    "early_out": False,
+    "name_only": False,
+    "use_index": True,
+    "jobs": 1,
+}
 
 # =======
 # Classes
@@ -73,7 +79,8 @@ def parse_module_options(module_opts):
     """Parse module options and update QUERY_OPTS"""
 
     opts = (x[0] for x in module_opts)
-    for opt in opts:
+    posargs = (x[1] for x in module_opts)
+    for opt, posarg in zip(opts, posargs):
         if opt in ("-h", "--help"):
             print_help()
             sys.exit(0)
@@ -87,6 +94,17 @@ def parse_module_options(module_opts):
             QUERY_OPTS["full_regex"] = True
         elif opt in ("-n", "--name-only"):
             QUERY_OPTS["name_only"] = True
+        elif opt == "--no-index":
+            QUERY_OPTS["use_index"] = False
+        elif opt in ("-j", "--jobs"):
+            if posarg.isdigit() and int(posarg) > 0:
+                QUERY_OPTS["jobs"] = int(posarg)
+            else:
+                err = "Module option --jobs requires a positive integer (got '%s')"
+                sys.stderr.write(pp.error(err % posarg))
+                print()
+                print_help(with_description=False)
+                sys.exit(2)
 
 
 def print_help(with_description=True):
@@ -109,6 +127,8 @@ def print_help(with_description=True):
                 (" -f, --full-regex", "supplied query is a regex"),
                 (" -e, --early-out", "stop when first match is found"),
                 (" -n, --name-only", "don't print the version"),
+                ("     --no-index", "read every CONTENTS file instead of the index"),
+                (" -j, --jobs=N", "read CONTENTS files with N processes"),
             )
         )
     )
@@ -117,8 +137,16 @@ def print_help(with_description=True):
 def main(input_args):
     """Parse input and run the program"""
 
-    short_opts = "h:fen"
-    long_opts = ("help", "full-regex", "early-out", "earlyout", "name-only")
+    short_opts = "h:fenj:"
+    long_opts = (
+        "help",
+        "full-regex",
+        "early-out",
+        "earlyout",
+        "name-only",
+        "no-index",
+        "jobs=",
+    )
 
     try:
         module_opts, queries = gnu_getopt(input_args, short_opts, long_opts)
@@ -145,6 +173,8 @@ def main(input_args):
         is_regex=QUERY_OPTS["full_regex"],
         early_out=QUERY_OPTS["early_out"],
         printer_fn=printer_fn,
+        use_index=QUERY_OPTS["use_index"],
+        jobs=QUERY_OPTS["jobs"],
     )
 
     if not find_owner(queries):
@@ -10,16 +10,23 @@ __docformat__ = "epytext"
 # Imports
 # =======
 
+import errno
+import hashlib
 import os
+import stat
 import sys
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import partial
 from getopt import gnu_getopt, GetoptError
 
 import portage.checksum as checksum
-from portage.exception import PermissionDenied
+from portage import _encodings, _unicode_encode
+from portage.exception import FileNotFound, PermissionDenied
 
 import gentoolkit.pprinter as pp
 from gentoolkit import errors
+from gentoolkit.cache import read_cache, write_cache
 from gentoolkit.equery import format_options, mod_usage, CONFIG
 from gentoolkit.query import Query
 
@@ -36,29 +43,152 @@ QUERY_OPTS = {
     "is_regex": False,
     "only_failures": False,
     "show_progress": False,
+    "jobs": 1,
+    "incremental": False,
+    "full": False,
+    "fast": False,
 }
 
+# Size of the reads files are hashed with
+HASH_BUFFER_SIZE = 1 << 20
+
+# Files to keep queued per worker, bounds how far ahead of the package being
+# reported the workers may hash
+HASH_QUEUE_PER_JOB = 64
+
 # =======
 # Classes
 # =======
 
 
+class VerifiedFiles:
+    """Files whose MD5 sum was verified, with their lstat at that time.
+
+    A file whose device, inode, size, mtime and ctime are all unchanged since
+    it was verified, and which is still expected to have the same MD5 sum,
+    does not need to be read again. Changing the contents of a file updates
+    its ctime, which can not be set from userspace.
+
+    Objects that are symlinks are never recorded, the lstat of the link says
+    nothing about the file it points to.
+
+    @type files: dict
+    @ivar files: {path: (st_dev, st_ino, st_size, st_mtime_ns, st_ctime_ns,
+            md5)}
+    """
+
+    cache_name = "check-state"
+
+    def __init__(self, files=None):
+        self.files = files if files is not None else {}
+        self.changed = False
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {len(self.files)} files>"
+
+    def __len__(self):
+        return len(self.files)
+
+    @classmethod
+    def load(cls):
+        """Return the stored state, or an empty one.
+
+        @rtype: L{VerifiedFiles}
+        """
+
+        cached = read_cache(cls.cache_name)
+        if cached is None:
+            return cls()
+        return cls(cached)
+
+    def save(self):
+        """Store the state in the cache directory if anything changed.
+
+        @rtype: bool
+        @return: True if the state was written
+        """
+
+        if not self.changed:
+            return False
+        if write_cache(self.cache_name, self.files):
+            self.changed = False
+            return True
+        return False
+
+    @staticmethod
+    def _entry(st, md5sum):
+        return (
+            st.st_dev,
+            st.st_ino,
+            st.st_size,
+            st.st_mtime_ns,
+            st.st_ctime_ns,
+            md5sum,
+        )
+
+    def is_verified(self, path, st, md5sum):
+        """Return True if path was verified to have md5sum while it had st.
+
+        @type st: L{os.stat_result}
+        @param st: current lstat of path
+        """
+
+        return self.files.get(path) == self._entry(st, md5sum)
+
+    def add(self, path, st, md5sum):
+        """Record that path had md5sum while it had st.
+
+        @type st: L{os.stat_result}
+        @param st: lstat of path taken before it was hashed
+        """
+
+        entry = self._entry(st, md5sum)
+        if self.files.get(path) != entry:
+            self.files[path] = entry
+            self.changed = True
+
+    def discard(self, path):
+        """Forget path, for files that failed verification."""
+
+        if self.files.pop(path, None) is not None:
+            self.changed = True
+
+
 class VerifyContents:
     """Verify installed packages' CONTENTS files.
 
     The CONTENTS file contains timestamps and MD5 sums for each file owned
     by a package.
+
+    Every entry is lstat'ed once, and all type and mtime checks work on that
+    result. The files of a package are then hashed in inode order, which
+    on most filesystems is close to the order they are laid out on disk, and
+    the results are reported in CONTENTS order.
     """
 
-    def __init__(self, printer_fn=None):
+    def __init__(self, printer_fn=None, jobs=1, state=None, full=False, fast=False):
         """Create a VerifyObjects instance.
 
         @type printer_fn: callable
         @param printer_fn: if defined, will be applied to each result as found
+        @type jobs: int
+        @param jobs: number of threads to hash files with
+        @type state: L{VerifiedFiles}
+        @param state: if defined, files it lists as verified are not hashed
+                again, and files which pass are added to it
+        @type full: bool
+        @param full: hash every file, but still record the results in state
+        @type fast: bool
+        @param fast: do not hash files with a wrong mtime, only report the
+                mtime
         """
         self.check_sums = True
         self.check_timestamps = True
         self.printer_fn = printer_fn
+        self.jobs = jobs
+        self.state = state
+        self.full = full
+        self.fast = fast
 
         self.is_regex = False
 
@@ -67,6 +197,9 @@ class VerifyContents:
         self.check_sums = check_sums
         self.check_timestamps = check_timestamps
 
+        if self.jobs > 1 and self.check_sums:
+            return self._run_parallel(pkgs)
+
         result = {}
         for pkg in pkgs:
             # _run_checks returns tuple(n_passed, n_checked, err)
@@ -77,7 +210,69 @@ class VerifyContents:
 
         return result
 
-    def _run_checks(self, files):
+    def _run_parallel(self, pkgs):
+        """Hash files in a thread pool, ahead of the package being checked.
+
+        Packages are still checked and reported one by one in the order of
+        pkgs, only their MD5 sums are computed concurrently. Hashing releases
+        the GIL, so the threads keep several reads in flight.
+        """
+
+        result = {}
+        max_queued = self.jobs * HASH_QUEUE_PER_JOB
+        with ThreadPoolExecutor(self.jobs) as pool:
+            pending = deque()
+            n_queued = 0
+            pkgs = iter(pkgs)
+            while True:
+                # Queue whole packages until the workers have enough to do
+                for pkg in pkgs:
+                    files = pkg.parsed_contents()
+                    stats = _stat_files(files)
+                    digests = {
+                        cfile: pool.submit(_md5_file, stats[cfile][0])
+                        for cfile in self._hash_order(files, stats)
+                    }
+                    pending.append((pkg, files, stats, digests))
+                    n_queued += len(digests)
+                    if n_queued >= max_queued:
+                        break
+                if not pending:
+                    break
+
+                pkg, files, stats, digests = pending.popleft()
+                n_queued -= len(digests)
+                check_results = self._run_checks(files, digests, stats)
+                result[pkg.cpv] = check_results
+                if self.printer_fn is not None:
+                    self.printer_fn(pkg.cpv, check_results)
+
+        return result
+
+    def _hash_order(self, files, stats):
+        """Return the obj entries which have to be hashed, in inode order.
+
+        @type stats: dict
+        @param stats: see L{_stat_files}
+        @rtype: list
+        """
+
+        if not self.check_sums:
+            return []
+        order = []
+        for cfile, fdesc in files.items():
+            st = stats[cfile][1]
+            if fdesc[0] != "obj" or st is None or not _is_hashable(st):
+                continue
+            if self._is_verified(stats[cfile][0], fdesc[2], st)[0]:
+                continue
+            if self.fast and self.check_timestamps and not _mtime_matches(fdesc, st):
+                continue
+            order.append((st.st_dev, st.st_ino, cfile))
+        order.sort()
+        return [cfile for _dev, _ino, cfile in order]
+
+    def _run_checks(self, files, digests=None, stats=None):
         """Run some basic sanity checks on a package's contents.
 
         If the file type (ftype) is not a directory or symlink, optionally
@@ -86,35 +281,57 @@ class VerifyContents:
         @see: gentoolkit.packages.get_contents()
         @type files: dict
         @param files: in form {'PATH': ['TYPE', 'TIMESTAMP', 'MD5SUM']}
+        @type digests: dict
+        @param digests: {'PATH': L{concurrent.futures.Future}} of MD5 sums
+                being computed already, they are computed here in inode
+                order if not given
+        @type stats: dict
+        @param stats: see L{_stat_files}
         @rtype: tuple
         @return:
                 n_passed (int): number of files that passed all checks
                 n_checked (int): number of files checked
                 errs (list): check errors' descriptions
         """
+        if stats is None:
+            stats = _stat_files(files)
+        if digests is None:
+            digests = {}
+            for cfile in self._hash_order(files, stats):
+                digests[cfile] = digest = Future()
+                try:
+                    digest.set_result(_md5_file(stats[cfile][0]))
+                except Exception as ex:
+                    digest.set_exception(ex)
+
         n_checked = 0
         n_passed = 0
         errs = []
         for cfile in files:
             n_checked += 1
             ftype = files[cfile][0]
-            real_cfile = os.environ.get("ROOT", "") + cfile
-            if not os.path.lexists(real_cfile):
+            real_cfile, st = stats[cfile]
+            if st is None:
                 errs.append("%s does not exist" % cfile)
                 continue
             elif ftype == "dir":
-                if not os.path.isdir(real_cfile):
+                # Symlinks to directories are good enough
+                if not stat.S_ISDIR(st.st_mode) and not (
+                    stat.S_ISLNK(st.st_mode) and os.path.isdir(real_cfile)
+                ):
                     err = "%(cfile)s exists, but is not a directory"
                     errs.append(err % locals())
                     continue
             elif ftype == "obj":
-                obj_errs = self._verify_obj(files, cfile, real_cfile, errs)
+                obj_errs = self._verify_obj(
+                    files, cfile, real_cfile, errs, digests.get(cfile), st
+                )
                 if len(obj_errs) > len(errs):
                     errs = obj_errs[:]
                     continue
             elif ftype == "sym":
                 target = files[cfile][2].strip()
-                if not os.path.islink(real_cfile):
+                if not stat.S_ISLNK(st.st_mode):
                     err = "%(cfile)s exists, but is not a symlink"
                     errs.append(err % locals())
                     continue
@@ -131,30 +348,56 @@ class VerifyContents:
 
         return n_passed, n_checked, errs
 
-    def _verify_obj(self, files, cfile, real_cfile, errs):
-        """Verify the MD5 sum and/or mtime and return any errors."""
+    def _verify_obj(self, files, cfile, real_cfile, errs, digest=None, st=None):
+        """Verify the MD5 sum and/or mtime and return any errors.
+
+        @type digest: L{concurrent.futures.Future}
+        @param digest: MD5 sum of real_cfile computed ahead, see
+                L{_hash_order}
+        @type st: L{os.stat_result}
+        @param st: lstat of real_cfile, taken here if not given
+        """
 
         obj_errs = errs[:]
+        if st is None:
+            st = os.lstat(real_cfile)
+        if not _is_hashable(st):
+            err = "%(cfile)s exists, but is not a regular file"
+            obj_errs.append(err % locals())
+            return obj_errs
         if self.check_sums:
             md5sum = files[cfile][2]
-            try:
-                cur_checksum = checksum.perform_md5(real_cfile, calc_prelink=1)
-            except PermissionDenied:
-                err = "Insufficient permissions to read %(cfile)s"
-                obj_errs.append(err % locals())
-                return obj_errs
-            except Exception as ex:
-                assert ex  # to silence unused variable ex
-                err = "Problem checking %(cfile)s: %(ex)s"
-                obj_errs.append(err % locals())
-                return obj_errs
-            if cur_checksum != md5sum:
-                err = "%(cfile)s has incorrect MD5sum"
-                obj_errs.append(err % locals())
-                return obj_errs
+            verified, state_st = self._is_verified(real_cfile, md5sum, st)
+            skip = self.fast and self.check_timestamps
+            if digest is None and skip and not _mtime_matches(files[cfile], st):
+                # The mtime check below fails anyway
+                verified = True
+            if not verified:
+                try:
+                    if digest is not None:
+                        cur_checksum = digest.result()
+                    else:
+                        cur_checksum = _md5_file(real_cfile)
+                except PermissionDenied:
+                    err = "Insufficient permissions to read %(cfile)s"
+                    obj_errs.append(err % locals())
+                    return obj_errs
+                except Exception as ex:
+                    assert ex  # to silence unused variable ex
+                    err = "Problem checking %(cfile)s: %(ex)s"
+                    obj_errs.append(err % locals())
+                    return obj_errs
+                if cur_checksum != md5sum:
+                    if self.state is not None:
+                        self.state.discard(real_cfile)
+                    err = "%(cfile)s has incorrect MD5sum"
+                    obj_errs.append(err % locals())
+                    return obj_errs
+                if state_st is not None:
+                    self.state.add(real_cfile, state_st, md5sum)
         if self.check_timestamps:
             mtime = int(files[cfile][1])
-            st_mtime = int(os.lstat(real_cfile).st_mtime)
+            st_mtime = int(st.st_mtime)
             if st_mtime != mtime:
                 err = (
                     "%(cfile)s has wrong mtime (is %(st_mtime)d, should be "
@@ -165,12 +408,100 @@ class VerifyContents:
 
         return obj_errs
 
+    def _is_verified(self, real_cfile, md5sum, st):
+        """Look real_cfile up in the verification state.
+
+        @type st: L{os.stat_result}
+        @param st: lstat of real_cfile
+        @rtype: tuple
+        @return: (True if it does not have to be hashed, st or None if there
+                is no state to record it in)
+        """
+
+        if self.state is None:
+            return False, None
+        if stat.S_ISLNK(st.st_mode):
+            # Symlinked objects are hashed through the link, and rewriting
+            # the target leaves the lstat of the link unchanged
+            return False, None
+        if self.full:
+            return False, st
+        return self.state.is_verified(real_cfile, st, md5sum), st
+
 
 # =========
 # Functions
 # =========
 
 
+def _real_path(cfile):
+    return os.environ.get("ROOT", "") + cfile
+
+
+def _stat_files(files):
+    """lstat every entry of a CONTENTS file once.
+
+    @rtype: dict
+    @return: {'PATH': (real path, L{os.stat_result} or None if it does not
+            exist)}
+    """
+
+    stats = {}
+    for cfile in files:
+        real_cfile = _real_path(cfile)
+        try:
+            stats[cfile] = (real_cfile, os.lstat(real_cfile))
+        except OSError:
+            stats[cfile] = (real_cfile, None)
+    return stats
+
+
+def _is_hashable(st):
+    # Symlinked objects are hashed through the link, like portage does, but
+    # reading a fifo or device could block or never end.
+    return stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode)
+
+
+def _mtime_matches(fdesc, st):
+    return int(st.st_mtime) == int(fdesc[1])
+
+
+def _md5_file(path):
+    """Return the MD5 sum of a file, like L{portage.checksum.perform_md5}.
+
+    Files are read in L{HASH_BUFFER_SIZE} blocks. Prelinked binaries are left
+    to portage, which hashes them as they were before prelinking.
+
+    @raise PermissionDenied: if path can not be read
+    @raise FileNotFound: if path does not exist
+    """
+
+    if checksum.prelink_capable:
+        return checksum.perform_md5(path, calc_prelink=1)
+
+    md5 = hashlib.md5()
+    buf = bytearray(HASH_BUFFER_SIZE)
+    view = memoryview(buf)
+    try:
+        with open(
+            _unicode_encode(path, encoding=_encodings["fs"], errors="strict"),
+            "rb",
+            buffering=0,
+        ) as f:
+            while True:
+                size = f.readinto(buf)
+                if not size:
+                    break
+                md5.update(view[:size])
+    except OSError as e:
+        if e.errno in (errno.ENOENT, errno.ESTALE):
+            raise FileNotFound(path)
+        if e.errno == PermissionDenied.errno:
+            raise PermissionDenied(path)
+        raise
+    return md5.hexdigest()
+
+
 def print_help(with_description=True):
     """Print description, usage and a detailed help message.
 
@@ -202,6 +533,13 @@ def print_help(with_description=True):
                 (" -h, --help", "display this help message"),
                 (" -f, --full-regex", "query is a regular expression"),
                 (" -o, --only-failures", "only display packages that do not pass"),
+                (" -j, --jobs=N", "compute MD5 sums with N threads"),
+                (
+                    " -i, --incremental",
+                    "skip files unchanged since they last passed",
+                ),
+                ("     --full", "check every file, but update the -i state"),
+                ("     --fast", "do not hash files with a wrong mtime"),
             )
         )
     )
@@ -241,7 +579,8 @@ def parse_module_options(module_opts):
     """Parse module options and update QUERY_OPTS"""
 
     opts = (x[0] for x in module_opts)
-    for opt in opts:
+    posargs = (x[1] for x in module_opts)
+    for opt, posarg in zip(opts, posargs):
         if opt in ("-h", "--help"):
             print_help()
             sys.exit(0)
@@ -249,13 +588,36 @@ def parse_module_options(module_opts):
             QUERY_OPTS["is_regex"] = True
         elif opt in ("-o", "--only-failures"):
             QUERY_OPTS["only_failures"] = True
+        elif opt in ("-i", "--incremental"):
+            QUERY_OPTS["incremental"] = True
+        elif opt == "--full":
+            QUERY_OPTS["full"] = True
+        elif opt == "--fast":
+            QUERY_OPTS["fast"] = True
+        elif opt in ("-j", "--jobs"):
+            if posarg.isdigit() and int(posarg) > 0:
+                QUERY_OPTS["jobs"] = int(posarg)
+            else:
+                err = "Module option --jobs requires a positive integer (got '%s')"
+                sys.stderr.write(pp.error(err % posarg))
+                print()
+                print_help(with_description=False)
+                sys.exit(2)
 
 
 def main(input_args):
     """Parse input and run the program"""
 
-    short_opts = "hof"
-    long_opts = ("help", "only-failures", "full-regex")
+    short_opts = "hofj:i"
+    long_opts = (
+        "help",
+        "only-failures",
+        "full-regex",
+        "jobs=",
+        "incremental",
+        "full",
+        "fast",
+    )
 
     try:
         module_opts, queries = gnu_getopt(input_args, short_opts, long_opts)
@@ -271,6 +633,18 @@ def main(input_args):
         print_help()
         sys.exit(2)
 
+    if QUERY_OPTS["incremental"] or QUERY_OPTS["full"]:
+        state = VerifiedFiles.load()
+    else:
+        state = None
+    try:
+        _check_queries(queries, state)
+    finally:
+        if state is not None:
+            state.save()
+
+
+def _check_queries(queries, state):
     first_run = True
     for query in (Query(x, QUERY_OPTS["is_regex"]) for x in queries):
         if not first_run:
@@ -288,7 +662,13 @@ def main(input_args):
             verbose=CONFIG["verbose"],
             only_failures=QUERY_OPTS["only_failures"],
         )
-        check = VerifyContents(printer_fn=printer)
+        check = VerifyContents(
+            printer_fn=printer,
+            jobs=QUERY_OPTS["jobs"],
+            state=state,
+            full=QUERY_OPTS["full"],
+            fast=QUERY_OPTS["fast"],
+        )
         check(matches)
 
         first_run = False
@@ -14,20 +14,23 @@ import sys
 from getopt import gnu_getopt, GetoptError
 
 import gentoolkit.pprinter as pp
-from gentoolkit.dependencies import Dependencies
+from gentoolkit.dependencies import Dependencies, ReverseDependencyIndex
 from gentoolkit.equery import format_options, mod_usage, CONFIG
+from gentoolkit.graphexport import EXPORT_FORMATS, GraphExport
 from gentoolkit.helpers import get_cpvs, get_installed_cpvs
-from gentoolkit.package import PackageFormatter, Package
+from gentoolkit.package import PackageFormatter, get_package
 
 # =======
 # Globals
 # =======
 
 QUERY_OPTS = {
+    "export": None,
     "include_masked": False,
     "only_direct": True,
     "max_depth": None,
     "package_format": None,
+    "with_mask": False,
 }
 
 # =======
@@ -99,7 +102,7 @@ class Printer:
         use_conditional = ""
 
         if QUERY_OPTS["package_format"] != None:
-            pkg = Package(str(dep.cpv))
+            pkg = get_package(str(dep.cpv))
             self.print_formated(pkg)
         else:
             if mdep.use_conditional:
@@ -130,6 +133,36 @@ class Printer:
 # =========
 
 
+def export_reverse_depends(export, query, pkgset, index=None):
+    """Add the packages depending on query to a graph export.
+
+    Every package gets an edge to the package it was found depending on,
+    or to the query node for direct reverse dependencies.
+
+    @type export: L{gentoolkit.graphexport.GraphExport}
+    @type query: str
+    @type pkgset: list
+    @param pkgset: see L{gentoolkit.dependencies.Dependencies.graph_reverse_depends}
+    @type index: L{gentoolkit.dependencies.ReverseDependencyIndex}
+    """
+
+    export.add_node(query, query=True)
+    # parents[depth] is the package reverse dependencies at depth depend on
+    parents = [query]
+    for pkgdep in Dependencies(query).graph_reverse_depends(
+        pkgset=pkgset,
+        only_direct=QUERY_OPTS["only_direct"],
+        max_depth=QUERY_OPTS["max_depth"],
+        index=index,
+    ):
+        cpv = str(pkgdep.cpv)
+        pkg = get_package(cpv) if export.with_mask else None
+        export.add_node(cpv, pkg)
+        del parents[pkgdep.depth + 1 :]
+        export.add_edge(cpv, parents[pkgdep.depth], str(pkgdep.depatom))
+        parents.append(cpv)
+
+
 def print_help(with_description=True):
     """Print description, usage and a detailed help message.
 
@@ -154,6 +187,11 @@ def print_help(with_description=True):
                 (" -D, --indirect", "search both direct and indirect dependencies"),
                 (" -F, --format=TMPL", "specify a custom output format"),
                 ("     --depth=N", "limit indirect dependency tree to specified depth"),
+                (
+                    "     --export=FORMAT",
+                    "print the dependencies as a dot or json graph",
+                ),
+                ("     --with-mask", "add masking status to the exported graph"),
             )
         )
     )
@@ -184,12 +222,31 @@ def parse_module_options(module_opts):
                 print_help(with_description=False)
                 sys.exit(2)
             QUERY_OPTS["max_depth"] = depth
+        elif opt == "--with-mask":
+            QUERY_OPTS["with_mask"] = True
+        elif opt == "--export":
+            if posarg not in EXPORT_FORMATS:
+                err = "Module option --export requires one of %s (got '%s')"
+                sys.stderr.write(pp.error(err % (", ".join(EXPORT_FORMATS), posarg)))
+                print()
+                print_help(with_description=False)
+                sys.exit(2)
+            QUERY_OPTS["export"] = posarg
 
 
 def main(input_args):
     """Parse input and run the program"""
     short_opts = "hadDF:"  # -d, --direct was old option for default action
-    long_opts = ("help", "all-packages", "direct", "indirect", "format", "depth=")
+    long_opts = (
+        "help",
+        "all-packages",
+        "direct",
+        "indirect",
+        "format",
+        "depth=",
+        "export=",
+        "with-mask",
+    )
 
     try:
         module_opts, queries = gnu_getopt(input_args, short_opts, long_opts)
@@ -211,6 +268,24 @@ def main(input_args):
 
     printer = Printer(verbose=CONFIG["verbose"])
 
+    if QUERY_OPTS["include_masked"]:
+        pkgset = sorted(get_cpvs())
+        # Indexing the whole tree only pays off if it is searched repeatedly
+        if len(queries) > 1 or not QUERY_OPTS["only_direct"]:
+            index = ReverseDependencyIndex(pkgset)
+        else:
+            index = None
+    else:
+        pkgset = sorted(get_installed_cpvs())
+        index = ReverseDependencyIndex.load_installed()
+
+    if QUERY_OPTS["export"]:
+        export = GraphExport(with_mask=QUERY_OPTS["with_mask"])
+        for query in queries:
+            export_reverse_depends(export, query, pkgset, index)
+        pp.uprint(export.format(QUERY_OPTS["export"]))
+        return
+
     first_run = True
     got_match = False
     for query in queries:
@@ -218,10 +293,6 @@ def main(input_args):
             print()
 
         pkg = Dependencies(query)
-        if QUERY_OPTS["include_masked"]:
-            pkggetter = get_cpvs
-        else:
-            pkggetter = get_installed_cpvs
 
         if CONFIG["verbose"]:
             print(" * These packages depend on %s:" % pp.emph(pkg.cpv))
@@ -230,9 +301,10 @@ def main(input_args):
 
         last_seen = None
         for pkgdep in pkg.graph_reverse_depends(
-            pkgset=sorted(pkggetter()),
+            pkgset=pkgset,
             only_direct=QUERY_OPTS["only_direct"],
             max_depth=QUERY_OPTS["max_depth"],
+            index=index,
         ):
             if last_seen is None or last_seen != pkgdep:
                 seen = False
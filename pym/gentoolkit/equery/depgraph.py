@@ -14,12 +14,11 @@ import sys
 from functools import partial
 from getopt import gnu_getopt, GetoptError
 
-import portage
-
 import gentoolkit.pprinter as pp
 from gentoolkit import errors
+from gentoolkit.dependencies import DependencyGraph
 from gentoolkit.equery import format_options, mod_usage, CONFIG
-from gentoolkit.keyword import determine_keyword
+from gentoolkit.graphexport import EXPORT_FORMATS, GraphExport, get_masking
 from gentoolkit.query import Query
 
 # =======
@@ -28,6 +27,8 @@ from gentoolkit.query import Query
 
 QUERY_OPTS = {
     "depth": 1,
+    "export": None,
+    "full": False,
     "no_atom": False,
     "no_indent": False,
     "no_useflags": False,
@@ -37,6 +38,7 @@ QUERY_OPTS = {
     "in_overlay": True,
     "include_masked": True,
     "show_progress": (not CONFIG["quiet"]),
+    "with_mask": False,
 }
 
 # =========
@@ -67,7 +69,16 @@ def print_help(with_description=True):
                 (" -M, --no-mask", "do not show masking status"),
                 (" -U, --no-useflags", "do not show USE flags"),
                 (" -l, --linear", "do not format the graph by indenting dependencies"),
+                (
+                    " -f, --full",
+                    "repeat the dependencies of packages already shown",
+                ),
                 ("     --depth=N", "limit dependency graph to specified depth"),
+                (
+                    "     --export=FORMAT",
+                    "print the graph as dot or json instead of a tree",
+                ),
+                ("     --with-mask", "add masking status to the exported graph"),
             )
         )
     )
@@ -90,6 +101,20 @@ def parse_module_options(module_opts):
             QUERY_OPTS["no_mask"] = True
         if opt in ("-l", "--linear"):
             QUERY_OPTS["no_indent"] = True
+        if opt in ("-f", "--full"):
+            QUERY_OPTS["full"] = True
+        if opt == "--with-mask":
+            QUERY_OPTS["with_mask"] = True
+        if opt == "--export":
+            if posarg not in EXPORT_FORMATS:
+                err = "Module option --export requires one of %s (got '%s')"
+                sys.stderr.write(pp.error(err % (", ".join(EXPORT_FORMATS), posarg)))
+                print()
+                print_help(with_description=False)
+                sys.exit(2)
+            QUERY_OPTS["export"] = posarg
+            # Keep the output machine readable
+            QUERY_OPTS["show_progress"] = False
         if opt in ("--depth"):
             if posarg.isdigit():
                 depth = int(posarg)
@@ -111,6 +136,7 @@ def depgraph_printer(
     no_indent=False,
     initial_pkg=False,
     no_mask=False,
+    kind=DependencyGraph.EXPANDED,
 ):
     """Display L{gentoolkit.dependencies.Dependencies.graph_depends} results.
 
@@ -129,12 +155,18 @@ def depgraph_printer(
     @type initial_pkg: bool
     @param initial_pkg: somewhat of a hack used to print the root package of
             the graph with absolutely no indent
+    @type kind: str
+    @param kind: how L{gentoolkit.dependencies.DependencyGraph.walk} found
+            B{pkg}, repeated packages and cycles are marked as such
     """
     indent = "" if no_indent or initial_pkg else " " + (" " * depth)
     decorator = "[%3d] " % depth if no_indent else "`-- "
     use = ""
     atom = ""
     mask = ""
+    note = ""
+    if kind != DependencyGraph.EXPANDED:
+        note = " (%s)" % kind
     try:
         if not no_atom:
             if dep.operator == "=*":
@@ -148,26 +180,28 @@ def depgraph_printer(
     except AttributeError:
         # 'NoneType' object has no attribute 'atom'
         pass
-    if pkg and not no_mask:
-        mask = pkg.mask_status()
-        if not mask:
-            mask = [
-                determine_keyword(
-                    portage.settings["ARCH"],
-                    portage.settings["ACCEPT_KEYWORDS"],
-                    pkg.environment("KEYWORDS"),
-                )
-            ]
-        mask = pp.masking(mask)
+    if pkg and not no_mask and kind == DependencyGraph.EXPANDED:
+        mask = pp.masking(get_masking(pkg))
     try:
-        pp.uprint(" ".join((indent, decorator, pp.cpv(str(pkg.cpv)), atom, mask, use)))
+        pp.uprint(
+            " ".join((indent, decorator, pp.cpv(str(pkg.cpv)), atom, mask, use)) + note
+        )
     except AttributeError:
         # 'NoneType' object has no attribute 'cpv'
         pp.uprint("".join((indent, decorator, "(no match for %r)" % dep.atom)))
 
 
-def make_depgraph(pkg, printer_fn):
-    """Create and display depgraph for each package."""
+def make_depgraph(pkg, printer_fn, graph=None, show_repeated=True):
+    """Create and display depgraph for each package.
+
+    @type graph: L{gentoolkit.dependencies.DependencyGraph}
+    @param graph: graph shared by all packages displayed
+    @type show_repeated: bool
+    @param show_repeated: also display repeated packages and cycles
+    """
+
+    if graph is None:
+        graph = DependencyGraph()
 
     print()
     if CONFIG["verbose"]:
@@ -178,17 +212,22 @@ def make_depgraph(pkg, printer_fn):
     # Print out the first package
     printer_fn(0, pkg, None, initial_pkg=True)
 
-    deps = pkg.deps.graph_depends(
-        max_depth=QUERY_OPTS["depth"],
-        printer_fn=printer_fn,
-        # Use this to set this pkg as the graph's root; better way?
-        result=[(0, pkg)],
-    )
+    packages = {pkg.cpv}
+    max_seen = 0
+    for depth, dep_pkg, dep, kind in graph.walk(
+        pkg, max_depth=QUERY_OPTS["depth"], full=QUERY_OPTS["full"]
+    ):
+        if kind == DependencyGraph.EXPANDED:
+            packages.add(dep_pkg.cpv)
+            max_seen = max(max_seen, depth)
+        elif not show_repeated:
+            continue
+        printer_fn(depth, dep_pkg, dep, kind=kind)
 
     if CONFIG["verbose"]:
         pkgname = pp.cpv(str(pkg.cpv))
-        n_packages = pp.number(str(len(deps)))
-        max_seen = pp.number(str(max(x[0] for x in deps)))
+        n_packages = pp.number(str(len(packages)))
+        max_seen = pp.number(str(max_seen))
         info = "[ %s stats: packages (%s), max depth (%s) ]"
         pp.uprint(info % (pkgname, n_packages, max_seen))
 
@@ -196,8 +235,18 @@ def make_depgraph(pkg, printer_fn):
 def main(input_args):
     """Parse input and run the program"""
 
-    short_opts = "hAMUl"
-    long_opts = ("help", "no-atom", "no-useflags", "no-mask", "depth=", "linear")
+    short_opts = "hAMUlf"
+    long_opts = (
+        "help",
+        "no-atom",
+        "no-useflags",
+        "no-mask",
+        "depth=",
+        "linear",
+        "full",
+        "export=",
+        "with-mask",
+    )
 
     try:
         module_opts, queries = gnu_getopt(input_args, short_opts, long_opts)
@@ -218,8 +267,13 @@ def main(input_args):
     #
 
     first_run = True
+    graph = DependencyGraph()
+    if QUERY_OPTS["export"]:
+        export = GraphExport(with_mask=QUERY_OPTS["with_mask"])
+    else:
+        export = None
     for query in (Query(x) for x in queries):
-        if not first_run:
+        if not first_run and export is None:
             print()
 
         matches = query.smart_find(**QUERY_OPTS)
@@ -229,6 +283,12 @@ def main(input_args):
 
         matches.sort()
 
+        first_run = False
+        if export is not None:
+            for pkg in matches:
+                export.add_dependency_graph(graph, pkg, QUERY_OPTS["depth"])
+            continue
+
         if CONFIG["verbose"]:
             printer = partial(
                 depgraph_printer,
@@ -247,9 +307,11 @@ def main(input_args):
             )
 
         for pkg in matches:
-            make_depgraph(pkg, printer)
+            # The quiet output lists every package once
+            make_depgraph(pkg, printer, graph, show_repeated=CONFIG["verbose"])
 
-        first_run = False
+    if export is not None:
+        pp.uprint(export.format(QUERY_OPTS["export"]))
 
 
 # vim: set ts=4 sw=4 tw=79:
@@ -16,7 +16,7 @@ from getopt import gnu_getopt, GetoptError
 import gentoolkit.pprinter as pp
 from gentoolkit import errors
 from gentoolkit.equery import format_options, mod_usage, CONFIG
-from gentoolkit.package import PackageFormatter
+from gentoolkit.package import PackageFormatter, prefetch_environment
 from gentoolkit.query import Query
 
 # =======
@@ -172,12 +172,15 @@ def main(input_args):
         sys.exit(2)
 
     query_scope = QUERY_OPTS["package_filter"] or "*"
-    matches = Query(query_scope).smart_find(**QUERY_OPTS)
-    matches.sort()
+    matches = Query(query_scope).iter_find(**QUERY_OPTS)
 
     # split out the first query since it is suppose to be the env_var
     QUERY_OPTS["env_var"] = queries.pop(0)
     env_var = QUERY_OPTS["env_var"]
+    if len(queries) != 1:
+        # Every query goes over all packages, only stream a single one
+        matches = list(matches)
+        prefetch_environment(matches, (env_var,))
 
     #
     # Output
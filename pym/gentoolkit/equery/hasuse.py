@@ -16,8 +16,14 @@ from getopt import gnu_getopt, GetoptError
 import gentoolkit.pprinter as pp
 from gentoolkit import errors
 from gentoolkit.equery import format_options, mod_usage, CONFIG
-from gentoolkit.package import PackageFormatter, FORMAT_TMPL_VARS
+from gentoolkit.package import (
+    PackageFormatter,
+    FORMAT_TMPL_VARS,
+    get_package,
+    prefetch_environment,
+)
 from gentoolkit.query import Query
+from gentoolkit.useindex import UseIndex
 
 # =======
 # Globals
@@ -30,6 +36,7 @@ QUERY_OPTS = {
     "include_masked": True,
     "show_progress": False,
     "package_format": None,
+    "use_index": True,
 }
 
 # =========
@@ -60,6 +67,7 @@ def print_help(with_description=True):
                 ),
                 (" -o, --overlay-tree", "include overlays in search path"),
                 (" -p, --portage-tree", "include entire portage tree in search path"),
+                ("     --no-index", "read every IUSE instead of the USE flag index"),
                 (" -F, --format=TMPL", "specify a custom output format"),
                 ("              TMPL", "a format template using (see man page):"),
             )
@@ -80,6 +88,12 @@ def display_useflags(query, pkg):
     if query not in useflags:
         return False
 
+    return display_package(pkg)
+
+
+def display_package(pkg):
+    """Display a package having a USE flag, if it is in the search path."""
+
     if CONFIG["verbose"]:
         pkgstr = PackageFormatter(
             pkg, do_format=True, custom_format=QUERY_OPTS["package_format"]
@@ -125,6 +139,8 @@ def parse_module_options(module_opts):
             QUERY_OPTS["in_overlay"] = True
         elif opt in ("-F", "--format"):
             QUERY_OPTS["package_format"] = posarg
+        elif opt == "--no-index":
+            QUERY_OPTS["use_index"] = False
 
 
 def main(input_args):
@@ -139,6 +155,7 @@ def main(input_args):
         "portage-tree",
         "overlay-tree",
         "format=",
+        "no-index",
     )
 
     try:
@@ -155,8 +172,17 @@ def main(input_args):
         print_help()
         sys.exit(2)
 
-    matches = Query("*").smart_find(**QUERY_OPTS)
-    matches.sort()
+    search_ebuilds = QUERY_OPTS["in_porttree"] or QUERY_OPTS["in_overlay"]
+    if QUERY_OPTS["use_index"] and (QUERY_OPTS["in_installed"] or search_ebuilds):
+        index = UseIndex.load(ebuilds=search_ebuilds)
+        matches = None
+    else:
+        index = None
+        matches = Query("*").iter_find(**QUERY_OPTS)
+    if matches is not None and len(queries) > 1:
+        # Every query goes over all packages, only stream a single one
+        matches = list(matches)
+        prefetch_environment(matches, ("IUSE",))
 
     #
     # Output
@@ -171,9 +197,17 @@ def main(input_args):
         if CONFIG["verbose"]:
             pp.uprint(" * Searching for USE flag %s ... " % pp.emph(query))
 
-        for pkg in matches:
-            if display_useflags(query, pkg):
-                got_match = True
+        if index is not None:
+            cpvs = index.packages(
+                query, installed=QUERY_OPTS["in_installed"], ebuilds=search_ebuilds
+            )
+            for pkg in sorted(get_package(x) for x in cpvs):
+                if display_package(pkg):
+                    got_match = True
+        else:
+            for pkg in matches:
+                if display_useflags(query, pkg):
+                    got_match = True
 
         first_run = False
 
@@ -17,7 +17,12 @@ import gentoolkit.pprinter as pp
 from gentoolkit import errors
 from gentoolkit.equery import format_options, mod_usage, CONFIG
 from gentoolkit.helpers import get_bintree_cpvs
-from gentoolkit.package import PackageFormatter, FORMAT_TMPL_VARS
+from gentoolkit.package import (
+    PackageFormatter,
+    FORMAT_TMPL_VARS,
+    format_environment_keys,
+    prefetch_environment,
+)
 from gentoolkit.query import Query
 
 # =======
@@ -221,6 +226,13 @@ def main(input_args):
 
         matches.sort()
 
+        prefetch_environment(
+            matches,
+            format_environment_keys(
+                do_format=CONFIG["verbose"], custom_format=QUERY_OPTS["package_format"]
+            ),
+        )
+
         #
         # Output
         #
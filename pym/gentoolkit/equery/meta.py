@@ -21,6 +21,7 @@ from gentoolkit import errors
 from gentoolkit.equery import CONFIG, format_options, mod_usage
 from gentoolkit.helpers import print_file, print_sequence
 from gentoolkit.keyword import Keyword
+from gentoolkit.metadata import get_metadata_cache
 from gentoolkit.query import Query
 from gentoolkit.textwrap_ import TextWrapper
 
@@ -579,5 +580,7 @@ def main(input_args):
 
         first_run = False
 
+    get_metadata_cache().save()
+
 
 # vim: set ts=4 sw=4 tw=79:
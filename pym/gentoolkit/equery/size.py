@@ -14,6 +14,7 @@ import sys
 from getopt import gnu_getopt, GetoptError
 
 import gentoolkit.pprinter as pp
+from gentoolkit.diskusage import AGGREGATE_KEYS, DiskUsage
 from gentoolkit.equery import format_options, mod_usage, CONFIG
 from gentoolkit.query import Query
 
@@ -29,6 +30,8 @@ QUERY_OPTS = {
     "is_regex": False,
     "show_progress": False,
     "size_in_bytes": False,
+    "aggregate": None,
+    "jobs": 1,
 }
 
 # =========
@@ -67,6 +70,11 @@ def print_help(with_description=True):
                 (" -h, --help", "display this help message"),
                 (" -b, --bytes", "report size in bytes"),
                 (" -f, --full-regex", "query is a regular expression"),
+                (
+                    " -a, --aggregate=KEY",
+                    "add up all matches by package, category or repository",
+                ),
+                (" -j, --jobs=N", "stat files with N threads with --aggregate"),
             )
         )
     )
@@ -80,24 +88,59 @@ def display_size(match_set):
     """
 
     for pkg in match_set:
-        size, files, uncounted = pkg.size()
+        display_totals(pp.cpv(str(pkg.cpv)), str(pkg.cpv), pkg.size())
 
-        if CONFIG["verbose"]:
-            pp.uprint(" * %s" % pp.cpv(str(pkg.cpv)))
-            print("Total files : %s".rjust(25) % pp.number(str(files)))
 
-            if uncounted:
-                print("Inaccessible files : %s".rjust(25) % pp.number(str(uncounted)))
+def display_aggregate(match_set, key):
+    """Display the total size of packages added up by key.
 
-            if QUERY_OPTS["size_in_bytes"]:
-                size_str = pp.number(str(size))
-            else:
-                size_str = "%s %s" % format_bytes(size)
+    Files shared by several packages are only counted once, see
+    L{gentoolkit.diskusage.DiskUsage}.
+
+    @type match_set: list
+    @param match_set: installed packages
+    @type key: str
+    @param key: one of L{gentoolkit.diskusage.AGGREGATE_KEYS}
+    """
+
+    usage = DiskUsage(jobs=QUERY_OPTS["jobs"])
+    usage.add_packages(match_set)
+    for name, totals in usage.totals(key):
+        name = name or "(unknown)"
+        if key == "package":
+            display_totals(pp.cpv(name), name, totals)
+        else:
+            display_totals(pp.emph(name), name, totals)
+
+
+def display_totals(heading, name, totals):
+    """Display a size, the number of files and of inaccessible files.
 
-            print("Total size  : %s".rjust(25) % size_str)
+    @type heading: str
+    @param heading: name as shown in verbose mode
+    @type name: str
+    @param name: name as shown in quiet mode
+    @type totals: tuple
+    @param totals: (size, number of files, number of uncounted files)
+    """
+
+    size, files, uncounted = totals
+    if CONFIG["verbose"]:
+        pp.uprint(" * %s" % heading)
+        print("Total files : %s".rjust(25) % pp.number(str(files)))
+
+        if uncounted:
+            print("Inaccessible files : %s".rjust(25) % pp.number(str(uncounted)))
+
+        if QUERY_OPTS["size_in_bytes"]:
+            size_str = pp.number(str(size))
         else:
-            info = "%s: total(%d), inaccessible(%d), size(%s)"
-            pp.uprint(info % (str(pkg.cpv), files, uncounted, size))
+            size_str = "%s %s" % format_bytes(size)
+
+        print("Total size  : %s".rjust(25) % size_str)
+    else:
+        info = "%s: total(%d), inaccessible(%d), size(%s)"
+        pp.uprint(info % (name, files, uncounted, size))
 
 
 def format_bytes(bytes_, precision=2):
@@ -140,7 +183,8 @@ def parse_module_options(module_opts):
     """Parse module options and update QUERY_OPTS"""
 
     opts = (x[0] for x in module_opts)
-    for opt in opts:
+    posargs = (x[1] for x in module_opts)
+    for opt, posarg in zip(opts, posargs):
         if opt in ("-h", "--help"):
             print_help()
             sys.exit(0)
@@ -153,6 +197,24 @@ def parse_module_options(module_opts):
             print()
         elif opt in ("-f", "--full-regex"):
             QUERY_OPTS["is_regex"] = True
+        elif opt in ("-a", "--aggregate"):
+            if posarg in AGGREGATE_KEYS:
+                QUERY_OPTS["aggregate"] = posarg
+            else:
+                err = "Module option --aggregate requires one of: %s (got '%s')"
+                sys.stderr.write(pp.error(err % (", ".join(AGGREGATE_KEYS), posarg)))
+                print()
+                print_help(with_description=False)
+                sys.exit(2)
+        elif opt in ("-j", "--jobs"):
+            if posarg.isdigit() and int(posarg) > 0:
+                QUERY_OPTS["jobs"] = int(posarg)
+            else:
+                err = "Module option --jobs requires a positive integer (got '%s')"
+                sys.stderr.write(pp.error(err % posarg))
+                print()
+                print_help(with_description=False)
+                sys.exit(2)
 
 
 def main(input_args):
@@ -160,8 +222,8 @@ def main(input_args):
 
     # -e, --exact-name is no longer needed. Kept for compatibility.
     # 04/09 djanderson
-    short_opts = "hbfe"
-    long_opts = ("help", "bytes", "full-regex", "exact-name")
+    short_opts = "hbfea:j:"
+    long_opts = ("help", "bytes", "full-regex", "exact-name", "aggregate=", "jobs=")
 
     try:
         module_opts, queries = gnu_getopt(input_args, short_opts, long_opts)
@@ -177,6 +239,18 @@ def main(input_args):
         print_help()
         sys.exit(2)
 
+    if QUERY_OPTS["aggregate"] is not None:
+        # Every package is only counted once, however many queries match it
+        all_matches = {}
+        for query in (Query(x, QUERY_OPTS["is_regex"]) for x in queries):
+            matches = query.smart_find(**QUERY_OPTS)
+            if not matches:
+                sys.stderr.write(pp.error("No package found matching %s" % query))
+            for pkg in matches:
+                all_matches.setdefault(pkg.cpv, pkg)
+        display_aggregate(list(all_matches.values()), QUERY_OPTS["aggregate"])
+        return
+
     first_run = True
     for query in (Query(x, QUERY_OPTS["is_regex"]) for x in queries):
         if not first_run:
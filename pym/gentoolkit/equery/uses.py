@@ -10,15 +10,12 @@ __docformat__ = "epytext"
 # Imports
 # =======
 
-import os
 import sys
 
 from functools import partial
 from getopt import gnu_getopt, GetoptError
-from glob import glob
 
 from portage import settings
-from portage import _encodings, _unicode_encode
 
 import gentoolkit.pprinter as pp
 from gentoolkit import errors
@@ -26,6 +23,8 @@ from gentoolkit.equery import format_options, mod_usage, CONFIG
 from gentoolkit.textwrap_ import TextWrapper
 from gentoolkit.query import Query
 from gentoolkit.flag import get_flags, reduce_flags
+from gentoolkit.metadata import get_metadata_cache
+from gentoolkit.usedesc import UseDescIndex
 
 # =======
 # Globals
@@ -142,63 +141,28 @@ def get_global_useflags():
     """Get global and expanded USE flag variables from
     PORTDIR/profiles/use.desc and PORTDIR/profiles/desc/*.desc respectively.
 
+    The parsed files are cached, see L{gentoolkit.usedesc.UseDescIndex}.
+
     @rtype: dict
     @return: {'flag_name': 'flag description', ...}
     """
 
-    global_usedesc = {}
-    # Get global USE flag descriptions
-    try:
-        path = os.path.join(settings["PORTDIR"], "profiles", "use.desc")
-        with open(
-            _unicode_encode(path, encoding=_encodings["fs"]),
-            encoding=_encodings["content"],
-        ) as open_file:
-            for line in open_file:
-                if line.startswith("#"):
-                    continue
-                # Ex. of fields: ['syslog', 'Enables support for syslog\n']
-                fields = line.split(" - ", 1)
-                if len(fields) == 2:
-                    global_usedesc[fields[0]] = fields[1].rstrip()
-    except OSError:
-        sys.stderr.write(
-            pp.warn("Could not load USE flag descriptions from %s" % pp.path(path))
-        )
-
-    del path, open_file
-    # Add USE_EXPANDED variables to usedesc hash -- Bug #238005
-    for path in glob(os.path.join(settings["PORTDIR"], "profiles", "desc", "*.desc")):
-        try:
-            with open(
-                _unicode_encode(path, encoding=_encodings["fs"]),
-                encoding=_encodings["content"],
-            ) as open_file:
-                for line in open_file:
-                    if line.startswith("#"):
-                        continue
-                    fields = [field.strip() for field in line.split(" - ", 1)]
-                    if len(fields) == 2:
-                        expanded_useflag = "{}_{}".format(
-                            path.split("/")[-1][0:-5],
-                            fields[0],
-                        )
-                        global_usedesc[expanded_useflag] = fields[1]
-        except OSError:
-            sys.stderr.write(
-                pp.warn("Could not load USE flag descriptions from %s" % path)
-            )
-
+    index = UseDescIndex.load()
+    global_usedesc = index.global_descriptions()
+    index.save()
     return global_usedesc
 
 
-def get_output_descriptions(pkg, global_usedesc):
-    """Prepare descriptions and usage information for each USE flag."""
+def get_output_descriptions(pkg, global_usedesc, local_usedesc=None):
+    """Prepare descriptions and usage information for each USE flag.
 
-    if pkg.metadata is None:
-        local_usedesc = []
-    else:
-        local_usedesc = pkg.metadata.use()
+    @type local_usedesc: dict
+    @param local_usedesc: see L{UseDescIndex.local_descriptions}, read from
+            the package's metadata.xml if not given
+    """
+
+    if local_usedesc is None:
+        local_usedesc = UseDescIndex.local_descriptions(pkg)
 
     useforced = []
     usemasked = []
@@ -229,24 +193,10 @@ def get_output_descriptions(pkg, global_usedesc):
         inuse = 0
         inused = 0
 
-        local_use = None
-        for use in local_usedesc:
-            if use.name == flag:
-                local_use = use
-                break
-
-        try:
-            desc = local_use.description
-        except AttributeError:
-            try:
-                desc = global_usedesc[flag]
-            except KeyError:
-                desc = ""
-
         try:
-            restrict = local_use.restrict
-            restrict = restrict if restrict is not None else ""
-        except AttributeError:
+            desc, restrict = local_usedesc[flag]
+        except KeyError:
+            desc = global_usedesc.get(flag, "")
             restrict = ""
 
         if flag in final_use:
@@ -319,8 +269,18 @@ def main(input_args):
     # Output
     #
 
+    usedesc_index = UseDescIndex.load()
+    try:
+        _display_queries(queries, usedesc_index)
+    finally:
+        usedesc_index.save()
+        get_metadata_cache().save()
+
+
+def _display_queries(queries, usedesc_index):
     first_run = True
     legend_printed = False
+    global_usedesc = usedesc_index.global_descriptions()
     for query in (Query(x) for x in queries):
         if not first_run:
             print()
@@ -335,9 +295,10 @@ def main(input_args):
 
         matches.sort()
 
-        global_usedesc = get_global_useflags()
         for pkg in matches:
-            output = get_output_descriptions(pkg, global_usedesc)
+            output = get_output_descriptions(
+                pkg, global_usedesc, usedesc_index.local_descriptions(pkg)
+            )
             if output:
                 if CONFIG["verbose"]:
                     if not legend_printed:
@@ -17,6 +17,8 @@ __all__ = (
     "filter_flags",
     "get_all_cpv_use",
     "get_flags",
+    "get_use_resolver",
+    "UseResolver",
 )
 
 
@@ -135,6 +137,91 @@ def filter_flags(use, use_expand_hidden, usemasked, useforced):
     return list(use.values())
 
 
+class UseResolver:
+    """Determines the final USE flags and settings of many packages.
+
+    Every package is resolved with a single setcpv() on a private clone of
+    the porttree config, instead of unlocking, setting up and resetting the
+    global one each time. Results are cached per cpv. USE_EXPAND_HIDDEN only
+    depends on the profile and is read once, and packages with the same
+    use.mask or use.force share one list.
+
+    The returned lists are shared, callers must not modify them.
+    """
+
+    def __init__(self, settings=None):
+        self._portdb = portage.db[portage.root]["porttree"].dbapi
+        if settings is None:
+            settings = self._portdb.settings
+        self.settings = portage.config(clone=settings)
+        self._use_expand_hidden = None
+        self._flag_lists = {}
+        self._cache = {}
+
+    def resolve(self, cpv):
+        """Return the final USE flags and settings of a package.
+
+        @type cpv: string
+        @param cpv: eg cat/pkg-ver
+        @rtype: lists
+        @return  use, use_expand_hidden, usemask, useforce; all empty if
+                the package is not in the tree
+        """
+        try:
+            return self._cache[cpv]
+        except KeyError:
+            result = self._cache[cpv] = self._resolve(cpv)
+            return result
+
+    def resolve_many(self, cpvs):
+        """Resolve several packages at once.
+
+        @type cpvs: iterable
+        @param cpvs: cat/pkg-ver strings
+        @rtype: dict
+        @return {cpv: (use, use_expand_hidden, usemask, useforce)}
+        """
+        return {cpv: self.resolve(cpv) for cpv in cpvs}
+
+    def _resolve(self, cpv):
+        settings = self.settings
+        try:
+            settings.setcpv(cpv, mydb=self._portdb)
+            use = settings["PORTAGE_USE"].split()
+            if self._use_expand_hidden is None:
+                self._use_expand_hidden = settings["USE_EXPAND_HIDDEN"].split()
+        except KeyError:
+            return [], [], [], []
+        return (
+            use,
+            self._use_expand_hidden,
+            self._flag_list(settings.usemask),
+            self._flag_list(settings.useforce),
+        )
+
+    def _flag_list(self, flags):
+        flags = frozenset(flags)
+        try:
+            return self._flag_lists[flags]
+        except KeyError:
+            result = self._flag_lists[flags] = list(flags)
+            return result
+
+
+_use_resolver = None
+
+
+def get_use_resolver():
+    """Return the L{UseResolver} shared by the functions of this module.
+
+    @rtype: L{UseResolver}
+    """
+    global _use_resolver
+    if _use_resolver is None:
+        _use_resolver = UseResolver()
+    return _use_resolver
+
+
 def get_all_cpv_use(cpv):
     """Uses portage to determine final USE flags and settings for an emerge
 
@@ -142,25 +229,9 @@ def get_all_cpv_use(cpv):
     @param cpv: eg cat/pkg-ver
     @rtype: lists
     @return  use, use_expand_hidden, usemask, useforce
+    @see: L{UseResolver} to resolve many packages
     """
-    use = None
-    portage.db[portage.root]["porttree"].dbapi.settings.unlock()
-    try:
-        portage.db[portage.root]["porttree"].dbapi.settings.setcpv(
-            cpv, mydb=portage.portdb
-        )
-        use = portage.settings["PORTAGE_USE"].split()
-        use_expand_hidden = portage.settings["USE_EXPAND_HIDDEN"].split()
-        usemask = list(portage.db[portage.root]["porttree"].dbapi.settings.usemask)
-        useforce = list(portage.db[portage.root]["porttree"].dbapi.settings.useforce)
-    except KeyError:
-        portage.db[portage.root]["porttree"].dbapi.settings.reset()
-        portage.db[portage.root]["porttree"].dbapi.settings.lock()
-        return [], [], [], []
-    # reset cpv filter
-    portage.db[portage.root]["porttree"].dbapi.settings.reset()
-    portage.db[portage.root]["porttree"].dbapi.settings.lock()
-    return use, use_expand_hidden, usemask, useforce
+    return get_use_resolver().resolve(cpv)
 
 
 def get_flags(cpv, final_setting=False, include_forced_masked=False):
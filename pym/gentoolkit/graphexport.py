@@ -0,0 +1,240 @@
+# Copyright(c) 2026, Gentoo Authors
+#
+# Licensed under the GNU General Public License, v2
+
+"""Provides machine readable exports of dependency graphs.
+
+L{GraphExport} collects packages and the dependencies between them and writes
+them as a Graphviz DOT digraph or a JSON adjacency list. Nodes only carry
+masking information if it is asked for, as looking it up is by far the most
+expensive part of an export.
+
+Example usage:
+    >>> from gentoolkit.dependencies import DependencyGraph
+    >>> from gentoolkit.graphexport import GraphExport
+    >>> from gentoolkit.query import Query
+    >>> export = GraphExport()
+    >>> portage = Query('sys-apps/portage').find_best()
+    >>> export.add_dependency_graph(DependencyGraph(), portage, max_depth=1)
+    >>> print(export.format('dot'))  # doctest: +ELLIPSIS
+    digraph "dependencies" {
+      "sys-apps/portage-3.0.66.1" [root=true];
+      ...
+"""
+
+__all__ = ("EXPORT_FORMATS", "GraphExport", "get_masking")
+__docformat__ = "epytext"
+
+# =======
+# Imports
+# =======
+
+import json
+
+import portage
+
+from gentoolkit import errors
+from gentoolkit.keyword import determine_keyword
+
+# =======
+# Globals
+# =======
+
+EXPORT_FORMATS = ("dot", "json")
+
+# =======
+# Classes
+# =======
+
+
+class GraphExport:
+    """Packages and the dependencies between them, ready to be exported.
+
+    Edges point from the depending package to its dependency, whichever way
+    the graph was walked.
+
+    @type nodes: dict
+    @ivar nodes: {node: {attribute: value}} in insertion order
+    @type edges: dict
+    @ivar edges: {node: [(node, atom), ...]} with the dependencies of each
+            node in insertion order
+    """
+
+    def __init__(self, with_mask=False):
+        """
+        @type with_mask: bool
+        @param with_mask: add the masking status of every package node, see
+                L{get_masking}
+        """
+        self.with_mask = with_mask
+        self.nodes = {}
+        self.edges = {}
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {len(self.nodes)} nodes>"
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add_node(self, name, pkg=None, **attributes):
+        """Add a node, or add attributes to an existing one.
+
+        @type name: str
+        @param name: node name, usually a cpv
+        @type pkg: L{gentoolkit.package.Package}
+        @param pkg: package of the node, used to look up its masking status
+        """
+
+        node = self.nodes.get(name)
+        if node is None:
+            node = self.nodes[name] = {}
+            self.edges[name] = []
+            if self.with_mask and pkg is not None:
+                node["masking"] = get_masking(pkg)
+        node.update(attributes)
+        return node
+
+    def add_edge(self, source, target, atom=None):
+        """Add a dependency of source on target, both have to be nodes.
+
+        @type atom: str
+        @param atom: dependency atom of source that target was matched by
+        """
+
+        edge = (target, atom)
+        if edge not in self.edges[source]:
+            self.edges[source].append(edge)
+
+    def add_dependency_graph(self, graph, root, max_depth=0):
+        """Add the dependencies below root.
+
+        @type graph: L{gentoolkit.dependencies.DependencyGraph}
+        @type root: L{gentoolkit.package.Package}
+        @type max_depth: int
+        @param max_depth: depth to stop at, <1 means no maximum depth. The
+                dependencies of packages at max_depth are left out.
+        """
+
+        if max_depth < 1:
+            max_depth = 0
+        tree = graph.expand(root, max_depth)
+        self.add_node(str(root.cpv), root, root=True)
+        for cpv, (depth, _parent) in tree.items():
+            if cpv != root.cpv:
+                node = self.add_node(str(cpv), graph.nodes[cpv])
+                node["depth"] = min(depth, node.get("depth", depth))
+        for cpv, (depth, _parent) in tree.items():
+            if max_depth and depth >= max_depth:
+                continue
+            for dep, child in graph.dependencies(graph.nodes.get(cpv, root)):
+                self.add_edge(str(cpv), str(child), str(dep))
+
+    def format(self, export_format):
+        """Return the graph in one of L{EXPORT_FORMATS}.
+
+        @type export_format: str
+        @rtype: str
+        @raise GentoolkitFatalError: on an unknown format
+        """
+
+        if export_format == "dot":
+            return self.format_dot()
+        if export_format == "json":
+            return self.format_json()
+        raise errors.GentoolkitFatalError(
+            "unknown graph format %r, expected one of: %s"
+            % (export_format, ", ".join(EXPORT_FORMATS))
+        )
+
+    def format_dot(self, name="dependencies"):
+        """Return the graph as a Graphviz DOT digraph.
+
+        @type name: str
+        @param name: name of the digraph
+        @rtype: str
+        """
+
+        lines = ["digraph %s {" % _dot_id(name)]
+        for node, attributes in self.nodes.items():
+            if attributes:
+                lines.append(
+                    "  %s [%s];" % (_dot_id(node), _dot_attributes(attributes))
+                )
+            else:
+                lines.append("  %s;" % _dot_id(node))
+        for source, targets in self.edges.items():
+            for target, atom in targets:
+                edge = f"  {_dot_id(source)} -> {_dot_id(target)}"
+                if atom is not None:
+                    edge += " [label=%s]" % _dot_id(atom)
+                lines.append(edge + ";")
+        lines.append("}")
+        return "\n".join(lines)
+
+    def format_json(self):
+        """Return the graph as a JSON adjacency list.
+
+        @rtype: str
+        @return: {"nodes": {node: {attribute: value}},
+                "adjacency": {node: [{"target": node, "atom": atom}]}}
+        """
+
+        return json.dumps(
+            {
+                "nodes": self.nodes,
+                "adjacency": {
+                    source: [{"target": target, "atom": atom} for target, atom in edges]
+                    for source, edges in self.edges.items()
+                },
+            },
+            indent=1,
+        )
+
+
+# =========
+# Functions
+# =========
+
+
+def get_masking(pkg):
+    """Return the masking status of a package, or its keyword if unmasked.
+
+    @type pkg: L{gentoolkit.package.Package}
+    @rtype: list
+    @return: L{gentoolkit.package.Package.mask_status} or
+            [L{gentoolkit.keyword.determine_keyword}], as shown by
+            equery depgraph
+    """
+
+    mask = pkg.mask_status()
+    if not mask:
+        mask = [
+            determine_keyword(
+                portage.settings["ARCH"],
+                portage.settings["ACCEPT_KEYWORDS"],
+                pkg.environment("KEYWORDS"),
+            )
+        ]
+    return mask
+
+
+def _dot_id(value):
+    return '"%s"' % str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _dot_attributes(attributes):
+    result = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            value = "true" if value else "false"
+        elif isinstance(value, int):
+            value = str(value)
+        elif isinstance(value, (list, tuple)):
+            value = _dot_id(" ".join(str(x) for x in value))
+        else:
+            value = _dot_id(value)
+        result.append(f"{key}={value}")
+    return ", ".join(result)
+
+
+# vim: set ts=4 sw=4 tw=79:
@@ -10,10 +10,14 @@
 
 __all__ = (
     "FileOwner",
+    "NameIndex",
+    "PathMatcher",
     "get_cpvs",
+    "get_name_index",
     "get_installed_cpvs",
     "get_uninstalled_cpvs",
     "get_bintree_cpvs",
+    "get_sorted_cpvs",
     "uniqify",
 )
 __docformat__ = "epytext"
@@ -22,16 +26,20 @@ __docformat__ = "epytext"
 # Imports
 # =======
 
+import fnmatch
+import multiprocessing
 import os
 import re
+from bisect import bisect_left
 from functools import partial
-from itertools import chain
+from itertools import chain, islice
 
 import portage
 from portage import _encodings, _unicode_encode
 
 from gentoolkit import pprinter as pp
 from gentoolkit import errors
+from gentoolkit.cpv import version_sort_key
 
 # This has to be imported below to stop circular import.
 # from gentoolkit.package import Package
@@ -41,6 +49,131 @@ from gentoolkit import errors
 # =======
 
 
+class PathMatcher:
+    """Matches file paths against literal path queries.
+
+    Absolute queries are looked up in a set, other queries match any path
+    ending in /query and are looked up by their last path component first.
+    Provides the match and search methods of a compiled regex, so it can be
+    used in its place.
+
+    Example usage:
+            >>> from gentoolkit.helpers import PathMatcher
+            >>> matcher = PathMatcher(['/bin/grep', 'bin/sed'])
+            >>> bool(matcher.match('/bin/grep')), bool(matcher.match('/usr/bin/sed'))
+            (True, True)
+            >>> bool(matcher.match('/bin/egrep'))
+            False
+    """
+
+    def __init__(self, paths):
+        """
+        @type paths: iterable
+        @param paths: normalized path queries, see L{FileOwner}
+        """
+        self.exact = set()
+        self.suffixes = {}
+        for path in paths:
+            if path.startswith("/"):
+                self.exact.add(path)
+            else:
+                basename = path.rpartition("/")[2]
+                self.suffixes.setdefault(basename, set()).add("/" + path)
+
+    def __repr__(self):
+        return "<{} {!r}>".format(
+            self.__class__.__name__,
+            sorted(self.exact.union(*self.suffixes.values())),
+        )
+
+    def match(self, path):
+        """Return True if path matches one of the queries."""
+
+        if path in self.exact:
+            return True
+        if self.suffixes:
+            suffixes = self.suffixes.get(path.rpartition("/")[2])
+            if suffixes:
+                return any(path.endswith(x) for x in suffixes)
+        return False
+
+    search = match
+
+
+class NameIndex:
+    """Category and package names of one package database.
+
+    Built from cp_all() and grouped by category with sorted names, so that
+    the packages whose cpvs can match a glob are found without listing the
+    versions of every other package first.
+
+    Example usage:
+            >>> from gentoolkit.helpers import NameIndex
+            >>> index = NameIndex(['dev-lang/python', 'dev-python/pip', 'sys-apps/portage'])
+            >>> index.find('dev-*', 'p')
+            ['dev-lang/python', 'dev-python/pip']
+            >>> index.find(prefix='portage-2')
+            ['sys-apps/portage']
+    """
+
+    def __init__(self, cps):
+        self.cps = set(cps)
+        self.categories = {}
+        for cp in self.cps:
+            category, name = cp.split("/", 1)
+            self.categories.setdefault(category, []).append(name)
+        for names in self.categories.values():
+            names.sort()
+
+    def __repr__(self):
+        return "<{} {} categories, {} packages>".format(
+            self.__class__.__name__, len(self.categories), len(self.cps)
+        )
+
+    def __len__(self):
+        return len(self.cps)
+
+    def find(self, category=None, prefix="", is_regex=False):
+        """Return the cps that can have cpvs starting with prefix.
+
+        @type category: str or None
+        @param category: glob the whole category must match, or a regex
+                matching the start of it if is_regex is set
+        @type prefix: str
+        @param prefix: literal start of package name and version
+        @type is_regex: bool
+        @param is_regex: category is a regular expression
+        @rtype: list
+        @return: cat/pkg strings sorted by category and name
+        """
+
+        categories = sorted(self.categories)
+        if category is not None:
+            if not is_regex:
+                category = fnmatch.translate(category)
+            category_re = re.compile(category)
+            categories = [x for x in categories if category_re.match(x)]
+
+        result = []
+        for cat in categories:
+            names = self.categories[cat]
+            if not prefix:
+                result.extend(f"{cat}/{name}" for name in names)
+                continue
+            # Names the prefix runs past, like foo for foo-1*
+            dash = prefix.find("-", 1)
+            while dash != -1:
+                if f"{cat}/{prefix[:dash]}" in self.cps:
+                    result.append(f"{cat}/{prefix[:dash]}")
+                dash = prefix.find("-", dash + 1)
+            for name in islice(names, bisect_left(names, prefix), None):
+                if not name.startswith(prefix):
+                    break
+                result.append(f"{cat}/{name}")
+
+        return result
+
+
 class FileOwner:
     """Creates a function for locating the owner of filename queries.
 
@@ -51,7 +184,14 @@ class FileOwner:
             [(<Package 'sys-apps/grep-2.12'>, '/bin/grep')]
     """
 
-    def __init__(self, is_regex=False, early_out=False, printer_fn=None):
+    def __init__(
+        self,
+        is_regex=False,
+        early_out=False,
+        printer_fn=None,
+        use_index=False,
+        jobs=1,
+    ):
         """Instantiate function.
 
         @type is_regex: bool
@@ -61,10 +201,19 @@ class FileOwner:
         @type printer_fn: callable
         @param printer_fn: If defined, will be passed useful information for
                 printing each result as it is found.
+        @type use_index: bool
+        @param use_index: look owners up in the persistent
+                L{gentoolkit.contents.ContentsIndex} instead of reading every
+                CONTENTS file
+        @type jobs: int
+        @param jobs: number of processes reading CONTENTS files in parallel
+                when no index is used
         """
         self.is_regex = is_regex
         self.early_out = early_out
         self.printer_fn = printer_fn
+        self.use_index = use_index
+        self.jobs = jobs
 
     def __call__(self, queries):
         """Run the function.
@@ -72,36 +221,57 @@ class FileOwner:
         @type queries: iterable
         @param queries: filepaths or filepath regexes
         """
-        query_re_string = self._prepare_search_regex(queries)
-        try:
-            query_re = re.compile(query_re_string)
-        except (TypeError, re.error) as err:
-            raise errors.GentoolkitInvalidRegex(err)
-
-        use_match = False
-        if (
-            self.is_regex or query_re_string.startswith(r"^\/")
-        ) and "|" not in query_re_string:
-            # If we were passed a regex or a single path starting with root,
-            # we can use re.match, else use re.search.
+        queries = list(queries)
+        if not self.is_regex:
+            paths = self._normalize_queries(queries)
+
+        index = None
+        if self.use_index:
+            # FIXME: Remove when lazyimport supports objects:
+            from gentoolkit.contents import ContentsIndex
+
+            index = ContentsIndex.load()
+            if not self.is_regex and all(x.startswith("/") for x in paths):
+                return self.find_indexed_owners(paths, index)
+
+        if self.is_regex:
+            query_re_string = self._prepare_search_regex(queries)
+            try:
+                query_re = re.compile(query_re_string)
+            except (TypeError, re.error) as err:
+                raise errors.GentoolkitInvalidRegex(err)
+            # A single regex can use re.match, else use re.search.
+            use_match = "|" not in query_re_string
+        else:
+            # Literal paths are looked up in sets rather than being turned
+            # into one big regex alternation.
+            query_re = PathMatcher(paths)
             use_match = True
 
         pkgset = get_installed_cpvs()
 
-        return self.find_owners(query_re, use_match=use_match, pkgset=pkgset)
+        return self.find_owners(
+            query_re, use_match=use_match, pkgset=pkgset, index=index
+        )
 
-    def find_owners(self, query_re, use_match=False, pkgset=None):
+    def find_owners(self, query_re, use_match=False, pkgset=None, index=None):
         """Find owners and feed data to supplied output function.
 
-        @type query_re: _sre.SRE_Pattern
+        @type query_re: _sre.SRE_Pattern or L{PathMatcher}
         @param query_re: file regex
         @type use_match: bool
         @param use_match: use re.match or re.search
         @type pkgset: iterable or None
         @param pkgset: list of packages to look through
+        @type index: L{gentoolkit.contents.ContentsIndex} or None
+        @param index: if set, read package contents from the index
         """
         # FIXME: Remove when lazyimport supports objects:
-        from gentoolkit.package import Package
+        from gentoolkit.package import get_package
+
+        pkgs = sorted([get_package(x) for x in pkgset])
+        if index is None and self.jobs > 1:
+            return self._find_owners_parallel(pkgs, query_re, use_match)
 
         if use_match:
             query_fn = query_re.match
@@ -110,8 +280,11 @@ class FileOwner:
 
         results = []
         found_match = False
-        for pkg in sorted([Package(x) for x in pkgset]):
-            files = pkg.parsed_contents()
+        for pkg in pkgs:
+            if index is not None and pkg.cpv in index.packages:
+                files = index.contents(pkg.cpv)
+            else:
+                files = pkg.parsed_contents()
             for cfile in files:
                 match = query_fn(cfile)
                 if match:
@@ -125,6 +298,63 @@ class FileOwner:
                 break
         return results
 
+    def _find_owners_parallel(self, pkgs, query_re, use_match):
+        """Scan CONTENTS files in a pool of worker processes.
+
+        Results are collected in the order of pkgs, so output is the same as
+        for a sequential scan.
+        """
+
+        results = []
+        cpvs = [pkg.cpv for pkg in pkgs]
+        chunksize = max(1, len(cpvs) // (self.jobs * 16))
+        with multiprocessing.Pool(
+            self.jobs,
+            initializer=_init_owner_worker,
+            initargs=(query_re, use_match, self.early_out),
+        ) as pool:
+            matches = pool.imap(_scan_package_contents, cpvs, chunksize)
+            for pkg, files in zip(pkgs, matches):
+                for cfile in files:
+                    results.append((pkg, cfile))
+                    if self.printer_fn is not None:
+                        self.printer_fn(pkg, cfile)
+                    if self.early_out:
+                        # Leaving the with block terminates the workers
+                        return results
+        return results
+
+    def find_indexed_owners(self, paths, index):
+        """Find the owners of exact paths in a contents index.
+
+        Results are reported in the same order as L{find_owners} would.
+
+        @type paths: list
+        @param paths: normalized absolute file paths
+        @type index: L{gentoolkit.contents.ContentsIndex}
+        @param index: index of the installed packages
+        """
+        # FIXME: Remove when lazyimport supports objects:
+        from gentoolkit.package import get_package
+
+        matches = {}
+        for path in paths:
+            for cpv, position in index.owner_positions(path):
+                matches.setdefault(cpv, {})[position] = path
+
+        results = []
+        for pkg in sorted([get_package(x) for x in matches]):
+            # By position in CONTENTS, as find_owners reads them
+            found = matches[pkg.cpv]
+            for position in sorted(found):
+                cfile = found[position]
+                results.append((pkg, cfile))
+                if self.printer_fn is not None:
+                    self.printer_fn(pkg, cfile)
+                if self.early_out:
+                    return results
+        return results
+
     @staticmethod
     def expand_abspaths(paths):
         """Expand any relative paths (./file) to their absolute paths.
@@ -163,35 +393,92 @@ class FileOwner:
 
         return paths
 
-    def _prepare_search_regex(self, queries):
-        """Create a regex out of the queries"""
+    def _normalize_queries(self, queries):
+        """Expand, dereference and trim trailing and multiple slashes from
+        non-regex queries."""
 
-        queries = list(queries)
-        if self.is_regex:
-            return "|".join(queries)
-        else:
-            result = []
-            # Trim trailing and multiple slashes from queries
-            slashes = re.compile(r"/+")
-            queries = self.expand_abspaths(queries)
-            queries = self.extend_realpaths(queries)
-            for query in queries:
-                query = slashes.sub("/", query).rstrip("/")
-                if query.startswith("/"):
-                    query = "^%s$" % re.escape(query)
-                else:
-                    query = "/%s$" % re.escape(query)
-                result.append(query)
-        result = "|".join(result)
-        return result
+        slashes = re.compile(r"/+")
+        queries = self.expand_abspaths(list(queries))
+        queries = self.extend_realpaths(queries)
+        return [slashes.sub("/", query).rstrip("/") for query in queries]
+
+    @staticmethod
+    def _prepare_search_regex(queries):
+        """Create a regex out of the regex queries"""
+
+        return "|".join(queries)
 
 
 # =========
 # Functions
 # =========
 
+# Query function of a FileOwner worker process, see _init_owner_worker
+_owner_query = None
+
+
+def _init_owner_worker(query_re, use_match, early_out):
+    """Set up a process of FileOwner's worker pool."""
+
+    global _owner_query
+    query_fn = query_re.match if use_match else query_re.search
+    _owner_query = (query_fn, early_out)
+
+
+def _scan_package_contents(cpv):
+    """Return the files of cpv matching the worker's query, in CONTENTS
+    order."""
+
+    # FIXME: Remove when lazyimport supports objects:
+    from gentoolkit.package import Package
+
+    query_fn, early_out = _owner_query
+    result = []
+    for cfile in Package(cpv).parsed_contents():
+        if query_fn(cfile):
+            result.append(cfile)
+            if early_out:
+                break
+    return result
+
+
+_name_indexes = {}
+
+
+def get_name_index(tree="porttree"):
+    """Return the L{NameIndex} of a package database.
+
+    The index is built once per process.
+
+    @type tree: str
+    @param tree: one of "porttree", "vartree" or "bintree"
+    @rtype: L{NameIndex}
+    """
+
+    key = (portage.root, tree)
+    index = _name_indexes.get(key)
+    if index is None:
+        dbapi = portage.db[portage.root][tree].dbapi
+        index = _name_indexes[key] = NameIndex(dbapi.cp_all())
+    return index
+
+
+def _get_tree_cpvs(tree, predicate=None, cp_filter=None):
+    dbapi = portage.db[portage.root][tree].dbapi
+    if cp_filter is None:
+        cps = dbapi.cp_all()
+    else:
+        cps = cp_filter(get_name_index(tree))
+
+    if not predicate:
+        predicate = lambda x: x
 
-def get_cpvs(predicate=None, include_installed=True):
+    return iter(
+        x for x in chain.from_iterable(dbapi.cp_list(x) for x in cps) if predicate(x)
+    )
+
+
+def get_cpvs(predicate=None, include_installed=True, cp_filter=None):
     """Get all packages in the Portage tree and overlays. Optionally apply a
     predicate.
 
@@ -202,6 +489,9 @@ def get_cpvs(predicate=None, include_installed=True):
             >>> fn = lambda x: x.startswith('app-portage')
             >>> len(set(get_cpvs(fn, include_installed=False)))
             137
+            >>> prune = lambda index: index.find('app-portage')
+            >>> len(set(get_cpvs(include_installed=False, cp_filter=prune)))
+            137
 
     @type predicate: function
     @param predicate: a function to filter the package list with
@@ -209,25 +499,18 @@ def get_cpvs(predicate=None, include_installed=True):
     @param include_installed:
             If True: Return the union of all_cpvs and all_installed_cpvs
             If False: Return the difference of all_cpvs and all_installed_cpvs
+    @type cp_filter: function
+    @param cp_filter: a function returning the cps to look at from the
+            L{NameIndex} of a tree, to avoid listing the versions of all
+            packages when the predicate can only match a few of them
     @rtype: generator
     @return: a generator that yields unsorted cat/pkg-ver strings from the
             Portage tree
     """
 
-    if not predicate:
-        predicate = lambda x: x
+    all_cpvs = _get_tree_cpvs("porttree", predicate, cp_filter)
 
-    all_cps = portage.db[portage.root]["porttree"].dbapi.cp_all()
-
-    all_cpvs = iter(
-        x
-        for x in chain.from_iterable(
-            portage.db[portage.root]["porttree"].dbapi.cp_list(x) for x in all_cps
-        )
-        if predicate(x)
-    )
-
-    all_installed_cpvs = set(get_installed_cpvs(predicate))
+    all_installed_cpvs = set(get_installed_cpvs(predicate, cp_filter))
 
     if include_installed:
         for cpv in all_cpvs:
@@ -245,56 +528,83 @@ def get_cpvs(predicate=None, include_installed=True):
 get_uninstalled_cpvs = partial(get_cpvs, include_installed=False)
 
 
-def get_installed_cpvs(predicate=None):
+def get_installed_cpvs(predicate=None, cp_filter=None):
     """Get all installed packages. Optionally apply a predicate.
 
     @type predicate: function
     @param predicate: a function to filter the package list with
+    @type cp_filter: function
+    @param cp_filter: see L{get_cpvs}
     @rtype: generator
     @return: a generator that yields unsorted installed cat/pkg-ver strings
             from VARDB
     """
 
-    if not predicate:
-        predicate = lambda x: x
-
-    installed_cps = portage.db[portage.root]["vartree"].dbapi.cp_all()
-
-    installed_cpvs = iter(
-        x
-        for x in chain.from_iterable(
-            portage.db[portage.root]["vartree"].dbapi.cp_list(x) for x in installed_cps
-        )
-        if predicate(x)
-    )
-
-    yield from installed_cpvs
+    yield from _get_tree_cpvs("vartree", predicate, cp_filter)
 
 
-def get_bintree_cpvs(predicate=None):
+def get_bintree_cpvs(predicate=None, cp_filter=None):
     """Get all binary packages available. Optionally apply a predicate.
 
     @type predicate: function
     @param predicate: a function to filter the package list with
+    @type cp_filter: function
+    @param cp_filter: see L{get_cpvs}
     @rtype: generator
     @return: a generator that yields unsorted binary package cat/pkg-ver strings
             from BINDB
     """
 
-    if not predicate:
-        predicate = lambda x: x
+    yield from _get_tree_cpvs("bintree", predicate, cp_filter)
 
-    installed_cps = portage.db[portage.root]["bintree"].dbapi.cp_all()
 
-    installed_cpvs = iter(
-        x
-        for x in chain.from_iterable(
-            portage.db[portage.root]["bintree"].dbapi.cp_list(x) for x in installed_cps
-        )
-        if predicate(x)
-    )
+def get_sorted_cpvs(
+    include=("porttree", "vartree"), exclude=(), predicate=None, cp_filter=None
+):
+    """Get packages from several trees, one cat/pkg at a time.
 
-    yield from installed_cpvs
+    Unlike the other get_*_cpvs functions the cpvs are yielded in the order
+    L{gentoolkit.cpv.CPV} objects sort in, and the versions of a package
+    are only listed when the previous package is done, so the first results
+    are available right away.
+
+    Example usage:
+            >>> from gentoolkit.helpers import get_sorted_cpvs
+            >>> uninstalled = get_sorted_cpvs(include=('porttree',), exclude=('vartree',))
+            >>> next(uninstalled)
+            'acct-group/abrt-0-r3'
+
+    @type include: tuple
+    @param include: trees to take packages from
+    @type exclude: tuple
+    @param exclude: trees whose packages are left out
+    @type predicate: function
+    @param predicate: a function to filter the package list with
+    @type cp_filter: function
+    @param cp_filter: see L{get_cpvs}
+    @rtype: generator
+    @return: a generator that yields sorted cat/pkg-ver strings
+    """
+
+    cps = set()
+    for tree in include:
+        if cp_filter is None:
+            cps.update(get_name_index(tree).cps)
+        else:
+            cps.update(cp_filter(get_name_index(tree)))
+
+    include = [portage.db[portage.root][x].dbapi for x in include]
+    exclude = [portage.db[portage.root][x].dbapi for x in exclude]
+    for cp in sorted(cps, key=lambda x: x.split("/", 1)):
+        cpvs = set()
+        for dbapi in include:
+            cpvs.update(dbapi.cp_list(cp))
+        for dbapi in exclude:
+            cpvs.difference_update(dbapi.cp_list(cp))
+        start = len(cp) + 1
+        for cpv in sorted(cpvs, key=lambda x: version_sort_key(x[start:])):
+            if predicate is None or predicate(cpv):
+                yield cpv
 
 
 def print_file(path):
@@ -23,8 +23,6 @@ from os.path import join, basename
 from sys import stderr, stdout
 from os import stat
 from time import time
-from xml.dom import minidom, NotFoundErr
-from xml.parsers.expat import ExpatError
 
 # TODO: just import needed stuff to safe memory/time and maybe use "as foo"
 import portage
@@ -33,6 +31,8 @@ import portage.versions
 from optparse import OptionParser
 from time import gmtime, strftime
 
+from gentoolkit.metadata import get_metadata_cache
+
 # override/change portage module settings
 
 
@@ -136,40 +136,15 @@ def show_result(conf, pkgs):
         out.close()
 
 
-def _get_metadata(metadata, element, tag):
-    values = []
-
-    try:
-        metadatadom = minidom.parse(metadata)
-    except ExpatError as e:
-        raise ExpatError(
-            "%s: %s"
-            % (
-                metadata,
-                e,
-            )
-        )
-
-    try:
-        elements = metadatadom.getElementsByTagName(element)
-        if not elements:
-            return values
-    except NotFoundErr:
-        return values
-
-    try:
-        for _element in elements:
-            node = _element.getElementsByTagName(tag)
-
-            try:
-                values.append(node[0].childNodes[0].data)
-            except IndexError:
-                pass
-    except NotFoundErr:
-        raise NotFoundErr("%s: Malformed input: missing 'flag' tag(s)" % (metadata))
+def _get_maintainer_emails(metadata):
+    parsed = get_metadata_cache().get(metadata)
+    if parsed is None:
+        return []
 
-    metadatadom.unlink()
-    return values
+    maintainers = list(parsed.maintainers())
+    for upstream in parsed.upstream():
+        maintainers.extend(upstream.maintainers)
+    return [x.email for x in maintainers if x.email]
 
 
 def is_maintainer(maintainer, metadata):
@@ -180,7 +155,7 @@ def is_maintainer(maintainer, metadata):
 
     mtainer = maintainer.split(",")
 
-    data = _get_metadata(metadata, "maintainer", "email")
+    data = _get_maintainer_emails(metadata)
 
     if not data and len(maintainer) == 0:
         return True
@@ -536,6 +511,7 @@ def main():
     # append to our existing
     conf = get_settings(conf)
     pkgs = get_packages(conf)
+    get_metadata_cache().save()
     pkgs = get_imlate(conf, pkgs)
 
     show_result(conf, pkgs)
@@ -0,0 +1,379 @@
+# Copyright(c) 2026, Gentoo Authors
+#
+# Licensed under the GNU General Public License, v2
+
+"""Provides a persistent cache of parsed metadata.xml files.
+
+Parsing a metadata.xml with L{portage.xml.metadata.MetaDataXML} builds a full
+ElementTree, which adds up when maintainers or USE flags are looked up for a
+large part of the tree. L{MetaDataCache} keeps the parsed contents as compact
+L{MetaData} objects in gentoolkit's cache directory and only parses a file
+again when its mtime or size, or those of the projects.xml its herd emails
+come from, changed.
+
+Example usage:
+    >>> from gentoolkit.metadata import get_metadata_cache
+    >>> cache = get_metadata_cache()
+    >>> metadata = cache.get('/var/db/repos/gentoo/app-portage/gentoolkit/metadata.xml')
+    >>> metadata.maintainers()
+    (<Maintainer 'tools-portage@gentoo.org'>,)
+    >>> cache.save()
+    True
+"""
+
+__all__ = (
+    "Maintainer",
+    "MetaData",
+    "MetaDataCache",
+    "Upstream",
+    "UseFlag",
+    "get_metadata_cache",
+)
+__docformat__ = "epytext"
+
+# =======
+# Imports
+# =======
+
+import errno
+import os
+
+import portage
+from portage import _encodings, _unicode_encode
+from portage.xml.metadata import MetaDataXML
+
+from gentoolkit.cache import read_cache, write_cache
+
+# =======
+# Globals
+# =======
+
+_metadata_cache = None
+
+# =======
+# Classes
+# =======
+
+
+class Maintainer:
+    """A <maintainer> entry, see L{portage.xml.metadata._Maintainer}."""
+
+    __slots__ = ("email", "name", "description", "maint_type", "restrict", "status")
+
+    def __init__(
+        self,
+        email=None,
+        name=None,
+        description=None,
+        maint_type=None,
+        restrict=None,
+        status=None,
+    ):
+        self.email = email
+        self.name = name
+        self.description = description
+        self.maint_type = maint_type
+        self.restrict = restrict
+        self.status = status
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.email!r}>"
+
+    @classmethod
+    def from_xml(cls, maintainer):
+        return cls(
+            maintainer.email,
+            maintainer.name,
+            maintainer.description,
+            maintainer.maint_type,
+            maintainer.restrict,
+            maintainer.status,
+        )
+
+
+class UseFlag:
+    """A local USE flag, see L{portage.xml.metadata._Useflag}."""
+
+    __slots__ = ("name", "restrict", "description")
+
+    def __init__(self, name, restrict=None, description=""):
+        self.name = name
+        self.restrict = restrict
+        self.description = description
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.name!r}>"
+
+
+class Upstream:
+    """An <upstream> entry, see L{portage.xml.metadata._Upstream}."""
+
+    __slots__ = ("maintainers", "changelogs", "docs", "bugtrackers", "remoteids")
+
+    def __init__(
+        self, maintainers=(), changelogs=(), docs=(), bugtrackers=(), remoteids=()
+    ):
+        self.maintainers = maintainers
+        self.changelogs = changelogs
+        self.docs = docs
+        self.bugtrackers = bugtrackers
+        self.remoteids = remoteids
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.remoteids!r}>"
+
+
+class MetaData:
+    """The parsed contents of a metadata.xml.
+
+    Provides the same accessors as L{portage.xml.metadata.MetaDataXML}, but
+    holds plain tuples instead of an ElementTree so it can be pickled cheaply.
+    """
+
+    __slots__ = (
+        "metadata_xml_path",
+        "_herds",
+        "_descriptions",
+        "_maintainers",
+        "_useflags",
+        "_upstream",
+        "_stabilize_allarches",
+    )
+
+    def __init__(
+        self,
+        metadata_xml_path,
+        herds=(),
+        descriptions=(),
+        maintainers=(),
+        useflags=(),
+        upstream=(),
+        stabilize_allarches=False,
+    ):
+        self.metadata_xml_path = metadata_xml_path
+        self._herds = herds
+        self._descriptions = descriptions
+        self._maintainers = maintainers
+        self._useflags = useflags
+        self._upstream = upstream
+        self._stabilize_allarches = stabilize_allarches
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.metadata_xml_path!r}>"
+
+    @classmethod
+    def parse(cls, metadata_xml_path, projects_path):
+        """Parse a metadata.xml file.
+
+        @type metadata_xml_path: str
+        @param metadata_xml_path: path to a valid metadata.xml file
+        @type projects_path: str
+        @param projects_path: path to the repository's projects.xml
+        @rtype: L{MetaData}
+        @raise OSError: if C{metadata_xml_path} can not be read
+        """
+
+        xml = MetaDataXML(metadata_xml_path, projects_path)
+        return cls(
+            metadata_xml_path,
+            herds=xml.herds(include_email=True),
+            descriptions=xml.descriptions(),
+            maintainers=tuple(Maintainer.from_xml(x) for x in xml.maintainers()),
+            useflags=tuple(
+                UseFlag(x.name, x.restrict, x.description) for x in xml.use()
+            ),
+            upstream=tuple(
+                Upstream(
+                    tuple(Maintainer.from_xml(x) for x in upstream.maintainers),
+                    tuple(upstream.changelogs),
+                    tuple(upstream.docs),
+                    tuple(upstream.bugtrackers),
+                    tuple(upstream.remoteids),
+                )
+                for upstream in xml.upstream()
+            ),
+            stabilize_allarches=_has_stabilize_allarches(xml),
+        )
+
+    def herds(self, include_email=False):
+        """Return the <herd> entries.
+
+        @type include_email: bool
+        @keyword include_email: if True, return (herd, email) tuples
+        @rtype: tuple
+        """
+
+        if include_email:
+            return self._herds
+        return tuple(herd for herd, _email in self._herds)
+
+    def descriptions(self):
+        """Return the <longdescription> texts.
+
+        @rtype: tuple
+        """
+
+        return self._descriptions
+
+    def maintainers(self):
+        """Return the maintainers in document order.
+
+        @rtype: tuple
+        @return: L{Maintainer} objects
+        """
+
+        return self._maintainers
+
+    def use(self):
+        """Return the local USE flags in document order.
+
+        @rtype: tuple
+        @return: L{UseFlag} objects
+        """
+
+        return self._useflags
+
+    def upstream(self):
+        """Return the upstream entries in document order.
+
+        @rtype: tuple
+        @return: L{Upstream} objects
+        """
+
+        return self._upstream
+
+    def stabilize_allarches(self):
+        """Return True if the package may be stabilized on all arches at once.
+
+        @rtype: bool
+        """
+
+        return self._stabilize_allarches
+
+    format_maintainer_string = MetaDataXML.format_maintainer_string
+    format_upstream_string = MetaDataXML.format_upstream_string
+
+
+class MetaDataCache:
+    """Parsed metadata.xml files, validated by file mtime and size.
+
+    Herd emails are resolved through projects.xml when parsing, so its path,
+    mtime and size are part of the stamp of every entry as well.
+
+    @type entries: dict
+    @ivar entries: {metadata.xml path: ((mtime_ns, size, projects.xml path,
+            projects.xml (mtime_ns, size)), L{MetaData})}
+    """
+
+    cache_name = "metadata"
+
+    def __init__(self, entries=None):
+        self.entries = entries if entries is not None else {}
+        self.changed = False
+        # projects.xml is stat'ed once per path, not for every metadata.xml
+        self._projects_stamps = {}
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {len(self.entries)} files>"
+
+    def __len__(self):
+        return len(self.entries)
+
+    @classmethod
+    def load(cls):
+        """Return the stored cache, or an empty one.
+
+        @rtype: L{MetaDataCache}
+        """
+
+        cached = read_cache(cls.cache_name)
+        if cached is None:
+            return cls()
+        return cls(cached)
+
+    def save(self):
+        """Store the cache in the cache directory if anything was parsed.
+
+        @rtype: bool
+        @return: True if the cache was written
+        """
+
+        if not self.changed:
+            return False
+        if write_cache(self.cache_name, self.entries):
+            self.changed = False
+            return True
+        return False
+
+    def get(self, metadata_xml_path, projects_path=None):
+        """Return the parsed metadata.xml, parsing it if it changed.
+
+        @type metadata_xml_path: str
+        @param metadata_xml_path: path to a metadata.xml file
+        @type projects_path: str
+        @param projects_path: path to projects.xml, defaults to the one in
+                PORTDIR
+        @rtype: L{MetaData} or None
+        @return: None if the file does not exist
+        """
+
+        try:
+            st = os.stat(_unicode_encode(metadata_xml_path, encoding=_encodings["fs"]))
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+            return None
+
+        if projects_path is None:
+            projects_path = os.path.join(
+                portage.settings["PORTDIR"], "metadata/projects.xml"
+            )
+        projects_stamp = self._projects_stamps.get(projects_path)
+        if projects_stamp is None:
+            try:
+                projects_st = os.stat(
+                    _unicode_encode(projects_path, encoding=_encodings["fs"])
+                )
+            except OSError:
+                projects_stamp = ()
+            else:
+                projects_stamp = (projects_st.st_mtime_ns, projects_st.st_size)
+            self._projects_stamps[projects_path] = projects_stamp
+
+        stamp = (st.st_mtime_ns, st.st_size, projects_path, projects_stamp)
+        cached = self.entries.get(metadata_xml_path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        metadata = MetaData.parse(metadata_xml_path, projects_path)
+        self.entries[metadata_xml_path] = (stamp, metadata)
+        self.changed = True
+        return metadata
+
+
+# =========
+# Functions
+# =========
+
+
+def get_metadata_cache():
+    """Return the metadata.xml cache shared by all packages.
+
+    @rtype: L{MetaDataCache}
+    """
+
+    global _metadata_cache
+    if _metadata_cache is None:
+        _metadata_cache = MetaDataCache.load()
+    return _metadata_cache
+
+
+def _has_stabilize_allarches(xml):
+    # MetaDataXML has no accessor for <stabilize-allarches/>, use the tree it
+    # already parsed rather than reading the file again
+    if xml._xml_tree is None:
+        return False
+    return xml._xml_tree.find("stabilize-allarches") is not None
+
+
+# vim: set ts=4 sw=4 tw=79:
@@ -20,7 +20,17 @@ Example usage:
 	False
 """
 
-__all__ = ("Package", "PackageFormatter", "FORMAT_TMPL_VARS")
+__all__ = (
+    "Package",
+    "PackageFormatter",
+    "get_package",
+    "FORMAT_TMPL_VARS",
+    "ENVIRONMENT_CACHE_STATS",
+    "prefetch_environment",
+    "format_environment_keys",
+    "get_mask_status",
+    "get_mask_reason",
+)
 
 # =======
 # Globals
@@ -42,11 +52,23 @@ FORMAT_TMPL_VARS = (
     "$keywords",
 )
 
+# Package.environment keys needed to fill in the FORMAT_TMPL_VARS
+FORMAT_TMPL_ENVIRONMENT = {
+    "$slot": "SLOT",
+    "$keywords": "KEYWORDS",
+    "$mask2": "KEYWORDS",
+    "$repo": "repository",
+}
+
+# Hits and misses of the Package.environment cache, useful for profiling
+ENVIRONMENT_CACHE_STATS = {"hits": 0, "misses": 0}
+
 # =======
 # Imports
 # =======
 
 import os
+import weakref
 from string import Template
 
 import portage
@@ -55,10 +77,11 @@ from portage import _encodings, _unicode_encode
 
 import gentoolkit.pprinter as pp
 from gentoolkit import errors
-from gentoolkit.cpv import CPV
+from gentoolkit.cpv import BaseCPV, CPV
 from gentoolkit.keyword import determine_keyword
 from gentoolkit.flag import get_flags
 from gentoolkit.eprefix import EPREFIX
+from gentoolkit.repomap import get_repository_map
 
 # =======
 # Settings
@@ -76,8 +99,42 @@ def _NewPortageConfig(local_config):
     return ret
 
 
-default_settings = _NewPortageConfig(local_config=True)
-nolocal_settings = _NewPortageConfig(local_config=False)
+# Building a config is expensive, so they are only created on first use.
+_portage_configs = {}
+
+# Packages still referenced somewhere by (cpv, local_config), see get_package
+_package_pool = weakref.WeakValueDictionary()
+
+# portage.getmaskingstatus and getmaskingreason results by settings object
+# and cpv, see get_mask_status and get_mask_reason. Keyed weakly on the
+# settings themselves, as the id of a freed config can be reused.
+_mask_status_cache = weakref.WeakKeyDictionary()
+_mask_reason_cache = weakref.WeakKeyDictionary()
+
+
+def get_settings(local_config=True):
+    """Return the shared, locked L{portage.config} used by Package objects.
+
+    @type local_config: bool
+    @param local_config: whether /etc/portage is taken into account
+    """
+
+    try:
+        return _portage_configs[local_config]
+    except KeyError:
+        settings = _portage_configs[local_config] = _NewPortageConfig(local_config)
+        return settings
+
+
+def __getattr__(name):
+    # Keep the old module attributes working without building both configs
+    # at import time.
+    if name == "default_settings":
+        return get_settings(local_config=True)
+    if name == "nolocal_settings":
+        return get_settings(local_config=False)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # =======
 # Classes
@@ -87,9 +144,22 @@ nolocal_settings = _NewPortageConfig(local_config=False)
 class Package(CPV):
     """Exposes the state of a given CPV."""
 
+    # Tens of thousands of these can be alive at once, keep the lazily
+    # filled state out of the instance dict.
+    __slots__ = (
+        "_local_config",
+        "_environment",
+        "_dblink",
+        "_metadata",
+        "_deps",
+        "_portdir_path",
+    )
+
     def __init__(self, cpv, validate=False, local_config=True):
-        if isinstance(cpv, CPV):
-            self.__dict__.update(cpv.__dict__)
+        if isinstance(cpv, BaseCPV):
+            self.cpv = cpv.cpv
+            self._chunks = cpv._chunks
+            self.validate = cpv.validate
         else:
             CPV.__init__(self, cpv, validate=validate)
 
@@ -97,13 +167,10 @@ class Package(CPV):
             # CPV allows some things that Package must not
             raise errors.GentoolkitInvalidPackage(self.cpv)
 
-        if local_config:
-            self._settings = default_settings
-        else:
-            self._settings = nolocal_settings
+        self._local_config = local_config
 
         # Set dynamically
-        self._package_path = None
+        self._environment = None
         self._dblink = None
         self._metadata = None
         self._deps = None
@@ -121,26 +188,27 @@ class Package(CPV):
     def __str__(self):
         return str(self.cpv)
 
+    @property
+    def _settings(self):
+        return get_settings(self._local_config)
+
     @property
     def metadata(self):
-        """Instantiate a L{portage.xml.MetaDataXML} object here."""
+        """Return the parsed metadata.xml of the package.
 
-        from portage.xml.metadata import MetaDataXML
+        @rtype: L{gentoolkit.metadata.MetaData} or None
+        @return: None if the package has no metadata.xml, see
+                L{gentoolkit.metadata.MetaDataCache}
+        """
 
         if self._metadata is None:
+            from gentoolkit.metadata import get_metadata_cache
+
             metadata_path = os.path.join(self.package_path(), "metadata.xml")
             projects_path = os.path.join(
                 self._settings["PORTDIR"], "metadata/projects.xml"
             )
-
-            try:
-                self._metadata = MetaDataXML(metadata_path, projects_path)
-            except OSError as error:
-                import errno
-
-                if error.errno != errno.ENOENT:
-                    raise
-                return None
+            self._metadata = get_metadata_cache().get(metadata_path, projects_path)
 
         return self._metadata
 
@@ -169,6 +237,11 @@ class Package(CPV):
 
         return self._deps
 
+    def _environment_cache(self, key):
+        if self._environment is None:
+            self._environment = {}
+        return self._environment.setdefault(key, {})
+
     def environment(self, envvars, prefer_vdb=True, fallback=True):
         """Returns one or more of the predefined environment variables.
 
@@ -201,12 +274,23 @@ class Package(CPV):
         @rtype: str or list
         @return: str if envvars is str, list if envvars is array
         @raise KeyError: if key is not found in requested db(s)
+        @note: results are cached on the package, see L{prefetch_environment}
         """
 
         got_string = False
         if isinstance(envvars, str):
             got_string = True
             envvars = (envvars,)
+
+        cache = self._environment_cache((prefer_vdb, fallback))
+        if all(x in cache for x in envvars):
+            ENVIRONMENT_CACHE_STATS["hits"] += 1
+            result = [cache[x] for x in envvars]
+            if got_string:
+                return result[0]
+            return result
+        ENVIRONMENT_CACHE_STATS["misses"] += 1
+
         if prefer_vdb:
             try:
                 result = portage.db[portage.root]["vartree"].dbapi.aux_get(
@@ -240,6 +324,7 @@ class Package(CPV):
                         "aux_get returned unexpected " "results"
                     )
 
+        cache.update(zip(envvars, result))
         if got_string:
             return result[0]
         return result
@@ -262,7 +347,7 @@ class Package(CPV):
         return result
 
     def mask_status(self):
-        """Shortcut to L{portage.getmaskingstatus}.
+        """Shortcut to L{portage.getmaskingstatus}, see L{get_mask_status}.
 
         @rtype: None or list
         @return: a list containing none or some of:
@@ -273,44 +358,17 @@ class Package(CPV):
                 'missing keyword'
         """
 
-        if self._settings.locked:
-            self._settings.unlock()
-        try:
-            result = portage.getmaskingstatus(
-                self.cpv,
-                settings=self._settings,
-                portdb=portage.db[portage.root]["porttree"].dbapi,
-            )
-        except KeyError:
-            # getmaskingstatus doesn't support packages without ebuilds in the
-            # Portage tree.
-            result = None
-
-        return result
+        return get_mask_status(self.cpv, self._settings)
 
     def mask_reason(self):
-        """Shortcut to L{portage.getmaskingreason}.
+        """Shortcut to L{portage.getmaskingreason}, see L{get_mask_reason}.
 
         @rtype: None or tuple
         @return: empty tuple if pkg not masked OR
                 ('mask reason', 'mask location')
         """
 
-        try:
-            result = portage.getmaskingreason(
-                self.cpv,
-                settings=self._settings,
-                portdb=portage.db[portage.root]["porttree"].dbapi,
-                return_location=True,
-            )
-            if result is None:
-                result = tuple()
-        except KeyError:
-            # getmaskingstatus doesn't support packages without ebuilds in the
-            # Portage tree.
-            result = None
-
-        return result
+        return get_mask_reason(self.cpv, self._settings)
 
     def ebuild_path(self, in_vartree=False):
         """Returns the complete path to the .ebuild file.
@@ -556,12 +614,13 @@ class PackageFormatter:
                 'I-O' : Installed and from an overlay
         """
 
+        repomap = get_repository_map()
         result = ["-", "-", "-"]
 
-        if self.pkg.is_installed():
+        if repomap.is_installed(self.pkg):
             result[0] = "I"
 
-        overlay = self.pkg.is_overlay()
+        overlay = repomap.is_overlay(self.pkg)
         if overlay is None:
             pass
         elif overlay:
@@ -649,4 +708,185 @@ class PackageFormatter:
             return value
 
 
+# =========
+# Functions
+# =========
+
+
+def get_package(cpv, local_config=True):
+    """Return the Package for cpv, sharing it with all other callers.
+
+    Bulk queries create a Package for the same version over and over, e.g.
+    once for every package depending on it. As long as one of them is
+    referenced the same instance is handed out, so duplicates take no memory
+    and share the environment, dblink and metadata caches.
+
+    Example usage:
+            >>> from gentoolkit.package import get_package
+            >>> get_package('sys-apps/portage-9999') is get_package(
+            ...     'sys-apps/portage-9999')
+            True
+
+    @type cpv: str or L{gentoolkit.cpv.CPV}
+    @type local_config: bool
+    @param local_config: see L{Package}
+    @rtype: L{Package}
+    """
+
+    key = (cpv.cpv if isinstance(cpv, BaseCPV) else cpv, local_config)
+    pkg = _package_pool.get(key)
+    if pkg is None:
+        pkg = Package(cpv, local_config=local_config)
+        _package_pool[key] = pkg
+    return pkg
+
+
+def prefetch_environment(pkgs, envvars, prefer_vdb=True, fallback=True):
+    """Fetch the same environment variables for many packages at once.
+
+    Every db is queried in one pass over the packages still missing, and the
+    results are stored on the packages, so that later calls to
+    L{Package.environment} with the same prefer_vdb and fallback arguments
+    are answered from memory. Packages that are in neither db are skipped;
+    L{Package.environment} will raise for them as usual.
+
+    Example usage:
+            >>> from gentoolkit.package import Package, prefetch_environment
+            >>> pkgs = [Package('sys-apps/portage-9999')]
+            >>> prefetch_environment(pkgs, ('SLOT', 'KEYWORDS'))
+            >>> pkgs[0].environment('SLOT')
+            '0'
+
+    @type pkgs: iterable
+    @param pkgs: L{Package} objects
+    @type envvars: iterable
+    @param envvars: see L{Package.environment}
+    @type prefer_vdb: bool
+    @keyword prefer_vdb: see L{Package.environment}
+    @type fallback: bool
+    @keyword fallback: see L{Package.environment}
+    """
+
+    envvars = tuple(envvars)
+    dbs = ["vartree", "porttree"]
+    if not prefer_vdb:
+        dbs.reverse()
+    if not fallback:
+        del dbs[1:]
+
+    cache_key = (prefer_vdb, fallback)
+    pending = []
+    for pkg in pkgs:
+        cache = pkg._environment_cache(cache_key)
+        if not all(x in cache for x in envvars):
+            pending.append(pkg)
+
+    for db in dbs:
+        dbapi = portage.db[portage.root][db].dbapi
+        missing = []
+        for pkg in pending:
+            try:
+                result = dbapi.aux_get(pkg.cpv, envvars)
+            except KeyError:
+                missing.append(pkg)
+                continue
+            pkg._environment_cache(cache_key).update(zip(envvars, result))
+        pending = missing
+
+
+def get_mask_status(cpv, settings=None):
+    """Memoized L{portage.getmaskingstatus} against the Portage tree.
+
+    Results are kept for the life of the process, per cpv and settings
+    object.
+
+    @type cpv: str
+    @type settings: L{portage.config}
+    @param settings: defaults to L{get_settings}
+    @rtype: None or list
+    @return: see L{Package.mask_status}, None if the Portage tree has no
+            ebuild for cpv
+    """
+
+    if settings is None:
+        settings = get_settings()
+    cache = _mask_status_cache.setdefault(settings, {})
+    try:
+        result = cache[cpv]
+    except KeyError:
+        # getmaskingstatus may have to setcpv() for USE conditional licenses
+        if settings.locked:
+            settings.unlock()
+        try:
+            result = portage.getmaskingstatus(
+                cpv,
+                settings=settings,
+                portdb=portage.db[portage.root]["porttree"].dbapi,
+            )
+        except KeyError:
+            # getmaskingstatus doesn't support packages without ebuilds in the
+            # Portage tree.
+            result = None
+        else:
+            result = tuple(result)
+        cache[cpv] = result
+
+    if result is None:
+        return None
+    return list(result)
+
+
+def get_mask_reason(cpv, settings=None):
+    """Memoized L{portage.getmaskingreason} against the Portage tree.
+
+    @type cpv: str
+    @type settings: L{portage.config}
+    @param settings: defaults to L{get_settings}
+    @rtype: None or tuple
+    @return: see L{Package.mask_reason}
+    """
+
+    if settings is None:
+        settings = get_settings()
+    cache = _mask_reason_cache.setdefault(settings, {})
+    try:
+        return cache[cpv]
+    except KeyError:
+        pass
+
+    try:
+        result = portage.getmaskingreason(
+            cpv,
+            settings=settings,
+            portdb=portage.db[portage.root]["porttree"].dbapi,
+            return_location=True,
+        )
+        if result is None:
+            result = tuple()
+    except KeyError:
+        # getmaskingstatus doesn't support packages without ebuilds in the
+        # Portage tree.
+        result = None
+
+    cache[cpv] = result
+    return result
+
+
+def format_environment_keys(do_format=True, custom_format=None):
+    """Return the L{Package.environment} keys a L{PackageFormatter} created
+    with the same arguments will look up, for L{prefetch_environment}.
+
+    @rtype: list
+    """
+
+    if not custom_format:
+        if do_format:
+            custom_format = PackageFormatter._tmpl_verbose
+        else:
+            custom_format = PackageFormatter._tmpl_quiet
+    return sorted(
+        {key for var, key in FORMAT_TMPL_ENVIRONMENT.items() if var in custom_format}
+    )
+
+
 # vim: set ts=4 sw=4 tw=79:
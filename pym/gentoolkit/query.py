@@ -24,18 +24,28 @@ from gentoolkit import errors
 from gentoolkit import helpers
 from gentoolkit import pprinter as pp
 from gentoolkit.atom import Atom
-from gentoolkit.cpv import CPV
-from gentoolkit.package import Package
+from gentoolkit.cpv import BaseCPV, CPV
+from gentoolkit.package import get_mask_status, get_package
+from gentoolkit.repomap import get_repository_map
 from gentoolkit.sets import get_set_atoms, SETPREFIX
 
+# =======
+# Globals
+# =======
+
+_glob_chars_re = re.compile(r"[*?[]")
+
 # =======
 # Classes
 # =======
 
 
-class Query(CPV):
+class Query(BaseCPV):
     """Provides common methods on a package query."""
 
+    # See gentoolkit.atom.Atom.intersects
+    _intersect_key = None
+
     def __init__(self, query, is_regex=False):
         """Create query object.
 
@@ -63,7 +73,7 @@ class Query(CPV):
                 atom = Atom(self.query)
                 self.__dict__.update(atom.__dict__)
             except errors.GentoolkitInvalidAtom:
-                CPV.__init__(self, self.query)
+                BaseCPV.__init__(self, self.query)
                 self.operator = ""
                 self.atom = self.cpv
 
@@ -133,45 +143,130 @@ class Query(CPV):
         @return: Package objects matching query
         """
 
+        simple_package_finder, complex_package_finder = self._get_package_finders(
+            in_installed, in_porttree, in_overlay, include_masked
+        )
+
+        if self.query_type == "set":
+            self.package_finder = simple_package_finder
+            matches = self._do_set_lookup(show_progress=show_progress)
+        elif self.query_type == "simple":
+            self.package_finder = simple_package_finder
+            matches = self._do_simple_lookup(
+                in_installed=in_installed, show_progress=show_progress
+            )
+        else:
+            self.package_finder = complex_package_finder
+            matches = self._do_complex_lookup(show_progress=show_progress)
+
+        if self.repo_filter is not None:
+            matches = self._filter_by_repository(matches)
+
+        if no_matches_fatal and not matches:
+            ii = in_installed and not (in_porttree or in_overlay)
+            raise errors.GentoolkitNoMatches(self.query, in_installed=ii)
+        return matches
+
+    def iter_find(
+        self,
+        in_installed=True,
+        in_porttree=True,
+        in_overlay=True,
+        include_masked=True,
+        show_progress=True,
+        no_matches_fatal=True,
+        **kwargs,
+    ):
+        """Like L{smart_find}, but yield the matches as they are found.
+
+        Matches come in sorted order, and for globs and regular expressions
+        the tree is read one package at a time, so output can start right
+        away and whole-tree queries never hold every Package at once.
+
+        Example usage:
+                >>> from gentoolkit.query import Query
+                >>> for pkg in Query('*').iter_find(show_progress=False):
+                ...     print(pkg.cpv)
+                ...     break
+                acct-group/abrt-0-r3
+
+        @see: L{smart_find} for the arguments
+        @rtype: generator
+        @return: Package objects matching query
+        @raise errors.GentoolkitNoMatches: once the generator is exhausted,
+                if nothing matched and no_matches_fatal is set
+        """
+
+        simple_package_finder, complex_package_finder = self._get_package_finders(
+            in_installed, in_porttree, in_overlay, include_masked, sort=True
+        )
+
+        if self.query_type == "set":
+            self.package_finder = simple_package_finder
+            matches = sorted(self._do_set_lookup(show_progress=show_progress))
+        elif self.query_type == "simple":
+            self.package_finder = simple_package_finder
+            matches = sorted(
+                self._do_simple_lookup(
+                    in_installed=in_installed, show_progress=show_progress
+                )
+            )
+        else:
+            self.package_finder = complex_package_finder
+            matches = self._iter_complex_lookup(show_progress=show_progress)
+
+        if self.repo_filter is not None:
+            matches = self._filter_by_repository(matches, lazy=True)
+
+        got_match = False
+        for pkg in matches:
+            got_match = True
+            yield pkg
+
+        if no_matches_fatal and not got_match:
+            ii = in_installed and not (in_porttree or in_overlay)
+            raise errors.GentoolkitNoMatches(self.query, in_installed=ii)
+
+    def _get_package_finders(
+        self, in_installed, in_porttree, in_overlay, include_masked, sort=False
+    ):
+        """Return the functions for simple and complex lookups in the
+        selected package databases.
+
+        @type sort: bool
+        @param sort: let the complex finder yield sorted cpvs
+        @rtype: tuple
+        @return: (simple_package_finder, complex_package_finder)
+        """
+
         if in_installed:
             if in_porttree or in_overlay:
                 simple_package_finder = partial(
                     self.find, include_masked=include_masked
                 )
                 complex_package_finder = helpers.get_cpvs
+                trees = ("porttree", "vartree"), ()
             else:
                 simple_package_finder = self.find_installed
                 complex_package_finder = helpers.get_installed_cpvs
+                trees = ("vartree",), ()
         elif in_porttree or in_overlay:
             simple_package_finder = partial(
                 self.find, include_masked=include_masked, in_installed=False
             )
             complex_package_finder = helpers.get_uninstalled_cpvs
+            trees = ("porttree",), ("vartree",)
         else:
             raise errors.GentoolkitFatalError(
                 "Not searching in installed, Portage tree, or overlay. "
                 "Nothing to do."
             )
 
-        if self.query_type == "set":
-            self.package_finder = simple_package_finder
-            matches = self._do_set_lookup(show_progress=show_progress)
-        elif self.query_type == "simple":
-            self.package_finder = simple_package_finder
-            matches = self._do_simple_lookup(
-                in_installed=in_installed, show_progress=show_progress
+        if sort:
+            complex_package_finder = partial(
+                helpers.get_sorted_cpvs, include=trees[0], exclude=trees[1]
             )
-        else:
-            self.package_finder = complex_package_finder
-            matches = self._do_complex_lookup(show_progress=show_progress)
-
-        if self.repo_filter is not None:
-            matches = self._filter_by_repository(matches)
-
-        if no_matches_fatal and not matches:
-            ii = in_installed and not (in_porttree or in_overlay)
-            raise errors.GentoolkitNoMatches(self.query, in_installed=ii)
-        return matches
+        return simple_package_finder, complex_package_finder
 
     def find(self, in_installed=True, include_masked=True):
         """Returns a list of Package objects that matched the query.
@@ -201,7 +296,7 @@ class Query(CPV):
             )
             raise errors.GentoolkitInvalidAtom(message)
 
-        return [Package(x) for x in set(matches)]
+        return [get_package(x) for x in set(matches)]
 
     def find_installed(self):
         """Return a list of Package objects that matched the search key."""
@@ -216,7 +311,7 @@ class Query(CPV):
         except portage.exception.InvalidAtom as err:
             raise errors.GentoolkitInvalidAtom(err)
 
-        return [Package(x) for x in set(matches)]
+        return [get_package(x) for x in set(matches)]
 
     def find_best(self, include_keyworded=True, include_masked=True):
         """Returns the "best" version available.
@@ -259,17 +354,17 @@ class Query(CPV):
             masked = portage.best(matches)
             keywordable = []
             for m in matches:
-                status = portage.getmaskingstatus(m)
+                status = get_mask_status(m) or ()
                 if "package.mask" not in status or "profile" not in status:
                     keywordable.append(m)
                 if matches:
                     keyworded = portage.best(keywordable)
         else:
-            return Package(best)
+            return get_package(best)
         if include_keyworded and keyworded:
-            return Package(keyworded)
+            return get_package(keyworded)
         if include_masked and masked:
-            return Package(masked)
+            return get_package(masked)
         return None
 
     def uses_globbing(self):
@@ -309,7 +404,11 @@ class Query(CPV):
     def _do_complex_lookup(self, show_progress=True):
         """Find matches for a query which is a regex or includes globbing."""
 
-        result = []
+        return list(self._iter_complex_lookup(show_progress=show_progress))
+
+    def _iter_complex_lookup(self, show_progress=True):
+        """Yield matches for a query which is a regex or includes globbing,
+        in the order self.package_finder gives them."""
 
         if show_progress and not CONFIG["piping"]:
             self.print_summary()
@@ -326,13 +425,19 @@ class Query(CPV):
         # 'sys-apps/portage-'
         # So the only way to guarantee we don't overrun the key is to
         # prefilter by cat only.
+        # A glob has to match all of pkg-ver though, so its literal start
+        # can still rule out package names before their versions are listed.
+        prefix = ""
+        if not self.is_regex:
+            prefix = _literal_prefix(self.query.rsplit("/", 1)[-1])
         if cat:
             if self.is_regex:
                 cat_re = cat
             else:
                 cat_re = fnmatch.translate(cat)
             predicate = lambda x: re.match(cat_re, x.split("/", 1)[0])
-            pre_filter = self.package_finder(predicate=predicate)
+            cp_filter = lambda index: index.find(cat, prefix, is_regex=self.is_regex)
+            pre_filter = self.package_finder(predicate=predicate, cp_filter=cp_filter)
 
         # Post-filter
         if self.is_regex:
@@ -348,11 +453,15 @@ class Query(CPV):
                 query_re = fnmatch.translate("*/%s" % self.query)
             predicate = lambda x: re.search(query_re, x)
         if pre_filter:
-            result = [x for x in pre_filter if predicate(x)]
+            result = (x for x in pre_filter if predicate(x))
+        elif prefix:
+            cp_filter = lambda index: index.find(prefix=prefix)
+            result = self.package_finder(predicate=predicate, cp_filter=cp_filter)
         else:
             result = self.package_finder(predicate=predicate)
 
-        return [Package(x) for x in result]
+        for cpv in result:
+            yield get_package(cpv)
 
     def _do_set_lookup(self, show_progress=True):
         """Find matches for a query that is a package set."""
@@ -375,18 +484,25 @@ class Query(CPV):
 
         return result
 
-    def _filter_by_repository(self, matches):
-        """Filter out packages which do not belong to self.repo_filter."""
+    def _filter_by_repository(self, matches, lazy=False):
+        """Filter out packages which do not belong to self.repo_filter.
 
-        result = []
-        for match in matches:
-            repo_name = match.repo_name()
-            if repo_name == self.repo_filter:
-                result.append(match)
-            elif not repo_name and self.repo_filter in ("unknown", "null"):
-                result.append(match)
+        @type lazy: bool
+        @param lazy: return a generator instead of a list
+        """
 
-        return result
+        result = (x for x in matches if self._in_repository(x))
+        if lazy:
+            return result
+        return list(result)
+
+    def _in_repository(self, match):
+        repo_name = get_repository_map().repo_name(match)
+        if repo_name is None:
+            repo_name = match.repo_name()
+        if repo_name == self.repo_filter:
+            return True
+        return not repo_name and self.repo_filter in ("unknown", "null")
 
     def _get_query_type(self):
         """Determine of what type the query is."""
@@ -396,3 +512,15 @@ class Query(CPV):
         elif self.is_regex or self.uses_globbing():
             return "complex"
         return "simple"
+
+
+# =========
+# Functions
+# =========
+
+
+def _literal_prefix(pattern):
+    """Return the part of a glob pattern before its first wildcard."""
+
+    match = _glob_chars_re.search(pattern)
+    return pattern[: match.start()] if match else pattern
@@ -0,0 +1,171 @@
+# Copyright(c) 2026, Gentoo Authors
+#
+# Licensed under the GNU General Public License, v2
+
+"""Provides a map of packages to the repositories they come from.
+
+Asking a L{gentoolkit.package.Package} for its repository or whether it is
+installed or in an overlay touches the filesystem for every single package.
+L{RepositoryMap} instead lists the installed and available versions of a
+cat/pkg once, in the vdb and in all repositories at the same time, and
+answers for all of its versions from memory.
+
+Example usage:
+    >>> from gentoolkit.repomap import get_repository_map
+    >>> repomap = get_repository_map()
+    >>> repomap.update(['sys-apps/portage-3.0.66.1'])
+    >>> repomap.repo_name('sys-apps/portage-3.0.66.1')
+    'gentoo'
+    >>> repomap.is_overlay('sys-apps/portage-3.0.66.1')
+    False
+"""
+
+__all__ = ("RepositoryMap", "get_repository_map")
+__docformat__ = "epytext"
+
+# =======
+# Imports
+# =======
+
+import os
+
+import portage
+from portage.versions import cpv_getkey
+
+# =======
+# Globals
+# =======
+
+_repository_map = None
+
+# =======
+# Classes
+# =======
+
+
+class RepositoryMap:
+    """Installed versions and ebuild repositories, looked up per cat/pkg.
+
+    @type installed: dict
+    @ivar installed: {cpv: repository recorded in the vdb} of every
+            installed version of the cat/pkgs looked up
+    @type ebuilds: dict
+    @ivar ebuilds: {cpv: repository name} of every version of the cat/pkgs
+            looked up that has an ebuild, naming the repository
+            L{portage.dbapi.porttree.portdbapi.findname2} picks
+    """
+
+    def __init__(self):
+        self.installed = {}
+        self.ebuilds = {}
+        self._cps = set()
+        self._portdir_path = None
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {len(self._cps)} packages>"
+
+    def update(self, cpvs):
+        """Look up every cat/pkg of cpvs that was not looked up before.
+
+        @type cpvs: iterable
+        @param cpvs: cpv strings or L{gentoolkit.cpv.CPV} objects
+        """
+
+        for cpv in cpvs:
+            cp = _get_cp(cpv)
+            if cp not in self._cps:
+                self._add_cp(cp)
+
+    def _add_cp(self, cp):
+        vardb = portage.db[portage.root]["vartree"].dbapi
+        portdb = portage.db[portage.root]["porttree"].dbapi
+        # The vdb aux cache answers these without reading the package dirs
+        for cpv in vardb.cp_list(cp):
+            self.installed[str(cpv)] = vardb.aux_get(cpv, ["repository"])[0]
+        # Sorted by version and then ascending repository priority, so the
+        # repository findname2 would pick for a version comes last
+        for cpv in portdb.cp_list(cp):
+            self.ebuilds[str(cpv)] = cpv.repo
+        self._cps.add(cp)
+
+    def _lookup(self, cpv):
+        cp = _get_cp(cpv)
+        if cp not in self._cps:
+            self._add_cp(cp)
+        return str(cpv)
+
+    def is_installed(self, cpv):
+        """Return True if the package is installed.
+
+        @rtype: bool
+        """
+
+        return self._lookup(cpv) in self.installed
+
+    def ebuild_path(self, cpv):
+        """Return the location of the repository the package's ebuild is in.
+
+        @rtype: str or None
+        @return: None if no repository has an ebuild for cpv
+        """
+
+        repo = self.ebuilds.get(self._lookup(cpv))
+        if repo is None:
+            return None
+        return portage.db[portage.root]["porttree"].dbapi.getRepositoryPath(repo)
+
+    def is_overlay(self, cpv):
+        """Return True if the package's ebuild is in an overlay.
+
+        @rtype: bool or None
+        @return: None if no repository has an ebuild for cpv, see
+                L{gentoolkit.package.Package.is_overlay}
+        """
+
+        tree = self.ebuild_path(cpv)
+        if tree is None:
+            return None
+        if self._portdir_path is None:
+            self._portdir_path = os.path.realpath(portage.settings["PORTDIR"])
+        return tree != self._portdir_path
+
+    def repo_name(self, cpv):
+        """Return the repository of an installed package, or of its ebuild.
+
+        @rtype: str or None
+        @return: None if the package is neither installed nor available,
+                see L{gentoolkit.package.Package.repo_name}
+        """
+
+        cpv = self._lookup(cpv)
+        try:
+            return self.installed[cpv]
+        except KeyError:
+            return self.ebuilds.get(cpv)
+
+
+# =========
+# Functions
+# =========
+
+
+def get_repository_map():
+    """Return the repository map shared by all queries and formatters.
+
+    @rtype: L{RepositoryMap}
+    """
+
+    global _repository_map
+    if _repository_map is None:
+        _repository_map = RepositoryMap()
+    return _repository_map
+
+
+def _get_cp(cpv):
+    try:
+        return cpv.cp
+    except AttributeError:
+        return cpv_getkey(cpv)
+
+
+# vim: set ts=4 sw=4 tw=79:
@@ -0,0 +1,197 @@
+import hashlib
+import os
+
+from pytest import MonkeyPatch
+
+from gentoolkit.equery import check
+
+
+class FakePackage:
+    def __init__(self, cpv, contents):
+        self.cpv = cpv
+        self.contents = contents
+
+    def parsed_contents(self):
+        return self.contents
+
+
+def make_root(tmp_path):
+    contents = {}
+
+    def add(cfile, data, mtime=1000000000, md5=None):
+        path = tmp_path / cfile.lstrip("/")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        os.utime(path, (mtime, mtime))
+        if md5 is None:
+            md5 = hashlib.md5(data).hexdigest()
+        contents[cfile] = ["obj", str(mtime), md5]
+
+    return contents, add
+
+
+def test_verify_contents(monkeypatch: MonkeyPatch, tmp_path) -> None:
+    monkeypatch.setenv("ROOT", str(tmp_path))
+    monkeypatch.setattr(check.checksum, "prelink_capable", False)
+    monkeypatch.setattr(check, "HASH_BUFFER_SIZE", 7)
+    monkeypatch.setattr(check, "HASH_QUEUE_PER_JOB", 1)
+
+    pkgs = []
+    for n in range(6):
+        contents, add = make_root(tmp_path)
+        add(f"/usr/share/p{n}/good", b"x" * (100 * n + 3))
+        add(f"/usr/share/p{n}/large", os.urandom(5000))
+        add(f"/usr/share/p{n}/bad", b"changed", md5="0" * 32)
+        add(f"/usr/share/p{n}/touched", b"same", mtime=1200000000)
+        contents[f"/usr/share/p{n}/touched"][1] = "1000000000"
+        contents[f"/usr/share/p{n}/gone"] = ["obj", "1", "0" * 32]
+        contents[f"/usr/share/p{n}"] = ["dir"]
+        pkgs.append(FakePackage(f"app-misc/p-{n}", contents))
+
+    results = {}
+    for jobs in (1, 4):
+        printed = []
+        verify = check.VerifyContents(
+            printer_fn=lambda cpv, data: printed.append((cpv, data)), jobs=jobs
+        )
+        results[jobs] = verify(pkgs)
+        # Reported in package order either way
+        assert [cpv for cpv, data in printed] == [pkg.cpv for pkg in pkgs]
+
+    assert results[1] == results[4]
+    assert results[4]["app-misc/p-2"] == (
+        3,
+        6,
+        [
+            "/usr/share/p2/bad has incorrect MD5sum",
+            "/usr/share/p2/touched has wrong mtime (is 1200000000, should be "
+            "1000000000)",
+            "/usr/share/p2/gone does not exist",
+        ],
+    )
+
+
+def test_md5_file(monkeypatch: MonkeyPatch, tmp_path) -> None:
+    monkeypatch.setattr(check.checksum, "prelink_capable", False)
+    monkeypatch.setattr(check, "HASH_BUFFER_SIZE", 4096)
+    data = os.urandom(3 * 4096 + 17)
+    path = tmp_path / "file"
+    path.write_bytes(data)
+    assert check._md5_file(str(path)) == hashlib.md5(data).hexdigest()
+    assert check._md5_file(str(path)) == check.checksum.perform_md5(str(path))
+    (tmp_path / "empty").write_bytes(b"")
+    assert check._md5_file(str(tmp_path / "empty")) == hashlib.md5().hexdigest()
+
+
+def test_incremental_state(monkeypatch: MonkeyPatch, tmp_path) -> None:
+    root = tmp_path / "root"
+    monkeypatch.setenv("ROOT", str(root))
+    monkeypatch.setenv("GENTOOLKIT_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(check.checksum, "prelink_capable", False)
+    hashed = []
+    md5_file = check._md5_file
+
+    def counting_md5_file(path):
+        hashed.append(os.path.basename(path))
+        return md5_file(path)
+
+    monkeypatch.setattr(check, "_md5_file", counting_md5_file)
+
+    contents, add = make_root(root)
+    add("/a", b"a")
+    add("/b", b"b")
+    add("/bad", b"bad", md5="0" * 32)
+    pkgs = [FakePackage("app-misc/p-1", contents)]
+
+    def run(jobs=1, full=False):
+        del hashed[:]
+        state = check.VerifiedFiles.load()
+        result = check.VerifyContents(jobs=jobs, state=state, full=full)(pkgs)
+        state.save()
+        return result["app-misc/p-1"][:2], sorted(hashed)
+
+    assert run() == ((2, 3), ["a", "b", "bad"])
+    # Only files that failed are read again
+    assert run() == ((2, 3), ["bad"])
+    assert run(jobs=2) == ((2, 3), ["bad"])
+    assert run(full=True) == ((2, 3), ["a", "b", "bad"])
+
+    # Rewriting a file changes its ctime, even with the old mtime restored
+    (root / "b").write_bytes(b"B")
+    os.utime(root / "b", (1000000000, 1000000000))
+    assert run(jobs=2) == ((1, 3), ["b", "bad"])
+    assert run() == ((1, 3), ["b", "bad"])
+    assert root.joinpath("b").as_posix() not in check.VerifiedFiles.load().files
+
+    # A new expected MD5 sum after a reinstall means hashing again
+    contents["/a"][2] = "1" * 32
+    assert run() == ((0, 3), ["a", "b", "bad"])
+
+    # Objects installed as symlinks are hashed through the link every time
+    add("/target", b"target")
+    os.symlink("target", root / "link")
+    os.utime(root / "link", (1000000000, 1000000000), follow_symlinks=False)
+    contents["/link"] = ["obj", "1000000000", contents.pop("/target")[2]]
+    assert run() == ((1, 4), ["a", "b", "bad", "link"])
+    assert run() == ((1, 4), ["a", "b", "bad", "link"])
+    assert root.joinpath("link").as_posix() not in check.VerifiedFiles.load().files
+    (root / "target").write_bytes(b"TARGET")
+    assert run() == ((0, 4), ["a", "b", "bad", "link"])
+
+
+def test_stat_once_and_inode_order(monkeypatch: MonkeyPatch, tmp_path) -> None:
+    monkeypatch.setenv("ROOT", str(tmp_path))
+    monkeypatch.setattr(check.checksum, "prelink_capable", False)
+    contents, add = make_root(tmp_path)
+    for name in ("c", "a", "d", "b"):
+        add("/" + name, name.encode())
+    add("/touched", b"same", mtime=1200000000)
+    contents["/touched"][1] = "1000000000"
+    os.mkfifo(tmp_path / "fifo")
+    contents["/fifo"] = ["obj", "1000000000", "0" * 32]
+    os.symlink("a", tmp_path / "link")
+    contents["/link"] = ["sym", "1000000000", "a"]
+    contents["/"] = ["dir"]
+    pkgs = [FakePackage("app-misc/p-1", contents)]
+
+    lstat = os.lstat
+    statted = []
+    hashed = []
+    md5_file = check._md5_file
+
+    def counting_lstat(path):
+        statted.append(path)
+        return lstat(path)
+
+    def counting_md5_file(path):
+        hashed.append(os.path.basename(path))
+        return md5_file(path)
+
+    monkeypatch.setattr(check.os, "lstat", counting_lstat)
+    monkeypatch.setattr(check, "_md5_file", counting_md5_file)
+
+    inode_order = sorted(
+        ("a", "b", "c", "d", "touched"), key=lambda x: lstat(tmp_path / x).st_ino
+    )
+    for jobs in (1, 2):
+        del statted[:], hashed[:]
+        result = check.VerifyContents(jobs=jobs)(pkgs)["app-misc/p-1"]
+        assert sorted(statted) == sorted(str(tmp_path) + x for x in contents)
+        assert result == (
+            6,
+            8,
+            [
+                "/touched has wrong mtime (is 1200000000, should be 1000000000)",
+                "/fifo exists, but is not a regular file",
+            ],
+        )
+        if jobs == 1:
+            assert hashed == inode_order
+        else:
+            assert sorted(hashed) == sorted(inode_order)
+
+    # Files with a wrong mtime fail anyway and are not read in fast mode
+    del hashed[:]
+    result = check.VerifyContents(fast=True)(pkgs)["app-misc/p-1"]
+    assert result[:2] == (6, 8)
+    assert hashed == [x for x in inode_order if x != "touched"]
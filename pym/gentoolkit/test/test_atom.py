@@ -5,8 +5,10 @@
 
 import unittest
 
-from gentoolkit.atom import Atom
+from gentoolkit import errors
+from gentoolkit.atom import Atom, intern_atom
 from gentoolkit.cpv import CPV
+from gentoolkit.query import Query
 
 """Atom test suite (verbatim) from pkgcore."""
 
@@ -134,6 +136,24 @@ class TestGentoolkitAtom(unittest.TestCase):
         self.assertFalse(atom.intersects(CPV("other")))
         self.assertFalse(atom.intersects(CPV("dkg")))
 
+    def test_intern_atom(self):
+        atom = intern_atom(">=dev-libs/openssl-3:=")
+        self.assertIs(atom, intern_atom(">=dev-libs/openssl-3:="))
+        self.assertEqual(atom, Atom(">=dev-libs/openssl-3:="))
+        conditional = intern_atom(">=dev-libs/openssl-3:=", "ssl")
+        self.assertIsNot(atom, conditional)
+        self.assertEqual(conditional.use_conditional, "ssl")
+        self.assertIsNone(atom.use_conditional)
+        self.assertRaises(errors.GentoolkitInvalidAtom, intern_atom, "=cat/pkg")
+
+    def test_intersects_query(self):
+        # Anything CPV like can be intersected, not only other atoms
+        atom = Atom(">=dev-libs/openssl-3:0")
+        self.assertTrue(atom.intersects(Query("dev-libs/openssl")))
+        self.assertTrue(atom.intersects(Query("=dev-libs/openssl-3.1*")))
+        self.assertFalse(atom.intersects(Query("<dev-libs/openssl-3")))
+        self.assertFalse(atom.intersects(Query("dev-libs/openssl:1.1")))
+
 
 def test_main():
     suite = unittest.TestLoader().loadTestsFromTestCase(TestGentoolkitAtom)
@@ -0,0 +1,99 @@
+from types import SimpleNamespace
+from typing import Dict
+
+from pytest import MonkeyPatch
+
+from gentoolkit import contents
+from gentoolkit.contents import ContentsIndex
+from gentoolkit.package import Package
+
+
+class FakeVardb:
+    def __init__(self, installed: Dict[str, int]) -> None:
+        self.installed = installed
+
+    def cpv_all(self):
+        return list(self.installed)
+
+    def cpv_counter(self, cpv):
+        return self.installed[cpv]
+
+
+def setup_vdb(monkeypatch: MonkeyPatch, installed, fake_contents, parsed):
+    vardb = FakeVardb(installed)
+    fake_portage = SimpleNamespace(
+        root="/", db={"/": {"vartree": SimpleNamespace(dbapi=vardb)}}
+    )
+    monkeypatch.setattr(contents, "portage", fake_portage)
+
+    def parsed_contents(self, prefix_root=False):
+        parsed.append(self.cpv)
+        return dict(fake_contents[self.cpv])
+
+    monkeypatch.setattr(Package, "parsed_contents", parsed_contents)
+    return vardb
+
+
+def test_index_update(monkeypatch: MonkeyPatch, tmp_path) -> None:
+    monkeypatch.setenv("GENTOOLKIT_CACHE_DIR", str(tmp_path))
+    fake_contents = {
+        "app-misc/a-1.0": {
+            "/usr": ["dir"],
+            "/usr/bin/a": ["obj", "1", "abc"],
+        },
+        "app-misc/b-1.0": {
+            "/usr": ["dir"],
+            "/usr/bin/b": ["sym", "../lib/b", "1"],
+        },
+        "app-misc/b-2.0": {
+            "/usr": ["dir"],
+            "/usr/bin/b2": ["obj", "2", "def"],
+        },
+    }
+    parsed = []
+    vardb = setup_vdb(
+        monkeypatch,
+        {"app-misc/a-1.0": 1, "app-misc/b-1.0": 2},
+        fake_contents,
+        parsed,
+    )
+    monkeypatch.setattr(contents, "vdb_state", lambda: (1, 2))
+
+    index = ContentsIndex.load()
+    assert sorted(parsed) == ["app-misc/a-1.0", "app-misc/b-1.0"]
+    assert index.owners("/usr/bin/a") == ["app-misc/a-1.0"]
+    assert sorted(index.owners("/usr")) == ["app-misc/a-1.0", "app-misc/b-1.0"]
+    assert index.owners("/usr/bin/c") == []
+    assert index.entry("app-misc/b-1.0", "/usr/bin/b") == ["sym", "../lib/b", "1"]
+
+    # Nothing changed: the stored index is used as is, and a lookup only
+    # reads the shard of the path
+    parsed.clear()
+    read = []
+    read_cache = contents.read_cache
+
+    def record_read(name):
+        read.append(name)
+        return read_cache(name)
+
+    monkeypatch.setattr(contents, "read_cache", record_read)
+    index = ContentsIndex.load()
+    assert parsed == []
+    assert index.owners("/usr/bin/a") == ["app-misc/a-1.0"]
+    assert index.owner_positions("/usr/bin/a") == [("app-misc/a-1.0", 1)]
+    assert read == [
+        "contents-index.state",
+        ContentsIndex._shard_name(contents._shard("/usr/bin/a")),
+    ]
+    assert index.entry("app-misc/b-1.0", "/usr/bin/b") == ["sym", "../lib/b", "1"]
+    assert read[-1] == "contents-index"
+    monkeypatch.setattr(contents, "read_cache", read_cache)
+
+    # b-1.0 was replaced by b-2.0: only b-2.0 is read
+    vardb.installed = {"app-misc/a-1.0": 1, "app-misc/b-2.0": 3}
+    monkeypatch.setattr(contents, "vdb_state", lambda: (2, 3))
+    index = ContentsIndex.load()
+    assert parsed == ["app-misc/b-2.0"]
+    assert index.owners("/usr/bin/b") == []
+    assert index.owners("/usr/bin/b2") == ["app-misc/b-2.0"]
+    assert sorted(index.owners("/usr")) == ["app-misc/a-1.0", "app-misc/b-2.0"]
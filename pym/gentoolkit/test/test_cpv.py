@@ -5,8 +5,11 @@
 # Licensed under the GNU General Public License, v2
 
 import unittest
+from itertools import product
 
-from gentoolkit.cpv import CPV, compare_strs
+from portage.versions import vercmp
+
+from gentoolkit.cpv import CPV, compare_strs, split_cpv, version_sort_key
 
 
 class TestGentoolkitCPV(unittest.TestCase):
@@ -126,6 +129,85 @@ class TestGentoolkitCPV(unittest.TestCase):
             for k in keys:
                 self.assertEqual(getattr(cpv, k), test[1][k])
 
+    def test_version_sort_key(self):
+        versions = [
+            "1",
+            "1.0",
+            "1.00",
+            "1.0.0",
+            "1.01",
+            "1.010",
+            "1.02",
+            "1.1",
+            "1.1a",
+            "1.1b",
+            "1.1.0",
+            "1.2",
+            "1.10",
+            "1.0_alpha",
+            "1.0_alpha1",
+            "1.0_beta2",
+            "1.0_pre",
+            "1.0_rc1",
+            "1.0_rc10",
+            "1.0_rc1_p1",
+            "1.0_p",
+            "1.0_p0",
+            "1.0_p1",
+            "1.0_p1_rc1",
+            "1.0-r1",
+            "1.0-r10",
+            "1.0_rc1-r2",
+            "2",
+            "20080318",
+        ]
+        for v1, v2 in product(versions, repeat=2):
+            expected = vercmp(v1, v2)
+            key1, key2 = version_sort_key(v1), version_sort_key(v2)
+            got = (key1 > key2) - (key1 < key2)
+            self.assertEqual(got, (expected > 0) - (expected < 0), (v1, v2))
+        self.assertIsNone(version_sort_key(""))
+        self.assertIsNone(version_sort_key("1.x"))
+
+    def test_sort(self):
+        cpvs = [
+            CPV(x)
+            for x in (
+                "sys-apps/portage-2.2_rc10",
+                "sys-apps/portage-2.1.6.8",
+                "sys-apps/pkgcore-0.4.7.15-r1",
+                "sys-auth/pambase-20080318",
+                "sys-apps/portage-2.2",
+                "app-misc/portage-3",
+            )
+        ]
+        self.assertFalse(CPV("cat/pkg") < CPV("cat/pkg"))
+        by_key = sorted(cpvs, key=lambda x: x.sort_key)
+        self.assertEqual(by_key, sorted(cpvs))
+        self.assertEqual(
+            [str(x) for x in by_key],
+            [
+                "app-misc/portage-3",
+                "sys-apps/pkgcore-0.4.7.15-r1",
+                "sys-apps/portage-2.1.6.8",
+                "sys-apps/portage-2.2_rc10",
+                "sys-apps/portage-2.2",
+                "sys-auth/pambase-20080318",
+            ],
+        )
+
+    def test_split_cache(self):
+        # Equal strings share their split result, name and category
+        cpv1, cpv2 = CPV("".join(["sys-apps/", "portage-2.2"])), CPV(
+            "sys-apps/portage-2.2"
+        )
+        self.assertIs(cpv1.category, cpv2.category)
+        self.assertIs(cpv1.name, CPV("sys-apps/portage-2.1").name)
+        self.assertEqual(
+            split_cpv("sys-apps/portage-2.2_rc10-r1"),
+            ("sys-apps", "portage", "2.2_rc10", "r1"),
+        )
+
 
 def test_main():
     suite = unittest.TestLoader().loadTestsFromTestCase(TestGentoolkitCPV)
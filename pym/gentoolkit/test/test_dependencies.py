@@ -1,7 +1,15 @@
 import portage
+from types import SimpleNamespace
 from typing import List, Dict, Optional
 from pytest import MonkeyPatch
-from gentoolkit.dependencies import Dependencies
+from gentoolkit import dependencies
+from gentoolkit.dependencies import (
+    Dependencies,
+    DependencyGraph,
+    ReverseDependencyIndex,
+)
+from gentoolkit.package import Package
+from gentoolkit.query import Query
 
 
 def is_cp_in_cpv(cp: str, cpv: str) -> bool:
@@ -69,3 +77,230 @@ def test_basic_revdeps(monkeypatch: MonkeyPatch) -> None:
         "app-misc/b-1.0",
         "app-misc/c-1.0",
     ]
+
+
+def test_indexed_revdeps(monkeypatch: MonkeyPatch) -> None:
+    fake_depends = {
+        "app-test/root-1.0": None,
+        "app-test/a-1.0": {"DEPEND": "app-test/root", "RDEPEND": "app-test/d"},
+        "app-test/b-1.0": {"DEPEND": "foo? ( >=app-test/a-1 )"},
+        "app-test/c-1.0": {"DEPEND": "app-test/b", "BDEPEND": "<app-test/root-1"},
+        "app-test/d-1.0": None,
+    }
+    # Dependencies caches parsed dependencies per cpv, so don't reuse the
+    # names of the other tests.
+    fake_pkgs = list(fake_depends.keys())
+
+    def e(self, env_vars):
+        return environment(self, env_vars, fake_depends, fake_pkgs)
+
+    monkeypatch.setattr(Dependencies, "environment", e)
+
+    index = ReverseDependencyIndex(fake_pkgs)
+    assert len(index) == len(fake_pkgs)
+
+    def revdeps(query, **kwargs):
+        return [
+            (pkg.cpv, pkg.depatom.get_depstr(), pkg.depth)
+            for pkg in Dependencies(query).graph_reverse_depends(
+                pkgset=fake_pkgs, **kwargs
+            )
+        ]
+
+    for query in ("app-test/root", "app-test/a", "a", "app-test/d", "app-test/b"):
+        for only_direct in (True, False):
+            assert revdeps(query, only_direct=only_direct, index=index) == revdeps(
+                query, only_direct=only_direct
+            )
+
+    assert revdeps("app-test/a", index=index) == [
+        ("app-test/b-1.0", "foo? >=app-test/a-1", 0)
+    ]
+
+    index.remove("app-test/b-1.0")
+    assert revdeps("app-test/a", index=index) == []
+
+
+def test_load_installed(monkeypatch: MonkeyPatch, tmp_path) -> None:
+    monkeypatch.setenv("GENTOOLKIT_CACHE_DIR", str(tmp_path))
+    fake_depends = {
+        "app-idx/a-1.0": {"DEPEND": "app-idx/b"},
+        "app-idx/b-1.0": {"RDEPEND": "app-idx/c"},
+    }
+    fake_pkgs = list(fake_depends.keys())
+
+    def e(self, env_vars):
+        return environment(self, env_vars, fake_depends, fake_pkgs)
+
+    monkeypatch.setattr(Dependencies, "environment", e)
+
+    counters = {"app-idx/a-1.0": 1, "app-idx/b-1.0": 2}
+    metadata = {"app-idx/a-1.0": ["1", "abc", {}]}
+
+    looked_up = []
+
+    def aux_get(cpv, keys):
+        looked_up.append(cpv)
+        try:
+            return metadata[cpv]
+        except KeyError:
+            raise KeyError(cpv)
+
+    vardb = SimpleNamespace(
+        cpv_all=lambda: list(counters), cpv_counter=lambda cpv: counters[cpv]
+    )
+    portdb = SimpleNamespace(
+        aux_get=aux_get, porttrees=[], settings=SimpleNamespace(categories=[])
+    )
+    fake_portage = SimpleNamespace(
+        root="/",
+        db={
+            "/": {
+                "vartree": SimpleNamespace(dbapi=vardb),
+                "porttree": SimpleNamespace(dbapi=portdb),
+            }
+        },
+    )
+    monkeypatch.setattr(dependencies, "portage", fake_portage)
+    monkeypatch.setattr(dependencies, "vdb_state", lambda: (1, 2))
+
+    added = []
+    add = ReverseDependencyIndex.add
+
+    def record_add(self, cpv, stamp=None):
+        added.append(cpv)
+        add(self, cpv, stamp=stamp)
+
+    monkeypatch.setattr(ReverseDependencyIndex, "add", record_add)
+
+    index = ReverseDependencyIndex.load_installed()
+    assert sorted(added) == fake_pkgs
+    assert list(index.dependents(Dependencies("app-idx/b"))) == ["app-idx/a-1.0"]
+
+    # Nothing changed: no package is looked at
+    added.clear()
+    looked_up.clear()
+    index = ReverseDependencyIndex.load_installed()
+    assert (added, looked_up) == ([], [])
+    assert list(index.dependents(Dependencies("app-idx/b"))) == ["app-idx/a-1.0"]
+
+    # The metadata of a changed while the vdb did not
+    metadata["app-idx/a-1.0"] = ["2", "def", {}]
+    monkeypatch.setattr(dependencies, "_tree_state", lambda portdb: (1,))
+    index = ReverseDependencyIndex.load_installed()
+    assert added == ["app-idx/a-1.0"]
+
+
+def test_indirect_revdeps_tree(monkeypatch: MonkeyPatch) -> None:
+    fake_depends = {
+        "app-tree/root-1.0": None,
+        "app-tree/a-1.0": {"DEPEND": "app-tree/root", "RDEPEND": "app-tree/c"},
+        "app-tree/b-1.0": {"DEPEND": "app-tree/root app-tree/a"},
+        "app-tree/c-1.0": {"DEPEND": "app-tree/b"},
+    }
+    fake_pkgs = list(fake_depends.keys())
+
+    def e(self, env_vars):
+        return environment(self, env_vars, fake_depends, fake_pkgs)
+
+    monkeypatch.setattr(Dependencies, "environment", e)
+
+    def revdeps(**kwargs):
+        return [
+            (pkg.cpv, pkg.depth)
+            for pkg in Dependencies("app-tree/root").graph_reverse_depends(
+                pkgset=fake_pkgs, only_direct=False, **kwargs
+            )
+        ]
+
+    # Every package is expanded once, below the first package it was found
+    # for at the lowest depth, which also breaks the a -> c -> b -> a cycle.
+    assert revdeps() == [
+        ("app-tree/a-1.0", 0),
+        ("app-tree/b-1.0", 1),
+        ("app-tree/b-1.0", 0),
+        ("app-tree/c-1.0", 1),
+        ("app-tree/a-1.0", 2),
+    ]
+    assert revdeps(max_depth=1) == [
+        ("app-tree/a-1.0", 0),
+        ("app-tree/b-1.0", 1),
+        ("app-tree/b-1.0", 0),
+        ("app-tree/c-1.0", 1),
+    ]
+    assert revdeps(max_depth=0) == [("app-tree/a-1.0", 0), ("app-tree/b-1.0", 0)]
+
+
+def test_dependency_graph(monkeypatch: MonkeyPatch) -> None:
+    fake_depends = {
+        "app-graph/root-1.0": {"DEPEND": "app-graph/a", "RDEPEND": "app-graph/b"},
+        "app-graph/a-1.0": {"DEPEND": "app-graph/c", "RDEPEND": "app-graph/c"},
+        "app-graph/b-1.0": {"DEPEND": "app-graph/c app-graph/a app-graph/x"},
+        "app-graph/c-1.0": {"RDEPEND": "app-graph/root"},
+    }
+    fake_pkgs = list(fake_depends.keys())
+
+    def e(self, env_vars):
+        return environment(self, env_vars, fake_depends, fake_pkgs)
+
+    resolved = []
+
+    def find_best(self):
+        resolved.append(self.query)
+        for cpv in fake_pkgs:
+            if is_cp_in_cpv(self.cp, cpv):
+                return Package(cpv)
+        return None
+
+    monkeypatch.setattr(Dependencies, "environment", e)
+    monkeypatch.setattr(Query, "find_best", find_best)
+
+    graph = DependencyGraph()
+    root = Package("app-graph/root-1.0")
+
+    def walk(**kwargs):
+        return [
+            (depth, pkg.cpv, dep.atom, kind)
+            for depth, pkg, dep, kind in graph.walk(root, **kwargs)
+        ]
+
+    # c is expanded below a, which reaches it first at the lowest depth
+    assert walk(max_depth=0) == [
+        (1, "app-graph/a-1.0", "app-graph/a", "expanded"),
+        (2, "app-graph/c-1.0", "app-graph/c", "expanded"),
+        (3, "app-graph/root-1.0", "app-graph/root", "cycle"),
+        (1, "app-graph/b-1.0", "app-graph/b", "expanded"),
+        (2, "app-graph/c-1.0", "app-graph/c", "repeated"),
+        (2, "app-graph/a-1.0", "app-graph/a", "repeated"),
+    ]
+    assert walk(max_depth=0, full=True) == [
+        (1, "app-graph/a-1.0", "app-graph/a", "expanded"),
+        (2, "app-graph/c-1.0", "app-graph/c", "expanded"),
+        (3, "app-graph/root-1.0", "app-graph/root", "cycle"),
+        (1, "app-graph/b-1.0", "app-graph/b", "expanded"),
+        (2, "app-graph/c-1.0", "app-graph/c", "expanded"),
+        (3, "app-graph/root-1.0", "app-graph/root", "cycle"),
+        (2, "app-graph/a-1.0", "app-graph/a", "expanded"),
+        (3, "app-graph/c-1.0", "app-graph/c", "expanded"),
+        (4, "app-graph/root-1.0", "app-graph/root", "cycle"),
+    ]
+    assert walk(max_depth=1) == [
+        (1, "app-graph/a-1.0", "app-graph/a", "expanded"),
+        (1, "app-graph/b-1.0", "app-graph/b", "expanded"),
+    ]
+    # Every atom was resolved once, unresolvable ones included
+    assert sorted(resolved) == [
+        "app-graph/a",
+        "app-graph/b",
+        "app-graph/c",
+        "app-graph/root",
+        "app-graph/x",
+    ]
+
+    assert [
+        (depth, pkg.cpv) for depth, pkg in root.deps.graph_depends(max_depth=0)
+    ] == [
+        (1, "app-graph/a-1.0"),
+        (2, "app-graph/c-1.0"),
+        (1, "app-graph/b-1.0"),
+    ]
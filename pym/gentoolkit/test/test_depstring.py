@@ -0,0 +1,54 @@
+import pytest
+from portage.exception import InvalidDependString
+
+from gentoolkit import depstring
+from gentoolkit.dependencies import Dependencies
+from gentoolkit.depstring import depstring_cache_info, parse_depstring, reduce_depstring
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    depstring._parse_depstring.cache_clear()
+    depstring._reduce_depstring.cache_clear()
+
+
+def test_parse_depstring() -> None:
+    deps = "ssl? ( dev-libs/openssl ) || ( app-misc/a app-misc/b ) !app-misc/c"
+    atoms = parse_depstring(deps)
+    assert [(x.atom, x.use_conditional) for x in atoms] == [
+        ("dev-libs/openssl", "ssl"),
+        ("app-misc/a", None),
+        ("app-misc/b", None),
+    ]
+    assert depstring_cache_info()["parse"].misses == 1
+
+    # Callers get their own list of the same atoms
+    again = parse_depstring(deps)
+    assert again == atoms and again is not atoms
+    assert again[0] is atoms[0]
+    assert depstring_cache_info()["parse"].hits == 1
+
+    # Dependencies share the parsed results
+    assert Dependencies("app-misc/foo-1").parser(deps) == atoms
+    assert depstring_cache_info()["parse"].hits == 2
+
+
+def test_reduce_depstring() -> None:
+    deps = "ssl? ( dev-libs/openssl ) || ( app-misc/a:= app-misc/b )"
+    reduced = reduce_depstring(deps, "8", frozenset(["ssl"]))
+    assert reduced == ["dev-libs/openssl", "||", ["app-misc/a:=", "app-misc/b"]]
+    # Modifying the result does not affect the cache
+    reduced[2].pop()
+    assert reduce_depstring(deps, "8", frozenset(["ssl"]))[2] == [
+        "app-misc/a:=",
+        "app-misc/b",
+    ]
+    assert reduce_depstring(deps, "8", frozenset()) == [
+        "||",
+        ["app-misc/a:=", "app-misc/b"],
+    ]
+    info = depstring_cache_info()["reduce"]
+    assert (info.hits, info.misses) == (1, 2)
+
+    with pytest.raises(InvalidDependString):
+        reduce_depstring("ssl? ( dev-libs/openssl", "8")
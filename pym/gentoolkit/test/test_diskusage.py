@@ -0,0 +1,88 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+from pytest import MonkeyPatch
+
+from gentoolkit import diskusage, errors
+from gentoolkit.cpv import CPV
+from gentoolkit.diskusage import DiskUsage
+
+
+class FakePackage(CPV):
+    def __init__(self, cpv, contents):
+        super().__init__(cpv)
+        self.contents = contents
+
+    def parsed_contents(self, prefix_root=False):
+        assert prefix_root
+        return self.contents
+
+
+class FakeVardb:
+    def aux_get(self, cpv, keys):
+        assert keys == ["repository"]
+        return ["local" if cpv.startswith("app-misc/c") else "gentoo"]
+
+
+def test_disk_usage(monkeypatch: MonkeyPatch, tmp_path) -> None:
+    fake = SimpleNamespace(
+        root="/", db={"/": {"vartree": SimpleNamespace(dbapi=FakeVardb())}}
+    )
+    monkeypatch.setattr(diskusage, "portage", fake)
+    monkeypatch.setattr(diskusage, "STAT_CHUNK_SIZE", 2)
+
+    def add(name, size):
+        path = tmp_path / name
+        path.write_bytes(b"x" * size)
+        return str(path)
+
+    shared = add("shared", 1000)
+    os.link(shared, tmp_path / "hardlink")
+    hardlink = str(tmp_path / "hardlink")
+    secret = str(tmp_path / "secret")
+    contents = {
+        "app-misc/b-1": [add("b", 10), shared, str(tmp_path / "gone")],
+        "app-misc/a-1": [add("a", 20), hardlink, shared],
+        "app-misc/c-1": [add("c", 40), shared, secret],
+        "dev-libs/d-1": [add("d", 80), add("d2", 160)],
+    }
+
+    lstat = os.lstat
+    statted = []
+
+    def fake_lstat(path):
+        statted.append(os.fsdecode(path))
+        if os.fsdecode(path) == secret:
+            raise PermissionError(13, "Permission denied", path)
+        return lstat(path)
+
+    monkeypatch.setattr(diskusage.os, "lstat", fake_lstat)
+
+    results = []
+    for jobs, order in ((1, sorted(contents)), (3, sorted(contents, reverse=True))):
+        del statted[:]
+        usage = DiskUsage(jobs=jobs)
+        usage.add_packages(
+            FakePackage(cpv, dict.fromkeys(contents[cpv], ["obj"])) for cpv in order
+        )
+        # Paths owned by several packages are only statted once
+        assert sorted(statted) == sorted({x for v in contents.values() for x in v})
+        results.append(
+            [usage.totals(key) for key in ("package", "category", "repository")]
+        )
+
+    assert results[0] == results[1]
+    packages, categories, repositories = results[0]
+    # The hardlinked inode goes to the first package in cpv order
+    assert packages == [
+        ("app-misc/a-1", (1020, 2, 0)),
+        ("dev-libs/d-1", (240, 2, 0)),
+        ("app-misc/c-1", (40, 1, 1)),
+        ("app-misc/b-1", (10, 1, 0)),
+    ]
+    assert categories == [("app-misc", (1070, 4, 1)), ("dev-libs", (240, 2, 0))]
+    assert repositories == [("gentoo", (1270, 5, 0)), ("local", (40, 1, 1))]
+
+    with pytest.raises(errors.GentoolkitFatalError):
+        usage.totals("slot")
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+from pytest import MonkeyPatch
+
+from gentoolkit import flag
+
+
+class FakeConfig:
+    """Per package USE settings like portage.config after setcpv()."""
+
+    packages = {
+        "app-misc/a-1": ("foo bar", {"baz"}, set()),
+        "app-misc/b-1": ("foo", {"baz"}, {"qux"}),
+    }
+
+    def __init__(self, clone=None):
+        self.setcpv_calls = []
+        self.values = {"USE_EXPAND_HIDDEN": "ABI_X86 CPU_FLAGS_X86"}
+        self.usemask = self.useforce = frozenset()
+
+    def setcpv(self, cpv, mydb=None):
+        self.setcpv_calls.append(cpv)
+        use, usemask, useforce = self.packages[cpv]
+        self.values["PORTAGE_USE"] = use
+        self.usemask = frozenset(usemask)
+        self.useforce = frozenset(useforce)
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+
+def test_use_resolver(monkeypatch: MonkeyPatch) -> None:
+    portdb = SimpleNamespace(settings=None)
+    fake_portage = SimpleNamespace(
+        root="/",
+        db={"/": {"porttree": SimpleNamespace(dbapi=portdb)}},
+        config=FakeConfig,
+    )
+    monkeypatch.setattr(flag, "portage", fake_portage)
+    monkeypatch.setattr(flag, "_use_resolver", None)
+
+    resolver = flag.get_use_resolver()
+    assert flag.get_use_resolver() is resolver
+    result = resolver.resolve_many(["app-misc/a-1", "app-misc/b-1", "app-misc/c-1"])
+    assert result["app-misc/a-1"] == (
+        ["foo", "bar"],
+        ["ABI_X86", "CPU_FLAGS_X86"],
+        ["baz"],
+        [],
+    )
+    assert result["app-misc/b-1"] == (
+        ["foo"],
+        ["ABI_X86", "CPU_FLAGS_X86"],
+        ["baz"],
+        ["qux"],
+    )
+    # Unknown packages resolve to nothing, like before
+    assert result["app-misc/c-1"] == ([], [], [], [])
+    # Profile wide settings and equal masks are shared between packages
+    assert result["app-misc/a-1"][1] is result["app-misc/b-1"][1]
+    assert result["app-misc/a-1"][2] is result["app-misc/b-1"][2]
+
+    # Cached per cpv
+    assert flag.get_all_cpv_use("app-misc/b-1") is result["app-misc/b-1"]
+    assert resolver.settings.setcpv_calls == [
+        "app-misc/a-1",
+        "app-misc/b-1",
+        "app-misc/c-1",
+    ]
@@ -0,0 +1,151 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from pytest import MonkeyPatch
+
+from gentoolkit import errors, graphexport
+from gentoolkit.dependencies import DependencyGraph
+from gentoolkit.equery import depends
+from gentoolkit.graphexport import GraphExport
+
+
+def make_graph():
+    graph = DependencyGraph()
+    adjacency = {
+        "app-misc/root-1": ["app-misc/a-1", "app-misc/b-1"],
+        "app-misc/a-1": ["app-misc/c-1"],
+        "app-misc/b-1": ["app-misc/c-1"],
+        "app-misc/c-1": ["app-misc/root-1"],
+    }
+    for cpv, children in adjacency.items():
+        graph.nodes[cpv] = SimpleNamespace(cpv=cpv)
+        graph.edges[cpv] = [(">=%s" % child, child) for child in children]
+    return graph
+
+
+def test_dependency_graph_export() -> None:
+    graph = make_graph()
+    root = graph.nodes["app-misc/root-1"]
+
+    export = GraphExport()
+    export.add_dependency_graph(graph, root, max_depth=1)
+    assert export.nodes == {
+        "app-misc/root-1": {"root": True},
+        "app-misc/a-1": {"depth": 1},
+        "app-misc/b-1": {"depth": 1},
+    }
+    assert export.format("dot") == "\n".join(
+        (
+            'digraph "dependencies" {',
+            '  "app-misc/root-1" [root=true];',
+            '  "app-misc/a-1" [depth=1];',
+            '  "app-misc/b-1" [depth=1];',
+            '  "app-misc/root-1" -> "app-misc/a-1" [label=">=app-misc/a-1"];',
+            '  "app-misc/root-1" -> "app-misc/b-1" [label=">=app-misc/b-1"];',
+            "}",
+        )
+    )
+
+    export = GraphExport()
+    export.add_dependency_graph(graph, root, max_depth=0)
+    result = json.loads(export.format("json"))
+    assert result["nodes"]["app-misc/c-1"] == {"depth": 2}
+    assert result["adjacency"] == {
+        "app-misc/root-1": [
+            {"target": "app-misc/a-1", "atom": ">=app-misc/a-1"},
+            {"target": "app-misc/b-1", "atom": ">=app-misc/b-1"},
+        ],
+        "app-misc/a-1": [{"target": "app-misc/c-1", "atom": ">=app-misc/c-1"}],
+        "app-misc/b-1": [{"target": "app-misc/c-1", "atom": ">=app-misc/c-1"}],
+        "app-misc/c-1": [{"target": "app-misc/root-1", "atom": ">=app-misc/root-1"}],
+    }
+
+    with pytest.raises(errors.GentoolkitFatalError):
+        export.format("svg")
+
+
+def test_export_masking(monkeypatch: MonkeyPatch) -> None:
+    looked_up = []
+
+    def get_masking(pkg):
+        looked_up.append(pkg.cpv)
+        return ["~amd64", "package.mask"]
+
+    monkeypatch.setattr(graphexport, "get_masking", get_masking)
+    graph = make_graph()
+    root = graph.nodes["app-misc/root-1"]
+
+    export = GraphExport()
+    export.add_dependency_graph(graph, root, max_depth=1)
+    assert looked_up == []
+
+    export = GraphExport(with_mask=True)
+    export.add_dependency_graph(graph, root, max_depth=0)
+    export.add_dependency_graph(graph, graph.nodes["app-misc/a-1"], max_depth=0)
+    # Once per package, however often it shows up
+    assert sorted(looked_up) == [
+        "app-misc/a-1",
+        "app-misc/b-1",
+        "app-misc/c-1",
+        "app-misc/root-1",
+    ]
+    assert export.nodes["app-misc/a-1"] == {
+        "masking": ["~amd64", "package.mask"],
+        "depth": 1,
+        "root": True,
+    }
+    assert '"app-misc/a-1" [masking="~amd64 package.mask", depth=1, root=true];' in (
+        export.format_dot()
+    )
+
+
+def test_dot_quoting() -> None:
+    export = GraphExport()
+    export.add_node('say "hi"\\')
+    export.add_node("app-misc/b-1", query=True)
+    export.add_edge('say "hi"\\', "app-misc/b-1")
+    assert export.format_dot(name="g") == "\n".join(
+        (
+            'digraph "g" {',
+            '  "say \\"hi\\"\\\\";',
+            '  "app-misc/b-1" [query=true];',
+            '  "say \\"hi\\"\\\\" -> "app-misc/b-1";',
+            "}",
+        )
+    )
+
+
+def test_export_reverse_depends(monkeypatch: MonkeyPatch) -> None:
+    def graph_reverse_depends(self, pkgset, max_depth, only_direct, index):
+        for cpv, depth, atom in (
+            ("app-misc/a-1", 0, "app-misc/lib"),
+            ("app-misc/b-1", 1, ">=app-misc/a-1"),
+            ("app-misc/b-1", 1, "<app-misc/a-2"),
+            ("app-misc/c-1", 2, "app-misc/b"),
+            ("app-misc/d-1", 0, "app-misc/lib[ssl]"),
+        ):
+            yield SimpleNamespace(cpv=cpv, depth=depth, depatom=atom)
+
+    monkeypatch.setattr(
+        depends.Dependencies, "graph_reverse_depends", graph_reverse_depends
+    )
+    export = GraphExport()
+    depends.export_reverse_depends(export, "app-misc/lib", [])
+    assert list(export.nodes) == [
+        "app-misc/lib",
+        "app-misc/a-1",
+        "app-misc/b-1",
+        "app-misc/c-1",
+        "app-misc/d-1",
+    ]
+    assert export.edges == {
+        "app-misc/lib": [],
+        "app-misc/a-1": [("app-misc/lib", "app-misc/lib")],
+        "app-misc/b-1": [
+            ("app-misc/a-1", ">=app-misc/a-1"),
+            ("app-misc/a-1", "<app-misc/a-2"),
+        ],
+        "app-misc/c-1": [("app-misc/b-1", "app-misc/b")],
+        "app-misc/d-1": [("app-misc/lib", "app-misc/lib[ssl]")],
+    }
@@ -1,9 +1,23 @@
+import multiprocessing
 import os
+import re
 import unittest
 import warnings
 from tempfile import NamedTemporaryFile, mktemp
+from unittest import mock
 
 from gentoolkit import helpers
+from gentoolkit.package import Package
+
+FAKE_CONTENTS = {
+    "app-misc/a-1.0": {"/usr/bin/a": ["obj", "1", "abc"], "/usr/bin/x": ["dir"]},
+    "app-misc/b-1.0": {"/usr/lib/b.so": ["obj", "1", "def"]},
+    "app-misc/c-1.0": {"/usr/bin/c": ["obj", "1", "012"]},
+}
+
+
+def fake_parsed_contents(self, prefix_root=False):
+    return FAKE_CONTENTS[self.cpv]
 
 
 class TestFileOwner(unittest.TestCase):
@@ -63,10 +77,87 @@ class TestFileOwner(unittest.TestCase):
         self.assertRaises(AttributeError, extend_realpaths, "str")
         self.assertRaises(AttributeError, extend_realpaths, set())
 
+    def test_path_matcher(self):
+        matcher = helpers.PathMatcher(["/bin/grep", "sed", "lib/libc.so.6"])
+
+        matching = ["/bin/grep", "/bin/sed", "/usr/bin/sed", "/lib64/lib/libc.so.6"]
+        for path in matching:
+            self.assertTrue(matcher.match(path), path)
+            self.assertTrue(matcher.search(path), path)
+
+        not_matching = ["/bin/egrep", "/bin/grep/x", "/usr/bin/gsed", "/lib/sed/x"]
+        not_matching += ["/usr/lib64/libc.so.6", "/bin/grep2"]
+        for path in not_matching:
+            self.assertFalse(matcher.match(path), path)
+
+    @unittest.skipUnless(
+        multiprocessing.get_start_method() == "fork",
+        "workers must inherit the mocked CONTENTS",
+    )
+    @mock.patch.object(Package, "parsed_contents", fake_parsed_contents)
+    def test_find_owners_parallel(self):
+        query_re = re.compile(r"^/usr/bin/")
+        pkgset = list(FAKE_CONTENTS)
+        expected = [
+            ("app-misc/a-1.0", "/usr/bin/a"),
+            ("app-misc/a-1.0", "/usr/bin/x"),
+            ("app-misc/c-1.0", "/usr/bin/c"),
+        ]
+
+        for jobs in (1, 2):
+            printed = []
+            find_owner = helpers.FileOwner(
+                is_regex=True,
+                printer_fn=lambda pkg, cfile: printed.append((pkg.cpv, cfile)),
+                jobs=jobs,
+            )
+            results = find_owner.find_owners(query_re, use_match=True, pkgset=pkgset)
+            self.assertEqual([(pkg.cpv, cfile) for pkg, cfile in results], expected)
+            self.assertEqual(printed, expected)
+
+            find_owner.early_out = True
+            results = find_owner.find_owners(query_re, use_match=True, pkgset=pkgset)
+            self.assertEqual([(pkg.cpv, cfile) for pkg, cfile in results], expected[:1])
+
+
+class TestNameIndex(unittest.TestCase):
+    def test_find(self):
+        index = helpers.NameIndex(
+            [
+                "dev-lang/python",
+                "dev-python/pip",
+                "dev-python/python-dateutil",
+                "sys-apps/portage",
+                "sys-apps/portage-utils",
+                "sys-devel/gcc",
+            ]
+        )
+        self.assertEqual(len(index), 6)
+        self.assertEqual(
+            index.find("dev-*"),
+            ["dev-lang/python", "dev-python/pip", "dev-python/python-dateutil"],
+        )
+        self.assertEqual(
+            index.find("dev-*", "py"), ["dev-lang/python", "dev-python/python-dateutil"]
+        )
+        self.assertEqual(
+            index.find("sys-[a]*", "portage"),
+            ["sys-apps/portage", "sys-apps/portage-utils"],
+        )
+        # The prefix can run into the version
+        self.assertEqual(index.find(prefix="portage-2"), ["sys-apps/portage"])
+        self.assertEqual(
+            index.find(prefix="portage-utils-0"),
+            ["sys-apps/portage", "sys-apps/portage-utils"],
+        )
+        self.assertEqual(index.find("sys-.*", "gcc", is_regex=True), ["sys-devel/gcc"])
+        self.assertEqual(index.find("media-*"), [])
+
 
 def test_main():
     suite = unittest.TestLoader()
     suite.loadTestsFromTestCase(TestFileOwner)
+    suite.loadTestsFromTestCase(TestNameIndex)
     unittest.TextTestRunner(verbosity=2).run(suite)
 
 
@@ -0,0 +1,106 @@
+import os
+import pickle
+import xml.etree.ElementTree as etree
+
+from pytest import MonkeyPatch
+
+from gentoolkit import metadata
+from gentoolkit.metadata import MetaDataCache
+
+METADATA_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE pkgmetadata SYSTEM "https://www.gentoo.org/dtd/metadata.dtd">
+<pkgmetadata>
+	<maintainer type="project">
+		<email>tools-portage@gentoo.org</email>
+		<name>Gentoo Portage Project</name>
+	</maintainer>
+	<longdescription>Tools for Gentoo</longdescription>
+	<stabilize-allarches/>
+	<use>
+		<flag name="gui">Build a <pkg>dev-qt/qtbase</pkg> frontend</flag>
+	</use>
+	<upstream>
+		<maintainer status="active"><email>dev@example.org</email></maintainer>
+		<bugs-to>mailto:bugs@example.org</bugs-to>
+		<remote-id type="github">gentoo/gentoolkit</remote-id>
+	</upstream>
+</pkgmetadata>
+"""
+
+
+def test_metadata_cache(monkeypatch: MonkeyPatch, tmp_path) -> None:
+    monkeypatch.setenv("GENTOOLKIT_CACHE_DIR", str(tmp_path / "cache"))
+    path = tmp_path / "metadata.xml"
+    path.write_text(METADATA_XML)
+    projects = str(tmp_path / "projects.xml")
+    parsed = []
+    parse = metadata.MetaData.parse.__func__
+
+    def counting_parse(cls, metadata_xml_path, projects_path):
+        parsed.append(metadata_xml_path)
+        return parse(cls, metadata_xml_path, projects_path)
+
+    monkeypatch.setattr(metadata.MetaData, "parse", classmethod(counting_parse))
+
+    cache = MetaDataCache.load()
+    assert cache.get(str(tmp_path / "missing.xml"), projects) is None
+    md = cache.get(str(path), projects)
+    assert [(x.email, x.name, x.maint_type) for x in md.maintainers()] == [
+        ("tools-portage@gentoo.org", "Gentoo Portage Project", "project")
+    ]
+    assert md.descriptions() == ("Tools for Gentoo",)
+    assert md.stabilize_allarches()
+    assert [(x.name, x.description) for x in md.use()] == [
+        ("gui", "Build a dev-qt/qtbase frontend")
+    ]
+    (upstream,) = md.upstream()
+    assert upstream.remoteids == (("gentoo/gentoolkit", "github"),)
+    assert md.format_maintainer_string() == "tools-portage@gentoo.org"
+    assert md.format_upstream_string() == "dev@example.org bugs@example.org"
+    assert md.herds() == ()
+    assert cache.save()
+
+    cache = MetaDataCache.load()
+    assert cache.get(str(path), projects).maintainers()[0].email == (
+        "tools-portage@gentoo.org"
+    )
+    assert parsed == [str(path)]
+
+    # A modified file is parsed again
+    path.write_text(METADATA_XML.replace("<stabilize-allarches/>", ""))
+    os.utime(path, ns=(1, 1))
+    assert not cache.get(str(path), projects).stabilize_allarches()
+    assert len(parsed) == 2
+
+    # So is every file after projects.xml changed, for the herd emails
+    cache = MetaDataCache.load()
+    (tmp_path / "projects.xml").write_text("<projects/>")
+    assert not cache.get(str(path), projects).stabilize_allarches()
+    assert len(parsed) == 3
+    assert cache.get(str(path), projects) is not None
+    assert len(parsed) == 3
+
+
+def test_metadata_is_compact(tmp_path) -> None:
+    path = tmp_path / "metadata.xml"
+    path.write_text(METADATA_XML)
+    md = metadata.MetaData.parse(str(path), str(tmp_path / "projects.xml"))
+    restored = pickle.loads(pickle.dumps(md))
+    assert restored.use()[0].name == "gui"
+    assert not hasattr(md, "__dict__")
+
+
+def test_parse_reads_once(monkeypatch: MonkeyPatch, tmp_path) -> None:
+    path = tmp_path / "metadata.xml"
+    path.write_text(METADATA_XML)
+    opened = []
+    parse = etree.parse
+
+    def counting_parse(source, *args, **kwargs):
+        opened.append(source)
+        return parse(source, *args, **kwargs)
+
+    monkeypatch.setattr(etree, "parse", counting_parse)
+    md = metadata.MetaData.parse(str(path), str(tmp_path / "projects.xml"))
+    assert md.stabilize_allarches()
+    assert len(opened) == 1
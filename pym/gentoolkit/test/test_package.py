@@ -0,0 +1,245 @@
+import gc
+import subprocess
+import sys
+import tracemalloc
+import weakref
+from types import SimpleNamespace
+
+import pytest
+from pytest import MonkeyPatch
+
+from gentoolkit import errors, package
+from gentoolkit.atom import Atom
+from gentoolkit.cpv import CPV
+from gentoolkit.package import Package, get_package, prefetch_environment
+
+
+class FakeDbapi:
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.calls = []
+
+    def aux_get(self, cpv, keys):
+        self.calls.append((cpv, tuple(keys)))
+        try:
+            return [self.metadata[cpv][key] for key in keys]
+        except KeyError:
+            raise KeyError(cpv)
+
+
+def test_prefetch_environment(monkeypatch: MonkeyPatch) -> None:
+    vardb = FakeDbapi({"app-misc/a-1": {"SLOT": "0", "KEYWORDS": "amd64"}})
+    portdb = FakeDbapi(
+        {
+            "app-misc/a-1": {"SLOT": "0", "KEYWORDS": "~amd64"},
+            "app-misc/b-1": {"SLOT": "1", "KEYWORDS": "~x86"},
+        }
+    )
+    fake_portage = SimpleNamespace(
+        root="/",
+        db={
+            "/": {
+                "vartree": SimpleNamespace(dbapi=vardb),
+                "porttree": SimpleNamespace(dbapi=portdb),
+            }
+        },
+    )
+    monkeypatch.setattr(package, "portage", fake_portage)
+    monkeypatch.setitem(package.ENVIRONMENT_CACHE_STATS, "hits", 0)
+    monkeypatch.setitem(package.ENVIRONMENT_CACHE_STATS, "misses", 0)
+
+    a, b, c = Package("app-misc/a-1"), Package("app-misc/b-1"), Package("app-misc/c-1")
+    prefetch_environment([a, b, c], ("SLOT", "KEYWORDS"))
+    # One pass per db, only with the packages the first one did not have
+    assert vardb.calls == [(x, ("SLOT", "KEYWORDS")) for x in (a.cpv, b.cpv, c.cpv)]
+    assert portdb.calls == [(x, ("SLOT", "KEYWORDS")) for x in (b.cpv, c.cpv)]
+
+    assert a.environment("KEYWORDS") == "amd64"
+    assert b.environment(("SLOT", "KEYWORDS")) == ["1", "~x86"]
+    assert package.ENVIRONMENT_CACHE_STATS == {"hits": 2, "misses": 0}
+    assert len(vardb.calls) + len(portdb.calls) == 5
+
+    # Other db preferences are cached separately
+    assert a.environment("KEYWORDS", prefer_vdb=False) == "~amd64"
+    assert a.environment("KEYWORDS", prefer_vdb=False) == "~amd64"
+    assert package.ENVIRONMENT_CACHE_STATS == {"hits": 3, "misses": 1}
+
+    # Unknown packages still fail as usual
+    with pytest.raises(errors.GentoolkitFatalError):
+        c.environment("SLOT")
+
+
+def test_settings_are_lazy() -> None:
+    # A fresh interpreter, since other tests may already have built them
+    code = (
+        "import gentoolkit.package as p\n"
+        "assert p._portage_configs == {}\n"
+        "p.Package('app-misc/a-1')\n"
+        "assert p._portage_configs == {}\n"
+        "assert p.default_settings is p.get_settings()\n"
+        "assert list(p._portage_configs) == [True]\n"
+        "assert p.nolocal_settings is p.get_settings(local_config=False)\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_import_time(record_property) -> None:
+    # Times equery --help and a simple query in a fresh interpreter, and
+    # what building the configs at import time used to add to them
+    code = (
+        "import contextlib, io, time\n"
+        "start = time.perf_counter()\n"
+        "import gentoolkit.package as p\n"
+        "from gentoolkit import equery\n"
+        "from gentoolkit.query import Query\n"
+        "with contextlib.redirect_stdout(io.StringIO()):\n"
+        "    try:\n"
+        "        equery.main(['equery', '--help'])\n"
+        "    except SystemExit:\n"
+        "        pass\n"
+        "Query('app-misc/a').find_installed()\n"
+        "end = time.perf_counter()\n"
+        "assert p._portage_configs == {}\n"
+        "p.get_settings()\n"
+        "p.get_settings(local_config=False)\n"
+        "print(end - start, time.perf_counter() - end)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    )
+    run_time, config_time = map(float, result.stdout.split()[-2:])
+    record_property("equery_help_and_query_seconds", run_time)
+    record_property("saved_config_seconds", config_time)
+    assert config_time > 0
+
+
+def test_package_state() -> None:
+    cpv = CPV("app-misc/foo-1.0-r1")
+    assert cpv.cp == "app-misc/foo"
+    pkg = Package(cpv)
+    assert (pkg.category, pkg.name, pkg.fullversion) == ("app-misc", "foo", "1.0-r1")
+    # Everything lives in slots
+    assert not hasattr(cpv, "__dict__")
+    assert not hasattr(pkg, "__dict__")
+    assert Package(Atom(">=app-misc/foo-1.0-r1")).cpv == "app-misc/foo-1.0-r1"
+    assert pkg._environment is None
+    assert pkg._environment_cache((True, True)) == {}
+    assert pkg._environment == {(True, True): {}}
+
+
+def test_get_package() -> None:
+    pkg = get_package("app-misc/foo-1.0")
+    assert isinstance(pkg, Package)
+    assert get_package("app-misc/foo-1.0") is pkg
+    assert get_package(CPV("app-misc/foo-1.0")) is pkg
+    assert get_package("app-misc/foo-1.0", local_config=False) is not pkg
+    assert get_package("app-misc/foo-2.0") is not pkg
+    # Only packages still referenced are kept
+    del pkg
+    gc.collect()
+    assert ("app-misc/foo-1.0", True) not in package._package_pool
+
+
+def test_package_memory() -> None:
+    cpvs = [f"app-misc/foo{i}-{i % 7}.{i}" for i in range(5000)]
+    # Fill the split cache, its tuples are shared by all objects of a cpv
+    for cpv in cpvs:
+        CPV(cpv).fullversion
+    gc.collect()
+
+    tracemalloc.start()
+    try:
+        pkgs = [Package(cpv) for cpv in cpvs]
+        for pkg in pkgs:
+            pkg.fullversion
+        used, _peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # A package allocates nothing but itself and its list entry
+    assert used / len(pkgs) <= sys.getsizeof(pkgs[0]) + 16
+
+    pooled = [get_package(cpv) for cpv in cpvs]
+    tracemalloc.start()
+    try:
+        refs = [get_package(cpv) for _n in range(4) for cpv in cpvs]
+        used, _peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # Bulk lookups of live packages only cost the references to them
+    assert all(x is y for x, y in zip(refs, pooled * 4))
+    assert used / len(refs) <= 16
+
+
+class FakeSettings:
+    def __init__(self):
+        self.locked = True
+
+    def unlock(self):
+        self.locked = False
+
+
+def test_mask_status_cache(monkeypatch: MonkeyPatch) -> None:
+    status_calls = []
+    reason_calls = []
+    tree = {
+        "app-misc/a-1": ["package.mask"],
+        "app-misc/a-2": ["~amd64 keyword"],
+        "app-misc/b-1": [],
+    }
+
+    def getmaskingstatus(cpv, settings, portdb):
+        status_calls.append(cpv)
+        assert not settings.locked
+        return list(tree[cpv])
+
+    def getmaskingreason(cpv, settings, portdb, return_location):
+        reason_calls.append(cpv)
+        if cpv not in tree:
+            raise KeyError(cpv)
+        if "package.mask" not in tree[cpv]:
+            return None
+        return ("# broken\n", "/profiles/package.mask")
+
+    fake_portage = SimpleNamespace(
+        root="/",
+        db={"/": {"porttree": SimpleNamespace(dbapi=None)}},
+        getmaskingstatus=getmaskingstatus,
+        getmaskingreason=getmaskingreason,
+    )
+    monkeypatch.setattr(package, "portage", fake_portage)
+    monkeypatch.setattr(package, "_mask_status_cache", weakref.WeakKeyDictionary())
+    monkeypatch.setattr(package, "_mask_reason_cache", weakref.WeakKeyDictionary())
+    settings = FakeSettings()
+    monkeypatch.setattr(package, "_portage_configs", {True: settings})
+
+    assert package.get_mask_status("app-misc/a-2") == ["~amd64 keyword"]
+    assert package.get_mask_status("app-misc/a-2") == ["~amd64 keyword"]
+    assert package.get_mask_status("app-misc/c-1") is None
+    assert package.get_mask_status("app-misc/c-1") is None
+    assert status_calls == ["app-misc/a-2", "app-misc/c-1"]
+
+    pkg = Package("app-misc/a-1")
+    status = pkg.mask_status()
+    assert status == ["package.mask"]
+    # Callers get their own list
+    status.append("profile")
+    assert Package("app-misc/a-1").mask_status() == ["package.mask"]
+    assert Package("app-misc/b-1").mask_status() == []
+    assert Package("app-misc/b-1").mask_status() == []
+    assert len(status_calls) == 4
+
+    # Other settings are cached separately, and dropped along with them
+    other = FakeSettings()
+    assert package.get_mask_status("app-misc/a-1", other) == ["package.mask"]
+    assert len(status_calls) == 5
+    del other
+    gc.collect()
+    assert list(package._mask_status_cache) == [settings]
+
+    assert pkg.mask_reason() == ("# broken\n", "/profiles/package.mask")
+    assert pkg.mask_reason() == ("# broken\n", "/profiles/package.mask")
+    assert Package("app-misc/b-1").mask_reason() == ()
+    assert Package("app-misc/b-1").mask_reason() == ()
+    assert Package("app-misc/c-1").mask_reason() is None
+    assert Package("app-misc/c-1").mask_reason() is None
+    assert reason_calls == ["app-misc/a-1", "app-misc/b-1", "app-misc/c-1"]
@@ -1,12 +1,52 @@
 import unittest
+from types import SimpleNamespace
+from unittest import mock
 
 from gentoolkit import query
 from gentoolkit import errors
+from gentoolkit import helpers
+
+
+class FakeDbapi:
+    def __init__(self, cpvs):
+        self.cpvs = cpvs
+        self.listed = []
+
+    def cp_all(self):
+        return sorted({x.rsplit("-", 1)[0] for x in self.cpvs})
+
+    def cp_list(self, cp):
+        self.listed.append(cp)
+        return [x for x in self.cpvs if x.rsplit("-", 1)[0] == cp]
 
 
 class TestQuery(unittest.TestCase):
     def setUp(self):
-        pass
+        self.porttree = FakeDbapi(
+            [
+                "dev-lang/python-3.12",
+                "dev-python/pip-24",
+                "dev-python/python-dateutil-2.9",
+                "sys-apps/portage-3",
+                "sys-apps/pciutils-3",
+            ]
+        )
+        self.vartree = FakeDbapi(["dev-python/pip-23", "sys-apps/portage-3"])
+        self.fake_portage = SimpleNamespace(
+            root="/",
+            db={
+                "/": {
+                    "porttree": SimpleNamespace(dbapi=self.porttree),
+                    "vartree": SimpleNamespace(dbapi=self.vartree),
+                }
+            },
+        )
+        for patcher in (
+            mock.patch.object(helpers, "portage", self.fake_portage),
+            mock.patch.object(helpers, "_name_indexes", {}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
 
     def tearDown(self):
         pass
@@ -87,6 +127,58 @@ class TestQuery(unittest.TestCase):
         for gt in globbing_tests:
             self.assertTrue(query.Query(gt[0]).uses_globbing() == gt[1])
 
+    def test_complex_lookup(self):
+        porttree, vartree = self.porttree, self.vartree
+        # (query, matches, packages whose versions get listed)
+        tests = [
+            (
+                "dev-*/*python*",
+                ["dev-lang/python-3.12", "dev-python/python-dateutil-2.9"],
+                {"dev-lang/python", "dev-python/pip", "dev-python/python-dateutil"},
+            ),
+            ("sys-apps/port*", ["sys-apps/portage-3"], {"sys-apps/portage"}),
+            (
+                "pip-2*",
+                ["dev-python/pip-23", "dev-python/pip-24"],
+                {"dev-python/pip"},
+            ),
+            (
+                "*-3*",
+                ["dev-lang/python-3.12", "sys-apps/pciutils-3", "sys-apps/portage-3"],
+                set(porttree.cp_all()),
+            ),
+        ]
+        for pattern, expected, listed in tests:
+            porttree.listed, vartree.listed = [], []
+            helpers._name_indexes.clear()
+            matches = query.Query(pattern).smart_find(show_progress=False)
+            self.assertEqual(sorted(x.cpv for x in matches), expected)
+            self.assertEqual(set(porttree.listed + vartree.listed), listed)
+
+    def test_iter_find(self):
+        matches = query.Query("*").iter_find(show_progress=False)
+        self.assertEqual(next(matches).cpv, "dev-lang/python-3.12")
+        # Nothing past the first package was read yet
+        self.assertEqual(self.porttree.listed, ["dev-lang/python"])
+        self.assertEqual(
+            [x.cpv for x in matches],
+            [
+                "dev-python/pip-23",
+                "dev-python/pip-24",
+                "dev-python/python-dateutil-2.9",
+                "sys-apps/pciutils-3",
+                "sys-apps/portage-3",
+            ],
+        )
+
+        matches = query.Query("sys-apps/*").iter_find(
+            in_installed=False, show_progress=False
+        )
+        self.assertEqual([x.cpv for x in matches], ["sys-apps/pciutils-3"])
+
+        matches = query.Query("media-*").iter_find(show_progress=False)
+        self.assertRaises(errors.GentoolkitNoMatches, list, matches)
+
 
 def test_main():
     suite = unittest.TestLoader().loadTestsFromTestCase(TestQuery)
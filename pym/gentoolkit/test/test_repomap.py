@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+
+from pytest import MonkeyPatch
+
+from gentoolkit import query, repomap
+from gentoolkit.package import Package, PackageFormatter
+
+
+class FakeCPV(str):
+    repo = None
+
+
+class FakeDbapi:
+    def __init__(self, cpvs, repos=None):
+        # [(cpv, repository)], in ascending repository priority
+        self.cpvs = cpvs
+        self.repos = repos or {}
+        self.listed = []
+
+    def cp_list(self, cp):
+        self.listed.append(cp)
+        result = []
+        for cpv, repo in self.cpvs:
+            if cpv.rsplit("-", 1)[0] == cp:
+                result.append(FakeCPV(cpv))
+                result[-1].repo = repo
+        return result
+
+    def aux_get(self, cpv, keys):
+        assert keys == ["repository"]
+        return [dict(self.cpvs)[cpv]]
+
+    def getRepositoryPath(self, repo):
+        return self.repos.get(repo)
+
+
+def fake_portage(monkeypatch: MonkeyPatch):
+    vardb = FakeDbapi([("app-misc/a-1", "gentoo"), ("app-misc/b-1", "")])
+    portdb = FakeDbapi(
+        [
+            ("app-misc/a-1", "gentoo"),
+            ("app-misc/a-2", "gentoo"),
+            ("app-misc/a-2", "local"),
+            ("app-misc/c-1", "local"),
+        ],
+        {"gentoo": "/var/db/repos/gentoo", "local": "/var/db/repos/local"},
+    )
+    fake = SimpleNamespace(
+        root="/",
+        db={
+            "/": {
+                "vartree": SimpleNamespace(dbapi=vardb),
+                "porttree": SimpleNamespace(dbapi=portdb),
+            }
+        },
+        settings={"PORTDIR": "/var/db/repos/gentoo"},
+    )
+    monkeypatch.setattr(repomap, "portage", fake)
+    monkeypatch.setattr(repomap, "_repository_map", None)
+    return vardb, portdb
+
+
+def test_repository_map(monkeypatch: MonkeyPatch) -> None:
+    vardb, portdb = fake_portage(monkeypatch)
+    repos = repomap.get_repository_map()
+    assert repomap.get_repository_map() is repos
+
+    repos.update(["app-misc/a-1", Package("app-misc/a-2"), "app-misc/b-1"])
+    assert repos.is_installed("app-misc/a-1")
+    assert not repos.is_installed(Package("app-misc/a-2"))
+    # The highest priority repository wins, like findname2
+    assert repos.repo_name("app-misc/a-2") == "local"
+    assert repos.is_overlay("app-misc/a-2")
+    assert not repos.is_overlay("app-misc/a-1")
+    # Installed packages keep the repository they were installed from,
+    # even if the vdb does not record one
+    assert repos.repo_name("app-misc/a-1") == "gentoo"
+    assert repos.repo_name("app-misc/b-1") == ""
+    assert repos.is_overlay("app-misc/b-1") is None
+    # Unknown packages
+    assert repos.repo_name("app-misc/d-1") is None
+    # Every cat/pkg is only listed once
+    assert vardb.listed == portdb.listed == ["app-misc/a", "app-misc/b", "app-misc/d"]
+
+
+def test_location_and_repo_filter(monkeypatch: MonkeyPatch) -> None:
+    vardb, portdb = fake_portage(monkeypatch)
+
+    def fail(self):
+        raise AssertionError("looked up %s on disk" % self.cpv)
+
+    monkeypatch.setattr(Package, "is_installed", fail)
+    monkeypatch.setattr(Package, "is_overlay", fail)
+    monkeypatch.setattr(Package, "repo_name", fail)
+
+    pkgs = [Package(x) for x in ("app-misc/a-1", "app-misc/a-2", "app-misc/c-1")]
+    locations = [
+        PackageFormatter(x, do_format=False).format_package_location() for x in pkgs
+    ]
+    assert locations == ["IP-", "--O", "--O"]
+
+    local = query.Query("app-misc/a::local")
+    assert local._filter_by_repository(pkgs) == pkgs[1:]
+    assert query.Query("app-misc/a::gentoo")._filter_by_repository(pkgs) == pkgs[:1]
+    assert vardb.listed == portdb.listed == ["app-misc/a", "app-misc/c"]
@@ -0,0 +1,78 @@
+import os
+from types import SimpleNamespace
+
+from pytest import MonkeyPatch
+
+from gentoolkit import cache, usedesc
+from gentoolkit.metadata import MetaData, UseFlag
+from gentoolkit.usedesc import UseDescIndex
+
+
+def write(path, text, mtime_ns):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_global_descriptions(monkeypatch: MonkeyPatch, tmp_path) -> None:
+    monkeypatch.setenv("GENTOOLKIT_CACHE_DIR", str(tmp_path / "cache"))
+    repo = tmp_path / "repo"
+    write(repo / "profiles/use.desc", "# comment\nssl - Add SSL support\n", 10)
+    write(
+        repo / "profiles/desc/python_targets.desc", "python3_12 - Build for 3.12\n", 10
+    )
+    parsed = []
+    parse_use_desc = usedesc.parse_use_desc
+
+    def counting_parse(repo_path):
+        parsed.append(repo_path)
+        return parse_use_desc(repo_path)
+
+    monkeypatch.setattr(usedesc, "parse_use_desc", counting_parse)
+    expected = {"ssl": "Add SSL support", "python_targets_python3_12": "Build for 3.12"}
+
+    index = UseDescIndex.load()
+    assert index.global_descriptions(str(repo)) == expected
+    assert index.save()
+    assert not index.save()
+
+    index = UseDescIndex.load()
+    assert index.global_descriptions(str(repo)) == expected
+    assert parsed == [str(repo)]
+
+    # A new USE_EXPAND file invalidates the cached descriptions
+    write(repo / "profiles/desc/cpu_flags_x86.desc", "sse2 - Use SSE2\n", 10)
+    descriptions = index.global_descriptions(str(repo))
+    assert descriptions["cpu_flags_x86_sse2"] == "Use SSE2"
+    assert len(parsed) == 2
+
+    # So does a changed use.desc
+    write(repo / "profiles/use.desc", "ssl - Add TLS support\n", 20)
+    assert index.global_descriptions(str(repo))["ssl"] == "Add TLS support"
+    assert len(parsed) == 3
+
+
+def test_local_descriptions() -> None:
+    metadata = MetaData(
+        "metadata.xml",
+        useflags=(
+            UseFlag("gui", None, "Build a GUI"),
+            UseFlag("gui", None, "Duplicate"),
+            UseFlag("qt", ">=foo-2", "Use Qt"),
+        ),
+    )
+    assert UseDescIndex.local_descriptions(SimpleNamespace(metadata=metadata)) == {
+        "gui": ("Build a GUI", ""),
+        "qt": ("Use Qt", ">=foo-2"),
+    }
+    assert UseDescIndex.local_descriptions(SimpleNamespace(metadata=None)) == {}
+
+
+def test_old_layout_ignored(monkeypatch: MonkeyPatch, tmp_path) -> None:
+    monkeypatch.setenv("GENTOOLKIT_CACHE_DIR", str(tmp_path / "cache"))
+    # Written before local descriptions moved to the metadata cache
+    monkeypatch.setattr(cache, "CACHE_VERSION", 1)
+    cache.write_cache(UseDescIndex.cache_name, {"repos": {}, "local": {}})
+    monkeypatch.undo()
+    monkeypatch.setenv("GENTOOLKIT_CACHE_DIR", str(tmp_path / "cache"))
+    assert UseDescIndex.load().repos == {}
@@ -0,0 +1,116 @@
+import os
+from types import SimpleNamespace
+
+from pytest import MonkeyPatch
+
+from gentoolkit import useindex
+from gentoolkit.useindex import UseIndex
+
+
+class FakeDbapi:
+    def __init__(self, iuse):
+        self.iuse = iuse
+        self.fetched = []
+
+    def cpv_all(self):
+        return list(self.iuse)
+
+    def cp_all(self, categories=None):
+        return sorted(
+            {
+                cpv.rsplit("-", 1)[0]
+                for cpv in self.iuse
+                if categories is None or cpv.split("/")[0] in categories
+            }
+        )
+
+    def cp_list(self, cp):
+        # Like portdbapi, versions in several repositories are listed twice
+        cpvs = [cpv for cpv in self.iuse if cpv.rsplit("-", 1)[0] == cp]
+        return cpvs + cpvs
+
+    def aux_get(self, cpv, keys):
+        assert keys == ["IUSE"]
+        self.fetched.append(cpv)
+        if cpv not in self.iuse:
+            raise KeyError(cpv)
+        return [self.iuse[cpv]]
+
+
+def test_use_index(monkeypatch: MonkeyPatch, tmp_path) -> None:
+    monkeypatch.setenv("GENTOOLKIT_CACHE_DIR", str(tmp_path / "cache"))
+    repo = tmp_path / "repo"
+    for category in ("app-misc", "dev-libs"):
+        (repo / "metadata" / "md5-cache" / category).mkdir(parents=True)
+
+    vardb = FakeDbapi({"app-misc/a-1": "+ssl doc", "dev-libs/c-1": "ssl"})
+    portdb = FakeDbapi(
+        {
+            "app-misc/a-1": "ssl",
+            "app-misc/a-2": "-ssl doc",
+            "app-misc/b-1": "gtk",
+            "dev-libs/c-1": "-ssl",
+        }
+    )
+    portdb.porttrees = [str(repo)]
+    portdb.depcachedir = str(tmp_path / "dep")
+    portdb.settings = SimpleNamespace(categories=("app-misc", "dev-libs"))
+    fake = SimpleNamespace(
+        root="/",
+        db={
+            "/": {
+                "vartree": SimpleNamespace(dbapi=vardb),
+                "porttree": SimpleNamespace(dbapi=portdb),
+            }
+        },
+    )
+    state = [(1, 1)]
+    monkeypatch.setattr(useindex, "portage", fake)
+    monkeypatch.setattr(useindex, "vdb_state", lambda: state[0])
+
+    index = UseIndex.load()
+    assert index.packages("ssl") == {"app-misc/a-1": "+", "dev-libs/c-1": ""}
+    # Nothing is known about the ebuilds until asked for
+    assert index.packages("gtk", ebuilds=True) == {}
+    assert portdb.fetched == []
+
+    index = UseIndex.load(ebuilds=True)
+    assert sorted(portdb.fetched) == sorted(portdb.iuse)
+    assert index.packages("ssl", ebuilds=True) == {
+        "app-misc/a-1": "+",
+        "app-misc/a-2": "-",
+        "dev-libs/c-1": "",
+    }
+    assert index.packages("ssl", installed=False, ebuilds=True) == {"app-misc/a-2": "-"}
+    assert index.packages("doc", ebuilds=True) == {
+        "app-misc/a-1": "",
+        "app-misc/a-2": "",
+    }
+    assert index.packages("gtk") == {}
+    assert index.packages("nonexistent", ebuilds=True) == {}
+
+    # Nothing is read again while the caches are unchanged
+    del vardb.fetched[:], portdb.fetched[:]
+    index = UseIndex.load(ebuilds=True)
+    assert vardb.fetched == portdb.fetched == []
+    assert not index.save()
+
+    # Only the category whose metadata cache changed is read again
+    portdb.iuse["app-misc/b-1"] = "gtk qt5"
+    cache_dir = repo / "metadata" / "md5-cache" / "app-misc"
+    st = os.stat(cache_dir)
+    os.utime(cache_dir, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    index = UseIndex.load(ebuilds=True)
+    assert sorted(portdb.fetched) == ["app-misc/a-1", "app-misc/a-2", "app-misc/b-1"]
+    assert index.packages("qt5", ebuilds=True) == {"app-misc/b-1": ""}
+
+    # Merging or unmerging reindexes the installed packages
+    del vardb.iuse["dev-libs/c-1"]
+    state[0] = (2, 1)
+    index = UseIndex.load()
+    assert index.packages("ssl") == {"app-misc/a-1": "+"}
+    assert index.packages("ssl", ebuilds=True) == {
+        "app-misc/a-1": "+",
+        "app-misc/a-2": "-",
+        "dev-libs/c-1": "-",
+    }
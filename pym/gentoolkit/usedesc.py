@@ -0,0 +1,208 @@
+# Copyright(c) 2026, Gentoo Authors
+#
+# Licensed under the GNU General Public License, v2
+
+"""Provides a persistent index of USE flag descriptions.
+
+Global descriptions come from profiles/use.desc and the USE_EXPAND ones from
+profiles/desc/*.desc of a repository. L{UseDescIndex} keeps them parsed in
+gentoolkit's cache directory and only parses the files again when their mtime
+or size changed. Local descriptions come from the metadata.xml of a package,
+which is cached by L{gentoolkit.metadata.MetaDataCache}.
+
+Example usage:
+    >>> from gentoolkit.usedesc import UseDescIndex
+    >>> index = UseDescIndex.load()
+    >>> index.global_descriptions()['ssl']
+    'Add support for SSL/TLS connections (Secure Socket Layer / Transport Layer Security)'
+    >>> index.save()
+    True
+"""
+
+__all__ = ("UseDescIndex", "parse_use_desc")
+__docformat__ = "epytext"
+
+# =======
+# Imports
+# =======
+
+import os
+import sys
+from glob import glob
+
+import portage
+from portage import _encodings, _unicode_encode
+
+import gentoolkit.pprinter as pp
+from gentoolkit.cache import read_cache, write_cache
+
+# =======
+# Classes
+# =======
+
+
+class UseDescIndex:
+    """Parsed USE flag descriptions, validated by file mtime and size.
+
+    @type repos: dict
+    @ivar repos: {repo path: (stamp, {flag: description})}
+    """
+
+    cache_name = "use-desc"
+
+    def __init__(self, repos=None):
+        self.repos = repos if repos is not None else {}
+        self.changed = False
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {len(self.repos)} repos>"
+
+    @classmethod
+    def load(cls):
+        """Return the stored index, or an empty one.
+
+        @rtype: L{UseDescIndex}
+        """
+
+        cached = read_cache(cls.cache_name)
+        if cached is None:
+            return cls()
+        return cls(cached)
+
+    def save(self):
+        """Store the index in the cache directory if anything was parsed.
+
+        @rtype: bool
+        @return: True if the index was written
+        """
+
+        if not self.changed:
+            return False
+        if write_cache(self.cache_name, self.repos):
+            self.changed = False
+            return True
+        return False
+
+    def global_descriptions(self, repo_path=None):
+        """Return the global and USE_EXPAND flag descriptions of a repository.
+
+        @type repo_path: str
+        @param repo_path: repository location, defaults to PORTDIR
+        @rtype: dict
+        @return: {'flag_name': 'flag description', ...}
+        """
+
+        if repo_path is None:
+            repo_path = portage.settings["PORTDIR"]
+        stamp = _stamp(_desc_files(repo_path))
+        cached = self.repos.get(repo_path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        descriptions, complete = parse_use_desc(repo_path)
+        # Keep warning about missing files instead of caching their absence
+        if complete:
+            self.repos[repo_path] = (stamp, descriptions)
+            self.changed = True
+        return descriptions
+
+    @staticmethod
+    def local_descriptions(pkg):
+        """Return the local flag descriptions from a package's metadata.xml.
+
+        @type pkg: L{gentoolkit.package.Package}
+        @rtype: dict
+        @return: {'flag_name': ('flag description', 'restrict atom'), ...}
+        """
+
+        descriptions = {}
+        metadata = pkg.metadata
+        if metadata is not None:
+            for use in metadata.use():
+                restrict = use.restrict if use.restrict is not None else ""
+                descriptions.setdefault(use.name, (use.description, restrict))
+        return descriptions
+
+
+# =========
+# Functions
+# =========
+
+
+def parse_use_desc(repo_path):
+    """Parse profiles/use.desc and profiles/desc/*.desc of a repository.
+
+    @type repo_path: str
+    @param repo_path: repository location
+    @rtype: tuple
+    @return: ({'flag_name': 'flag description', ...}, all files were read)
+    """
+
+    global_usedesc = {}
+    complete = True
+    # Get global USE flag descriptions
+    path = os.path.join(repo_path, "profiles", "use.desc")
+    try:
+        with open(
+            _unicode_encode(path, encoding=_encodings["fs"]),
+            encoding=_encodings["content"],
+        ) as open_file:
+            for line in open_file:
+                if line.startswith("#"):
+                    continue
+                # Ex. of fields: ['syslog', 'Enables support for syslog\n']
+                fields = line.split(" - ", 1)
+                if len(fields) == 2:
+                    global_usedesc[fields[0]] = fields[1].rstrip()
+    except OSError:
+        complete = False
+        sys.stderr.write(
+            pp.warn("Could not load USE flag descriptions from %s" % pp.path(path))
+        )
+
+    # Add USE_EXPANDED variables to usedesc hash -- Bug #238005
+    for path in _desc_files(repo_path)[1:]:
+        try:
+            with open(
+                _unicode_encode(path, encoding=_encodings["fs"]),
+                encoding=_encodings["content"],
+            ) as open_file:
+                for line in open_file:
+                    if line.startswith("#"):
+                        continue
+                    fields = [field.strip() for field in line.split(" - ", 1)]
+                    if len(fields) == 2:
+                        expanded_useflag = "{}_{}".format(
+                            path.split("/")[-1][0:-5],
+                            fields[0],
+                        )
+                        global_usedesc[expanded_useflag] = fields[1]
+        except OSError:
+            complete = False
+            sys.stderr.write(
+                pp.warn("Could not load USE flag descriptions from %s" % path)
+            )
+
+    return global_usedesc, complete
+
+
+def _desc_files(repo_path):
+    profiles = os.path.join(repo_path, "profiles")
+    return [os.path.join(profiles, "use.desc")] + sorted(
+        glob(os.path.join(profiles, "desc", "*.desc"))
+    )
+
+
+def _stamp(paths):
+    stamp = []
+    for path in paths:
+        try:
+            st = os.stat(_unicode_encode(path, encoding=_encodings["fs"]))
+        except OSError:
+            stamp.append((path, None, None))
+        else:
+            stamp.append((path, st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+
+# vim: set ts=4 sw=4 tw=79:
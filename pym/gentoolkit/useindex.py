@@ -0,0 +1,202 @@
+# Copyright(c) 2026, Gentoo Authors
+#
+# Licensed under the GNU General Public License, v2
+
+"""Provides a persistent index of which packages have which USE flag.
+
+Finding every package with a USE flag normally means fetching the IUSE of
+every package in the tree. L{UseIndex} inverts IUSE into {flag: packages}
+once, stores it in gentoolkit's cache directory and afterwards only reads
+the IUSE of a category again when its metadata cache changed, or of the
+installed packages when anything was merged or unmerged.
+
+Example usage:
+    >>> from gentoolkit.useindex import UseIndex
+    >>> index = UseIndex.load(ebuilds=True)
+    >>> index.packages('ipc', installed=True, ebuilds=False)
+    {'sys-apps/portage-3.0.66.1': '+'}
+"""
+
+__all__ = ("UseIndex",)
+__docformat__ = "epytext"
+
+# =======
+# Imports
+# =======
+
+import portage
+
+from gentoolkit.cache import category_stamp, read_cache, write_cache, vdb_state
+
+# =======
+# Classes
+# =======
+
+
+class UseIndex:
+    """Maps USE flags to the packages having them in IUSE.
+
+    The ebuild side follows L{gentoolkit.package.Package.environment}: for
+    a version available in several repositories the IUSE of the ebuild
+    portage would pick is used, and installed packages are looked up in the
+    vdb.
+
+    @type installed: dict
+    @ivar installed: {'state': L{gentoolkit.cache.vdb_state},
+            'cpvs': set of installed cpvs, 'flags': {flag: {cpv: marker}}}
+    @type ebuilds: dict
+    @ivar ebuilds: {category: (stamp, {flag: {cpv: marker}})} for all
+            versions in the Portage tree and overlays, with stamp being the
+            mtimes of the category's metadata cache and ebuild directories
+    """
+
+    cache_name = "use-index"
+
+    def __init__(self, installed=None, ebuilds=None):
+        if installed is None:
+            installed = {"state": None, "cpvs": set(), "flags": {}}
+        self.installed = installed
+        self.ebuilds = ebuilds if ebuilds is not None else {}
+        self.changed = False
+
+    def __repr__(self):
+        return "<{} {} installed, {} categories>".format(
+            self.__class__.__name__, len(self.installed["cpvs"]), len(self.ebuilds)
+        )
+
+    @classmethod
+    def load(cls, ebuilds=False, save=True):
+        """Return an index that is up to date for the installed packages.
+
+        @type ebuilds: bool
+        @param ebuilds: bring the ebuild side up to date as well
+        @type save: bool
+        @param save: write the index back if it had to be updated
+        @rtype: L{UseIndex}
+        """
+
+        cached = read_cache(cls.cache_name)
+        if cached is None:
+            index = cls()
+        else:
+            index = cls(cached["installed"], cached["ebuilds"])
+        index.update_installed()
+        if ebuilds:
+            index.update_ebuilds()
+        if save:
+            index.save()
+        return index
+
+    def save(self):
+        """Store the index in the cache directory if anything was updated.
+
+        @rtype: bool
+        @return: True if the index was written
+        """
+
+        if not self.changed:
+            return False
+        if write_cache(
+            self.cache_name, {"installed": self.installed, "ebuilds": self.ebuilds}
+        ):
+            self.changed = False
+            return True
+        return False
+
+    def update_installed(self):
+        """Index the installed packages again if the vdb changed.
+
+        @rtype: bool
+        @return: True if anything changed
+        """
+
+        state = vdb_state()
+        if self.installed["state"] == state:
+            return False
+
+        vardb = portage.db[portage.root]["vartree"].dbapi
+        cpvs = {str(cpv) for cpv in vardb.cpv_all()}
+        flags = {}
+        for cpv in cpvs:
+            _add_iuse(flags, cpv, vardb)
+        self.installed = {"state": state, "cpvs": cpvs, "flags": flags}
+        self.changed = True
+        return True
+
+    def update_ebuilds(self):
+        """Index the categories whose metadata cache changed again.
+
+        @rtype: bool
+        @return: True if anything changed
+        """
+
+        portdb = portage.db[portage.root]["porttree"].dbapi
+        changed = False
+
+        categories = set(portdb.settings.categories)
+        for category in set(self.ebuilds).difference(categories):
+            del self.ebuilds[category]
+            changed = True
+
+        for category in sorted(categories):
+            stamp = category_stamp(portdb, category)
+            known = self.ebuilds.get(category)
+            if known is not None and known[0] == stamp:
+                continue
+            flags = {}
+            for cp in portdb.cp_all(categories=(category,)):
+                # Versions in several repositories are listed once for each
+                for cpv in dict.fromkeys(str(x) for x in portdb.cp_list(cp)):
+                    _add_iuse(flags, cpv, portdb)
+            self.ebuilds[category] = (stamp, flags)
+            changed = True
+
+        if changed:
+            self.changed = True
+        return changed
+
+    def packages(self, flag, installed=True, ebuilds=False):
+        """Return the packages having flag in IUSE.
+
+        @type flag: str
+        @param flag: USE flag name without default marker
+        @type installed: bool
+        @param installed: include installed packages
+        @type ebuilds: bool
+        @param ebuilds: include packages in the Portage tree and overlays,
+                installed versions are only included if installed is set
+        @rtype: dict
+        @return: {cpv: '+', '-' or '' as the IUSE default of flag}
+        """
+
+        result = {}
+        if ebuilds:
+            installed_cpvs = self.installed["cpvs"]
+            for _stamp, flags in self.ebuilds.values():
+                for cpv, marker in flags.get(flag, {}).items():
+                    if cpv not in installed_cpvs:
+                        result[cpv] = marker
+        if installed:
+            result.update(self.installed["flags"].get(flag, {}))
+        return result
+
+
+# =========
+# Functions
+# =========
+
+
+def _add_iuse(flags, cpv, dbapi):
+    try:
+        iuse = dbapi.aux_get(cpv, ["IUSE"])[0].split()
+    except KeyError:
+        # Broken or vanished package, like a failed Package.environment
+        return
+    for token in iuse:
+        if token[:1] in ("+", "-"):
+            flags.setdefault(token[1:], {})[cpv] = token[0]
+        else:
+            flags.setdefault(token, {})[cpv] = ""
+
+
+# vim: set ts=4 sw=4 tw=79:
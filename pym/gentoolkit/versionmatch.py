@@ -15,7 +15,7 @@
 from portage.versions import vercmp
 
 from gentoolkit import errors
-from gentoolkit.cpv import CPV
+from gentoolkit.cpv import BaseCPV
 
 # =======
 # Classes
@@ -42,7 +42,7 @@ class VersionMatch:
         @keyword op: operator
         """
 
-        if not isinstance(cpv, (CPV, self.__class__)):
+        if not isinstance(cpv, (BaseCPV, self.__class__)):
             err = "cpv must be a gentoolkit.cpv.CPV "
             err += "or gentoolkit.versionmatch.VersionMatch instance"
             raise ValueError(err)